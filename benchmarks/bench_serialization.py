@@ -0,0 +1,65 @@
+# benchmarks/bench_serialization.py
+
+# Serializing users the way marshal_with(user, as_list=True) and flask-restx's
+# output_json do, versus the precompiled serializer plus fast JSON encoding
+# used by the users views. No database is needed.
+#
+#   python benchmarks/bench_serialization.py --sizes 10,1000,100000
+
+import argparse
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+os.environ.setdefault("APP_SETTINGS", "src.config.BaseConfig")
+
+from common import timed  # noqa: E402
+from flask_restx import marshal  # noqa: E402
+from flask_restx.representations import output_json  # noqa: E402
+
+from src import create_app  # noqa: E402
+from src.api.users import serializers  # noqa: E402
+from src.api.users.views import serialize_user, user  # noqa: E402
+
+
+def rows(count):
+    start = datetime(2021, 1, 1)
+    return [
+        SimpleNamespace(
+            id=i,
+            username=f"user{i}",
+            email=f"user{i}@example.com",
+            active=True,
+            created_date=start + timedelta(seconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    encoder = "orjson" if serializers.orjson else "json"
+    print(
+        f"{'rows':>8} {'marshal_with':>14} {'compiled+' + encoder:>16} {'speedup':>8}"
+    )
+    with create_app().app_context():
+        for size in (int(s) for s in options.sizes.split(",")):
+            data = rows(size)
+            baseline = timed(
+                lambda: output_json(marshal(data, user), 200), options.repeat
+            )
+            fast = timed(
+                lambda: serializers.json_response(list(map(serialize_user, data))),
+                options.repeat,
+            )
+            print(
+                f"{size:>8} {baseline:>12.2f}ms {fast:>14.2f}ms {baseline / fast:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
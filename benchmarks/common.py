@@ -0,0 +1,140 @@
+# benchmarks/common.py
+
+# helpers shared by the benchmark scripts. Every script runs against the
+# database in DATABASE_BENCH_URL and drops/recreates its tables, so point it at
+# a scratch Postgres database.
+
+import http.client
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from src import create_app, db  # noqa: E402
+
+
+def bench_app():
+    app = create_app()
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ["DATABASE_BENCH_URL"]
+    return app
+
+
+def reset_db():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+
+def lift_statement_timeout():
+    # for the current transaction only: filling and analyzing millions of rows
+    # takes longer than the app's statement_timeout
+    db.session.execute(text("SET LOCAL statement_timeout = 0"))
+
+
+def seed_users(count):
+    """Recreates the users table with count users, created one second apart."""
+    reset_db()
+    lift_statement_timeout()
+    db.session.execute(
+        text(
+            "INSERT INTO users (username, email, active, created_date, updated_at) "
+            "SELECT 'user' || g, 'user' || g || '@example.com', true, "
+            "now() - make_interval(secs => :count - g), now() "
+            "FROM generate_series(1, :count) AS g"
+        ),
+        {"count": count},
+    )
+    db.session.commit()
+    lift_statement_timeout()
+    db.session.execute(text("ANALYZE users"))
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    """Returns the median wall time of fn() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_load(host, port, next_request, concurrency, duration=None, total=None):
+    """Sends requests from concurrency threads, each over its own keep-alive
+    connection, until duration seconds have passed or total requests were sent.
+
+    next_request(i) returns (method, path, json_body or None, expected status)
+    for the i-th request overall. A response with another status counts as an
+    error.
+
+    Returns (requests per second, latencies in ms, error count).
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = itertools.count()
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    def worker():
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        mine, failed = [], 0
+        while deadline is None or time.perf_counter() < deadline:
+            i = next(counter)
+            if total is not None and i >= total:
+                break
+            method, path, body, expected = next_request(i)
+            headers = {}
+            if body is not None:
+                body = json.dumps(body)
+                headers["Content-Type"] = "application/json"
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != expected:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+            mine.append((time.perf_counter() - start) * 1000)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, latencies, errors[0]
+
+
+def wait_for_port(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/ping")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on {host}:{port} did not start")
@@ -1,15 +1,23 @@
 # manage.py
 
 
+import os
 import sys
+import time
 
+import click
 from flask.cli import FlaskGroup
 
 from src import create_app, db   
+from src.database import run_migrations
 from src.api.users.models import User  
+from src.api.users.seed import generate_users, load_users
+from src.api.users.transfer import export_users as export_to, import_users as import_from
+from src.startup import profile_startup as measure_startup
 
 
-app = create_app() 
+# the app is created by FlaskGroup when a command needs it; servers import
+# src.wsgi:app instead
 cli = FlaskGroup(create_app=create_app)  
 
 
@@ -19,12 +27,105 @@ def recreate_db():
     db.create_all()
     db.session.commit()
 
-# seed command to populate database with initial data
+# apply src/db/migrations to an existing database (create_all only creates
+# missing tables, not the columns and indexes added to them since)
+@cli.command('migrate_db')
+def migrate_db():
+    for name in run_migrations(db.engine):
+        print(f'applied {name}')
+
+# seed command to populate database with initial data; with --count, that
+# many synthetic users for capacity testing (see src/api/users/seed.py)
 @cli.command('seed_db')
-def seed_db():
-    db.session.add(User(username='Oscar', email='oscar@seasame.com'))
-    db.session.add(User(username='Big Bird', email='bigbird@seasame.com'))
-    db.session.commit()
+@click.option('--count', type=int, default=None,
+              help='Number of synthetic users to generate.')
+@click.option('--start', type=int, default=0,
+              help='Number the users from here, to add to an earlier run.')
+@click.option('--seed', type=int, default=0, help='Random seed.')
+@click.option('--batch-size', type=int, default=50000,
+              help='Rows per COPY and commit.')
+def seed_db(count, start, seed, batch_size):
+    if count is None:
+        db.session.add(User(username='Oscar', email='oscar@seasame.com'))
+        db.session.add(User(username='Big Bird', email='bigbird@seasame.com'))
+        db.session.commit()
+        return
+
+    started = time.perf_counter()
+
+    def progress(written):
+        elapsed = time.perf_counter() - started
+        print(f'{written}/{count} users '
+              f'({written / elapsed:.0f}/s, {elapsed:.0f}s)', flush=True)
+
+    rows = generate_users(count, start=start, seed=seed)
+    load_users(db.session, rows, batch_size, progress)
+
+
+def throughput_reporter(label):
+    started = time.perf_counter()
+
+    def report(rows):
+        elapsed = time.perf_counter() - started
+        print(f'{rows} {label} ({rows / max(elapsed, 1e-9):.0f}/s, {elapsed:.1f}s)',
+              flush=True)
+
+    return report
+
+
+# stream the users table to a CSV or JSON lines file; an interrupted export
+# continues from FILE.checkpoint when run again
+@cli.command('export_users')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, default=10000)
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint.')
+def export_users(path, fmt, batch_size, restart):
+    checkpoint = f'{path}.checkpoint'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    report = throughput_reporter('users exported')
+    rows = export_to(path, fmt, batch_size, checkpoint, report)
+    if os.path.exists(checkpoint):  # not written for an empty table
+        os.remove(checkpoint)
+    print(f'{rows} users exported to {path}')
+
+
+# upsert users from a CSV or JSON lines file, matching on email, one
+# transaction per batch; invalid rows go to FILE.rejects.jsonl
+@cli.command('import_users')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, default=10000)
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint.')
+def import_users(path, fmt, batch_size, restart):
+    checkpoint = f'{path}.checkpoint'
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    report = throughput_reporter('records read')
+    result = import_from(path, fmt, batch_size, checkpoint,
+                         f'{path}.rejects.jsonl', report)
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    print(f"{result['records']} records read, {result['written']} users written, {result['rejected']} rejected")
+
+
+# cold start cost of importing src and running create_app(), per module
+@cli.command('profile_startup')
+@click.option('--top', default=25, help='Number of modules to list.')
+@click.option('--env', 'flask_env', default=None,
+              help='FLASK_ENV to profile with (defaults to the current one).')
+def profile_startup(top, flask_env):
+    env = {'FLASK_ENV': flask_env} if flask_env else None
+    import_seconds, create_app_seconds, modules = measure_startup(env)
+    print(f'import src      {import_seconds * 1000:9.1f} ms')
+    print(f'create_app()    {create_app_seconds * 1000:9.1f} ms')
+    print(f'{len(modules)} modules imported; slowest by cumulative time:')
+    print(f'{"cumulative":>12} {"self":>10}  module')
+    for name, own, cumulative in sorted(modules, key=lambda m: -m[2])[:top]:
+        print(f'{cumulative * 1000:9.1f} ms {own * 1000:7.1f} ms  {name}')
 
 
 if __name__ == '__main__':
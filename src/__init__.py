@@ -4,15 +4,13 @@
 import os
 
 from flask import Flask
-from flask_admin import Admin
-from flask_sqlalchemy import SQLAlchemy
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from src.database import SQLAlchemy
+
 # instantiate the db
 db = SQLAlchemy()
 
-admin = Admin(template_mode="bootstrap3")
-
 
 # factory pattern
 def create_app(script_info=None):
@@ -28,7 +26,21 @@ def create_app(script_info=None):
     # set up extensions
     db.init_app(app)
 
+    from src import admission, compression, metrics, replicas
+
+    replicas.init_app(app)
+    metrics.init_app(app)
+    # before_request functions run in order: rejected requests are still timed
+    admission.init_app(app)
+    # after_request functions run in reverse, so registered after metrics,
+    # compression runs first and its time is part of the measured request
+    compression.init_app(app)
+
     if os.getenv("FLASK_ENV") == "development":
+        # flask_admin (and WTForms with it) is only imported where it is used,
+        # keeping it off the production startup path
+        from src.api.users import admin
+
         admin.init_app(app)
 
     # register api (replacing blueprints below)
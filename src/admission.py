@@ -0,0 +1,268 @@
+# src/admission.py
+
+# admission control, enabled with ADMISSION_ENABLED. Before a request reaches
+# its view it must get a token from its client's bucket (ADMISSION_RATE per
+# second, up to ADMISSION_BURST at once) and a slot among the requests already
+# running on its route (ADMISSION_MAX_IN_FLIGHT, or the route's entry in
+# ADMISSION_ROUTE_LIMITS). Otherwise it is answered straight away with 429 or
+# 503 and a Retry-After header, before any database work, so that when Postgres
+# slows down the backlog is turned away instead of queueing on the workers.
+#
+# The in-flight caps only see requests that already have a thread. Requests
+# waiting for one, in gunicorn's queue, are shed with ADMISSION_MAX_QUEUE_MS
+# instead: from the time the proxy in front received them, which it sends in
+# ADMISSION_QUEUE_HEADER (X-Request-Start, as set by Heroku or nginx).
+#
+# Buckets are kept per process unless ADMISSION_STORE is "redis"; in-flight
+# counts are always per process.
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, jsonify, request
+
+# the token bucket of SharedTokenBuckets, applied atomically on the server with
+# the server's clock; returns the seconds to wait, 0 when a token was taken
+TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+def refill(tokens, updated, now, rate, burst):
+    """Returns (tokens left, seconds to wait) after taking one token from a
+    bucket that held tokens at updated; the wait is 0 if there was one."""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class TokenBuckets:
+    """One token bucket per client key, in process. Only the maxsize most
+    recently seen clients are kept; a client dropped from the table comes back
+    with a full bucket."""
+
+    def __init__(self, rate, burst, maxsize=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Takes a token for key; returns 0, or the seconds until one is due."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens, wait = refill(tokens, updated, now, self.rate, self.burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class SharedTokenBuckets:
+    """Token buckets kept in a key-value server shared by every worker, so a
+    client's rate applies across all of them. One round trip per request.
+
+    client only needs the redis-py eval method. If it raises one of
+    unavailable, the request is let through rather than failed.
+    """
+
+    def __init__(self, client, rate, burst, prefix="admission:", unavailable=()):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self.unavailable = unavailable
+
+    def take(self, key):
+        try:
+            wait = self.client.eval(
+                TAKE_TOKEN, 1, f"{self.prefix}{key}", self.rate, self.burst
+            )
+        except self.unavailable:
+            return 0.0
+        return float(wait)
+
+
+class InFlightLimiter:
+    """Counts the requests running on each route and refuses new ones past the
+    route's limit. Nothing waits: a request either gets a slot or is shed."""
+
+    def __init__(self, limit, route_limits=None):
+        self.limit = limit
+        self.route_limits = route_limits or {}
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, route):
+        limit = self.route_limits.get(route, self.limit)
+        with self._lock:
+            running = self._running.get(route, 0)
+            if limit and running >= limit:
+                return False
+            self._running[route] = running + 1
+            return True
+
+    def release(self, route):
+        with self._lock:
+            self._running[route] -= 1
+
+    def running(self, route):
+        with self._lock:
+            return self._running.get(route, 0)
+
+
+class Admission:
+    def __init__(self, buckets, limiter):
+        self.buckets = buckets
+        self.limiter = limiter
+        self.rate_limited = 0
+        self.shed = 0
+
+    def stats(self):
+        return {"rate_limited": self.rate_limited, "shed": self.shed}
+
+
+def queue_wait(value, now):
+    """Returns the seconds since the time in an X-Request-Start header
+    ("t=1700000000.123", or in milliseconds or microseconds), or None if it
+    cannot be parsed."""
+    try:
+        started = float(value.strip().lstrip("t="))
+    except ValueError:
+        return None
+    # the unit follows from the magnitude of a current epoch time
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, now - started)
+
+
+def route_limits(value):
+    """Parses ADMISSION_ROUTE_LIMITS, e.g. "/users/bulk=2,/users=20", into
+    {rule: limit}."""
+    limits = {}
+    for item in (value or "").split(","):
+        if item.strip():
+            rule, limit = item.rsplit("=", 1)
+            limits[rule.strip()] = int(limit)
+    return limits
+
+
+def create_admission(config):
+    buckets = None
+    if config["ADMISSION_RATE"]:
+        rate, burst = config["ADMISSION_RATE"], config["ADMISSION_BURST"]
+        store = config["ADMISSION_STORE"]
+        if store == "memory":
+            buckets = TokenBuckets(rate, burst, config["ADMISSION_MAX_CLIENTS"])
+        elif store == "redis":
+            import redis  # optional dependency, only needed for the shared store
+
+            client = redis.Redis.from_url(config["ADMISSION_STORE_URL"])
+            buckets = SharedTokenBuckets(
+                client, rate, burst, unavailable=(redis.RedisError,)
+            )
+        else:
+            raise ValueError(f"Unknown ADMISSION_STORE {store!r}")
+    limiter = InFlightLimiter(
+        config["ADMISSION_MAX_IN_FLIGHT"],
+        route_limits(config["ADMISSION_ROUTE_LIMITS"]),
+    )
+    return Admission(buckets, limiter)
+
+
+def client_key():
+    header = current_app.config["ADMISSION_CLIENT_HEADER"]
+    if header and header in request.headers:
+        return request.headers[header]
+    # the client address, as set by ProxyFix
+    return request.remote_addr
+
+
+def reject(status, message, retry_after):
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def busy(admission):
+    admission.shed += 1
+    return reject(
+        503,
+        "The server is busy. Try again shortly.",
+        current_app.config["ADMISSION_RETRY_AFTER"],
+    )
+
+
+def admit():
+    config = current_app.config
+    if request.path in config["ADMISSION_EXEMPT_PATHS"]:
+        return None
+    admission = current_app.extensions["admission"]
+    max_queue = config["ADMISSION_MAX_QUEUE_MS"]
+    started = (
+        request.headers.get(config["ADMISSION_QUEUE_HEADER"]) if max_queue else None
+    )
+    if started:
+        waited = queue_wait(started, time.time())
+        if waited is not None and waited * 1000 > max_queue:
+            # the client has probably given up on a request this old
+            return busy(admission)
+
+    if admission.buckets is not None:
+        wait = admission.buckets.take(client_key())
+        if wait:
+            admission.rate_limited += 1
+            return reject(429, "Too many requests. Slow down.", wait)
+
+    route = request.url_rule.rule if request.url_rule else None
+    if route is None:
+        return None  # a 404 or 405 is cheap to answer
+    if not admission.limiter.acquire(route):
+        return busy(admission)
+    g.admission_route = route
+    return None
+
+
+def release(exc):
+    route = g.pop("admission_route", None)
+    if route is not None:
+        current_app.extensions["admission"].limiter.release(route)
+
+
+def get_admission():
+    """Returns the current app's Admission, or None when it is disabled."""
+    return current_app.extensions.get("admission")
+
+
+def init_app(app):
+    if not app.config["ADMISSION_ENABLED"]:
+        return
+    app.extensions["admission"] = create_admission(app.config)
+    app.before_request(admit)
+    app.teardown_request(release)
@@ -1,7 +1,62 @@
 # src/api/users/admin.py
 
+# the Flask-Admin users view, kept cheap on large tables: pages in the default
+# newest-first order seek past the last row of the previous page, carried in
+# the link to them as a cursor, instead of using OFFSET, search and filters are
+# indexed prefix matches, the pager counts from planner estimates, every list
+# query runs under ADMIN_STATEMENT_TIMEOUT_MS and inline edits are a single
+# UPDATE.
 
+from flask import abort, current_app, flash, g, request
+from flask_admin import Admin, expose
+from flask_admin.babel import gettext, lazy_gettext
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.filters import BaseSQLAFilter
+from sqlalchemy import func, or_, text, tuple_
+from sqlalchemy.exc import OperationalError
+
+from src import db
+from src.api.users.models import User
+from src.api.users.pagination import decode_cursor, encode_cursor
+
+from src.api.users.crud import (  # isort:skip
+    EmailAlreadyExists,
+    estimate_count,
+    like_prefix,
+    update_user,
+)
+
+# SQLSTATE of a statement cancelled by statement_timeout
+QUERY_CANCELED = "57014"
+
+
+def prefix_match(column, term):
+    """Case-insensitive "starts with", answered from the lower(...)
+    text_pattern_ops indexes."""
+    return func.lower(column).like(like_prefix(term.lower()), escape="\\")
+
+
+class PrefixFilter(BaseSQLAFilter):
+    def apply(self, query, value, alias=None):
+        return query.filter(prefix_match(self.get_column(alias), value))
+
+    def operation(self):
+        return lazy_gettext("starts with")
+
+
+class EstimatedCountQuery:
+    """Stands in for the count query of ModelView.get_list. Search and filters
+    are applied to a query for the rows, and scalar() returns the planner's
+    estimate of them rather than running count(*) over the table."""
+
+    def __init__(self, query):
+        self.query = query
+
+    def filter(self, *criteria):
+        return EstimatedCountQuery(self.query.filter(*criteria))
+
+    def scalar(self):
+        return estimate_count(self.query, current_app.config["USERS_COUNT_EXACT_BELOW"])
 
 
 class UsersAdminView(ModelView):
@@ -15,8 +70,8 @@ class UsersAdminView(ModelView):
         "created_date",
     )
     column_filters = (
-        "username",
-        "email",
+        PrefixFilter(User.username, "Username"),
+        PrefixFilter(User.email, "Email"),
     )
     column_sortable_list = (
         "username",
@@ -24,4 +79,149 @@ class UsersAdminView(ModelView):
         "active",
         "created_date",
     )
-    column_default_sort = ("created_date", True)
+    # id breaks ties, so that (created_date, id) identifies a position
+    column_default_sort = [("created_date", True), ("id", True)]
+
+    def search_placeholder(self):
+        return lazy_gettext("Username or email prefix")
+
+    def get_count_query(self):
+        return EstimatedCountQuery(self.session.query(self.model))
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        # every term must be a prefix of the username or the email
+        for term in search.split():
+            condition = or_(
+                prefix_match(User.username, term), prefix_match(User.email, term)
+            )
+            query = query.filter(condition)
+            if count_query is not None:
+                count_query = count_query.filter(condition)
+        return query, count_query, joins, count_joins
+
+    def page_key(self, search, filters, page_size):
+        """Identifies a listing in the default order, for which a cursor is
+        valid."""
+        return (search, tuple(map(tuple, filters or ())), page_size or self.page_size)
+
+    def _get_list_extra_args(self):
+        view_args = super()._get_list_extra_args()
+        # the cursor belongs to this page; _get_list_url adds the one of the
+        # next page to the link to it, not to every link and form
+        view_args.extra_args.pop("cursor", None)
+        return view_args
+
+    def _get_list_url(self, view_args):
+        end = g.get("admin_page_end")
+        if end is not None and view_args.sort is None and view_args.page:
+            key = self.page_key(
+                view_args.search, view_args.filters, view_args.page_size
+            )
+            if end[0] == (*key, view_args.page - 1):
+                extra_args = dict(view_args.extra_args, cursor=end[1])
+                view_args = view_args.clone(extra_args=extra_args)
+        return super()._get_list_url(view_args)
+
+    def _apply_pagination(self, query, page, page_size):
+        seek = g.pop("admin_seek", None)
+        if seek is None:
+            return super()._apply_pagination(query, page, page_size)
+        query = query.filter(tuple_(User.created_date, User.id) < tuple_(*seek))
+        return super()._apply_pagination(query, 0, page_size)
+
+    def get_list(
+        self,
+        page,
+        sort_column,
+        sort_desc,
+        search,
+        filters,
+        execute=True,
+        page_size=None,
+    ):
+        key = None
+        if sort_column is None:
+            # the default order: the page linked from the one before it seeks
+            # past that page's last row, sent back as cursor, other pages
+            # (and invalid cursors) use OFFSET
+            key = self.page_key(search, filters, page_size)
+            cursor = request.args.get("cursor")
+            if page and cursor:
+                try:
+                    g.admin_seek = decode_cursor(cursor)
+                except ValueError:
+                    pass
+
+        timeout = current_app.config["ADMIN_STATEMENT_TIMEOUT_MS"]
+        try:
+            if timeout:
+                # for this transaction only, which ends with the request
+                self.session.execute(
+                    text("SELECT set_config('statement_timeout', :timeout, true)"),
+                    {"timeout": str(timeout)},
+                )
+            count, users = super().get_list(
+                page, sort_column, sort_desc, search, filters, execute, page_size
+            )
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != QUERY_CANCELED:
+                raise
+            self.session.rollback()
+            flash(
+                gettext("The query took too long. Narrow the search or filters."),
+                "error",
+            )
+            return 0, []
+        finally:
+            g.pop("admin_seek", None)
+
+        if key is not None and execute and users:
+            last = users[-1]
+            cursor = encode_cursor(last.created_date, last.id)
+            g.admin_page_end = ((*key, page), cursor)
+        return count, users
+
+    @expose("/ajax/update/", methods=("POST",))
+    def ajax_update(self):
+        """Saves an inline edit from the list view with one UPDATE ...
+        RETURNING, instead of loading the user and flushing it."""
+        if not self.column_editable_list:
+            abort(404)
+
+        form = self.list_form()
+        # only the submitted field is validated
+        for field in list(form):
+            if field.name not in request.form and field.name != "csrf_token":
+                del form[field.name]
+
+        if not self.validate_form(form):
+            errors = [
+                ", ".join(error) if isinstance(error, list) else error
+                for field in form
+                for error in field.errors
+            ]
+            return gettext("Failed to update record. %(error)s", error=errors[0]), 500
+
+        values = {
+            field.name: field.data
+            for field in form
+            if field.name in self.column_editable_list
+        }
+        try:
+            updated = update_user(int(form.list_form_pk.data), **values)
+        except EmailAlreadyExists:
+            return (
+                gettext(
+                    "Failed to update record. %(error)s",
+                    error="Sorry. That email already exists.",
+                ),
+                500,
+            )
+        if updated is None:
+            return gettext("Record does not exist."), 500
+        return gettext("Record was successfully saved.")
+
+
+def init_app(app):
+    admin = Admin(app, template_mode="bootstrap3")
+    admin.add_view(UsersAdminView(User, db.session))
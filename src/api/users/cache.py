@@ -0,0 +1,175 @@
+# src/api/users/cache.py
+
+# read-through cache for single-user lookups. crud.get_user_by_id and
+# crud.get_users_by_ids consult it before querying Postgres, and
+# update_user/delete_user invalidate entries. A second, always in-process
+# cache holds the totals of count=cached.
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class LRUCache:
+    """Bounded in-process cache; entries expire ttl seconds after being set and
+    the least recently used entry is evicted once maxsize is reached."""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys that are cached."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_many(self, items):
+        for key, value in items.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+
+class SharedCache:
+    """Cache kept in a key-value server shared by every worker, so an
+    invalidation in one process is seen by all of them.
+
+    client only needs the redis-py get/mget/set(ex=)/delete/pipeline methods.
+    Batch lookups take one round trip each way. Expiry and eviction happen on
+    the server, so evictions are not counted here.
+    """
+
+    def __init__(self, client, ttl, prefix="users:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(f"{self.prefix}{key}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys that are cached, in one MGET."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.mget([f"{self.prefix}{key}" for key in keys])
+        found = {key: value for key, value in zip(keys, values) if value is not None}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        self.client.set(f"{self.prefix}{key}", value, ex=self.ttl)
+
+    def set_many(self, items):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipeline.set(f"{self.prefix}{key}", value, ex=self.ttl)
+        pipeline.execute()
+
+    def delete(self, key):
+        self.client.delete(f"{self.prefix}{key}")
+
+    def delete_many(self, keys):
+        # one DEL for every key; DEL takes at least one
+        names = [f"{self.prefix}{key}" for key in keys]
+        if names:
+            self.client.delete(*names)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": 0}
+
+
+def create_cache(config):
+    backend = config["USERS_CACHE_BACKEND"]
+    if not backend:
+        return None
+    if backend == "memory":
+        return LRUCache(config["USERS_CACHE_MAXSIZE"], config["USERS_CACHE_TTL"])
+    if backend == "redis":
+        import redis  # optional dependency, only needed for the shared backend
+
+        client = redis.Redis.from_url(config["USERS_CACHE_URL"])
+        return SharedCache(client, config["USERS_CACHE_TTL"])
+    raise ValueError(f"Unknown USERS_CACHE_BACKEND {backend!r}")
+
+
+def get_cache():
+    """Returns the current app's user cache, or None when caching is disabled.
+
+    The cache is created on first use so that it follows the config the app
+    ends up with rather than the one it was created with.
+    """
+    extensions = current_app.extensions
+    if "users_cache" not in extensions:
+        extensions["users_cache"] = create_cache(current_app.config)
+    return extensions["users_cache"]
+
+
+def get_count_cache():
+    """Returns the current app's cache of user totals, created on first use.
+
+    Totals are allowed to be up to USERS_COUNT_CACHE_TTL seconds old, so the
+    cache is not invalidated by writes.
+    """
+    extensions = current_app.extensions
+    if "users_count_cache" not in extensions:
+        extensions["users_count_cache"] = LRUCache(
+            current_app.config["USERS_COUNT_CACHE_MAXSIZE"],
+            current_app.config["USERS_COUNT_CACHE_TTL"],
+        )
+    return extensions["users_count_cache"]
@@ -0,0 +1,49 @@
+# src/api/users/conditional.py
+
+# validators for conditional GETs: a strong ETag plus Last-Modified derived from
+# users.updated_at (the users_version row for the collection), so unchanged
+# resources can be answered with 304 before any row is loaded or serialized.
+
+import hashlib
+from datetime import timezone
+
+from flask import Response, request
+from werkzeug.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def validator_headers(etag, last_modified):
+    headers = {"ETag": quote_etag(etag)}
+    if last_modified is not None:
+        # updated_at is stored as naive UTC
+        headers["Last-Modified"] = http_date(last_modified.replace(tzinfo=timezone.utc))
+    return headers
+
+
+def is_not_modified(etag, last_modified):
+    """Evaluates the current request's preconditions."""
+    return check_preconditions(
+        request.if_none_match, request.if_modified_since, etag, last_modified
+    )
+
+
+def check_preconditions(if_none_match, if_modified_since, etag, last_modified):
+    """Evaluates If-None-Match, or If-Modified-Since when no ETag was sent.
+
+    if_none_match is a werkzeug ETags set and if_modified_since a datetime, as
+    parsed by werkzeug.http.parse_etags and parse_date.
+    """
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+    if if_modified_since and last_modified is not None:
+        # HTTP dates have a resolution of one second
+        since = if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified(headers):
+    return Response(status=304, headers=headers)
@@ -2,37 +2,406 @@
 
 # here, the database calls are abstracted out from the actual route handlers
 
+import json
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
 from src import db
-from src.api.users.models import User
+from src.api.users.cache import get_cache, get_count_cache
+from src.api.users.models import User, users_version
+from src.replicas import read_session
+
+from sqlalchemy import (  # isort:skip
+    DateTime,
+    String,
+    bindparam,
+    cast,
+    delete,
+    func,
+    select,
+    text,
+    tuple_,
+    update,
+)
+
+
+class EmailAlreadyExists(Exception):
+    pass
+
+
+def is_duplicate_email(error):
+    # the unique index on lower(email) is the single source of truth, so a
+    # duplicate shows up as a violation of it instead of needing a pre-check
+    return "ix_users_email_lower" in str(error.orig)
+
+
+def commit_or_raise_duplicate(email):
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_duplicate_email(e):
+            raise EmailAlreadyExists(email) from e
+        raise
+
+
+def like_prefix(prefix):
+    """Returns a LIKE pattern matching strings that start with prefix."""
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def filter_users(query, filters):
+    """Applies the GET /users filters to an ORM query or a Core select.
+
+    filters may hold username and email (case-insensitive prefixes), active,
+    and created_after (inclusive) / created_before (exclusive) datetimes;
+    missing or None entries are ignored. Each one can be answered from an
+    index on the users table.
+    """
+    if not filters:
+        return query
+    if filters.get("username"):
+        pattern = like_prefix(filters["username"].lower())
+        query = query.filter(func.lower(User.username).like(pattern, escape="\\"))
+    if filters.get("email"):
+        pattern = like_prefix(filters["email"].lower())
+        query = query.filter(func.lower(User.email).like(pattern, escape="\\"))
+    if filters.get("active") is not None:
+        query = query.filter(User.active == filters["active"])
+    if filters.get("created_after") is not None:
+        query = query.filter(User.created_date >= filters["created_after"])
+    if filters.get("created_before") is not None:
+        query = query.filter(User.created_date < filters["created_before"])
+    return query
+
+
+def users_query(session, fields=None, *required):
+    """Returns a query for whole users, or with fields (column names) for rows
+    of just those columns plus the required ones."""
+    if fields is None:
+        return session.query(User)
+    names = dict.fromkeys((*fields, *required))
+    return session.query(*(User.__table__.c[name] for name in names))
+
+
+def get_all_users(filters=None, fields=None):
+    return filter_users(users_query(read_session(), fields), filters).all()
+
+
+def get_users_page(limit, cursor=None, filters=None, fields=None):
+    # keyset pagination: seek past the (created_date, id) of the last row seen
+    # instead of using OFFSET, so every page costs the same index range scan.
+    query = users_query(read_session(), fields, "created_date", "id")
+    query = filter_users(query.order_by(User.created_date, User.id), filters)
+    if cursor is not None:
+        query = query.filter(tuple_(User.created_date, User.id) > tuple_(*cursor))
+    return query.limit(limit).all()
+
+
+def iter_user_batches(batch_size, filters=None, fields=None):
+    # server-side cursor: rows are fetched batch_size at a time rather than
+    # buffering the whole table, so memory use does not grow with row count.
+    table = User.__table__
+    columns = [table.c[name] for name in fields] if fields else [table]
+    query = select(*columns).order_by(User.created_date, User.id)
+    result = read_session().execute(
+        filter_users(query, filters).execution_options(stream_results=True)
+    )
+    yield from result.partitions(batch_size)
+
+
+def encode_user(user):
+    """Returns the cache entry for user: its column values as JSON. Entries
+    are plain data, so reading one from a shared cache cannot run code."""
+    values = {}
+    for column in User.__table__.c:
+        value = getattr(user, column.key)
+        values[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    return json.dumps(values)
+
+
+def decode_user(session, entry):
+    """Rebuilds the user of a cache entry and attaches it to session without a
+    SELECT. Returns None for an entry missing one of the current columns,
+    written before the column was added, so that it is read again."""
+    values = json.loads(entry)
+    user = User.__mapper__.class_manager.new_instance()
+    for column in User.__table__.c:
+        if column.key not in values:
+            return None
+        value = values[column.key]
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        set_committed_value(user, column.key, value)
+    make_transient_to_detached(user)
+    return session.merge(user, load=False)
+
+
+def get_user_by_id(user_id, fields=None):
+    """Returns the user, or a row of fields plus updated_at when fields are
+    given and there is no cache (which holds whole users), or None.
+
+    The cache is only filled from the primary: a row read from a lagging
+    replica would otherwise be served to the clients pinned to the primary
+    to read their own writes.
+    """
+    session = read_session()
+    cache = get_cache()
+    if cache is None:
+        query = users_query(session, fields, "updated_at")
+        return query.filter(User.id == user_id).first()
+
+    cached = cache.get(user_id)
+    user = decode_user(session, cached) if cached is not None else None
+    if user is not None:
+        return user
+
+    user = session.query(User).filter_by(id=user_id).first()
+    if user is not None and session is db.session:
+        cache.set(user_id, encode_user(user))
+    return user
+
+
+def get_users_by_ids(ids, fields=None):
+    """Returns {id: user} for those of ids that exist.
+
+    Users missing from the cache (or all of them, without one) are loaded in a
+    single IN query and then cached, if read from the primary. Without a
+    cache, fields limits the query to those columns (and id), as in
+    get_user_by_id.
+    """
+    session = read_session()
+    cache = get_cache()
+    found = {}
+    if cache is not None:
+        for user_id, cached in cache.get_many(ids).items():
+            user = decode_user(session, cached)
+            if user is not None:
+                found[user_id] = user
 
+    missing = [user_id for user_id in ids if user_id not in found]
+    if missing:
+        query = users_query(session, None if cache else fields, "id")
+        loaded = {user.id: user for user in query.filter(User.id.in_(missing))}
+        if cache is not None and loaded and session is db.session:
+            cache.set_many(
+                {user_id: encode_user(user) for user_id, user in loaded.items()}
+            )
+        found.update(loaded)
+    return found
 
-def get_all_users():
-    return User.query.all()
 
+def get_user_updated_at(user_id):
+    cache = get_cache()
+    if cache is not None:
+        user = get_user_by_id(user_id)
+        return user.updated_at if user else None
+    query = read_session().query(User.updated_at)
+    return query.filter_by(id=user_id).scalar()
 
-def get_user_by_id(user_id):
-    return User.query.filter_by(id=user_id).first()
+
+def get_users_version():
+    """Returns (changed_at, version) of the users table, from the row its
+    triggers move as writes commit, without reading the table itself."""
+    query = select(users_version.c.changed_at, users_version.c.version)
+    return read_session().execute(query).one()
+
+
+def count_users_exact(filters=None):
+    query = read_session().query(func.count()).select_from(User)
+    return filter_users(query, filters).scalar()
+
+
+# the planner's estimate of the rows in a table: reltuples scaled to its
+# current size, as the planner does; no row if it was never vacuumed or analyzed
+TABLE_ROWS_ESTIMATE = text(
+    "SELECT CASE WHEN relpages > 0"
+    " THEN reltuples / relpages"
+    " * (pg_relation_size(oid) / current_setting('block_size')::int)"
+    " ELSE reltuples END"
+    " FROM pg_class WHERE oid = CAST(:table AS regclass) AND reltuples >= 0"
+)
+
+
+def estimate_table_rows():
+    """Returns the planner's estimate of the rows in users, or None if the
+    table has never been vacuumed or analyzed."""
+    params = {"table": User.__tablename__}
+    rows = read_session().execute(TABLE_ROWS_ESTIMATE, params).scalar()
+    return None if rows is None else int(rows)
+
+
+def explain_rows(connection, query):
+    """Returns the planner's estimate of the rows an ORM query or Core select
+    returns on connection, from EXPLAIN, without running it."""
+    statement = getattr(query, "statement", query)
+    compiled = statement.compile(connection)
+    params = compiled.construct_params()
+    if compiled.positional:  # asyncpg
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", params
+    ).scalar()
+    if isinstance(plan, str):  # drivers that leave json undecoded
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimate_rows(query):
+    """Returns the planner's estimate of the rows of query, see explain_rows."""
+    return explain_rows(read_session().connection(), query)
+
+
+def estimate_count(query, exact_below=0):
+    """Returns the planner's estimate of the number of rows of query, an ORM
+    query over users, or their exact count when the estimate is below
+    exact_below, where counting is cheap and estimates are least reliable."""
+    if query.whereclause is None:
+        estimate = estimate_table_rows()
+    else:
+        estimate = estimate_rows(query)
+    if estimate is not None and estimate >= exact_below:
+        return estimate
+    return query.order_by(None).with_entities(func.count(User.id)).scalar()
+
+
+def count_key(filters):
+    """Returns the count cache key of filters."""
+    return repr(sorted((filters or {}).items()))
+
+
+def count_users(filters=None, mode="exact", exact_below=0):
+    """Returns the number of users matching filters.
+
+    mode "exact" runs count(*), "estimated" is estimate_count, and "cached"
+    is an exact count kept for USERS_COUNT_CACHE_TTL seconds.
+    """
+    if mode == "estimated":
+        query = filter_users(read_session().query(User), filters)
+        return estimate_count(query, exact_below)
+    if mode == "cached":
+        cache = get_count_cache()
+        key = count_key(filters)
+        total = cache.get(key)
+        if total is None:
+            total = count_users_exact(filters)
+            cache.set(key, total)
+        return total
+    return count_users_exact(filters)
+
+
+def invalidate_user(user_id):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete(user_id)
+
+
+def invalidate_users(user_ids):
+    cache = get_cache()
+    if cache is not None:
+        cache.delete_many(user_ids)
 
 
 def get_user_by_email(email):
-    return User.query.filter_by(email=email).first()
+    query = read_session().query(User)
+    return query.filter(func.lower(User.email) == email.lower()).first()
+
+
+def get_existing_emails(emails):
+    """Returns the lower-cased addresses among emails that are already taken."""
+    # one set-based lookup instead of a get_user_by_email call per address
+    lowered = {email.lower() for email in emails}
+    query = (
+        read_session()
+        .query(func.lower(User.email))
+        .filter(func.lower(User.email).in_(lowered))
+    )
+    return {email for (email,) in query}
+
+
+def insert_users(users):
+    """Returns one INSERT ... SELECT FROM unnest(...) of users (dicts with
+    username and email), skipping taken emails and returning the inserted ones.
+
+    However many users there are, this is a single statement: the request holds
+    its email index entries only for that statement and its commit, and, with
+    the rows sorted by email, concurrent bulk requests take them in the same
+    order, so that they wait on each other rather than deadlock.
+    """
+    users = sorted(users, key=lambda user: user["email"].lower())
+    usernames = [user["username"] for user in users]
+    emails = [user["email"] for user in users]
+    rows = (
+        func.unnest(
+            cast(bindparam("usernames", usernames), ARRAY(String)),
+            cast(bindparam("emails", emails), ARRAY(String)),
+        )
+        .table_valued("username", "email")
+        .render_derived()
+    )
+    return (
+        insert(User.__table__)
+        .from_select(["username", "email"], select(rows.c.username, rows.c.email))
+        .on_conflict_do_nothing()
+        .returning(User.email)
+    )
+
+
+def add_users(users):
+    """Inserts users (dicts with username and email) with insert_users and
+    returns the emails that were inserted; users whose email was taken in the
+    meantime are skipped by ON CONFLICT DO NOTHING rather than failing the
+    request."""
+    inserted = set(db.session.execute(insert_users(users)).scalars())
+    db.session.commit()
+    return inserted
 
 
 def add_user(username, email):
+    """Raises EmailAlreadyExists if another user has the same email."""
     user = User(username, email)
     db.session.add(user)
-    db.session.commit()
+    commit_or_raise_duplicate(email)
     return user
 
 
-def update_user(user, username, email):
-    user.username = username
-    user.email = email
-    db.session.commit()
-    return user
+def update_user(user_id, **values):
+    """Sets the given columns (username, email, ...) of one user in a single
+    UPDATE ... RETURNING and returns the updated row, or None if there is no
+    such user.
 
+    Raises EmailAlreadyExists if another user has the same email.
+    """
+    statement = (
+        update(User.__table__)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(*User.__table__.c)
+    )
+    try:
+        row = db.session.execute(statement).first()
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_duplicate_email(e):
+            raise EmailAlreadyExists(values.get("email")) from e
+        raise
+    if row is not None:
+        invalidate_user(user_id)
+    return row
 
-def delete_user(user):
-    db.session.delete(user)
+
+def delete_user(user_id):
+    """Deletes one user in a single DELETE ... RETURNING and returns their
+    email, or None if there is no such user."""
+    statement = delete(User.__table__).where(User.id == user_id).returning(User.email)
+    email = db.session.execute(statement).scalar()
     db.session.commit()
-    return user
+    if email is not None:
+        invalidate_user(user_id)
+    return email
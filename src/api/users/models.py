@@ -1,11 +1,68 @@
 # src/api/users/models.py
 
-import os
-
+from sqlalchemy import DDL, event
 from sqlalchemy.sql import func
 
 from src import db
 
+# one row, moved by triggers on users whenever a transaction changes it, so
+# that the collection's ETag and Last-Modified are a primary key lookup rather
+# than an aggregate over the table. The row is updated once per transaction,
+# at commit: writers wait on each other only while committing, not from their
+# first write to users, and statements that change no rows leave it alone.
+users_version = db.Table(
+    "users_version",
+    db.Column("id", db.Integer, primary_key=True),
+    db.Column("version", db.BigInteger, nullable=False),
+    db.Column("changed_at", db.DateTime, nullable=False),
+)
+
+# users_version_bump is a deferred constraint trigger, so it runs at commit,
+# and for each changed row only; the first of those in a transaction moves the
+# version and flags the transaction (set_config(..., true) lasts until its
+# end) for the others to return at once. TRUNCATE has no row triggers and is
+# covered by a statement one. changed_at is naive UTC like updated_at;
+# clock_timestamp() is taken after any earlier writer's commit, and
+# greatest() keeps it from going backwards.
+USERS_VERSION_TRIGGER = """
+CREATE OR REPLACE FUNCTION bump_users_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_LEVEL = 'ROW' THEN
+        IF current_setting('users_version.bumped', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        PERFORM set_config('users_version.bumped', 'on', true);
+    END IF;
+    UPDATE users_version
+    SET version = version + 1,
+        changed_at = greatest(changed_at, timezone('utc', clock_timestamp()));
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_version_bump ON users;
+
+CREATE CONSTRAINT TRIGGER users_version_bump
+AFTER INSERT OR UPDATE OR DELETE ON users
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION bump_users_version();
+
+DROP TRIGGER IF EXISTS users_version_truncate ON users;
+
+CREATE TRIGGER users_version_truncate
+AFTER TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION bump_users_version();
+"""
+
+event.listen(
+    users_version,
+    "after_create",
+    DDL(
+        "INSERT INTO users_version (id, version, changed_at) "
+        "VALUES (1, 1, timezone('utc', now())) ON CONFLICT DO NOTHING"
+    ).execute_if(dialect="postgresql"),
+)
+
 
 class User(db.Model):
 
@@ -16,14 +73,45 @@ class User(db.Model):
     email = db.Column(db.String(128), nullable=False)
     active = db.Column(db.Boolean(), default=True, nullable=False)
     created_date = db.Column(db.DateTime, default=func.now(), nullable=False)
+    updated_at = db.Column(
+        db.DateTime, default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+    __table_args__ = (
+        db.Index("ix_users_created_date_id", "created_date", "id"),
+        db.Index("ix_users_updated_at", "updated_at"),
+        # emails are unique regardless of case; lookups must go through
+        # lower(email) to use this index
+        db.Index("ix_users_email_lower", func.lower(email), unique=True),
+        # prefix searches (LIKE 'abc%') on GET /users; the pattern opclass makes
+        # them indexable whatever the database collation
+        db.Index(
+            "ix_users_username_prefix",
+            func.lower(username).label("username_lower"),
+            postgresql_ops={"username_lower": "text_pattern_ops"},
+        ),
+        db.Index(
+            "ix_users_email_prefix",
+            func.lower(email).label("email_lower"),
+            postgresql_ops={"email_lower": "text_pattern_ops"},
+        ),
+        # inactive users are the minority; active=false listings read this
+        # small index in page order instead of filtering the whole table
+        db.Index(
+            "ix_users_inactive_created_date_id",
+            "created_date",
+            "id",
+            postgresql_where=~active,
+        ),
+    )
 
     def __init__(self, username, email):
         self.username = username
         self.email = email
 
 
-if os.getenv("FLASK_ENV") == "development":
-    from src import admin
-    from src.api.users.admin import UsersAdminView
-
-    admin.add_view(UsersAdminView(User, db.session))
+event.listen(
+    User.__table__,
+    "after_create",
+    DDL(USERS_VERSION_TRIGGER).execute_if(dialect="postgresql"),
+)
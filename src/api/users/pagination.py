@@ -0,0 +1,33 @@
+# src/api/users/pagination.py
+
+# opaque keyset cursors for paging through users ordered by (created_date, id)
+
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+
+
+def encode_cursor(created_date, user_id):
+    payload = json.dumps([created_date.isoformat(), user_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Returns the (created_date, id) pair encoded in a cursor token.
+
+    Raises ValueError if the token was not produced by encode_cursor.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        created_date, user_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_date), int(user_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def next_link(base_url, args, cursor):
+    """Builds an RFC 8288 Link header value pointing at the next page."""
+    params = {key: value for key, value in args.items() if key != "cursor"}
+    params["cursor"] = cursor
+    return f'<{base_url}?{urlencode(params)}>; rel="next"'
@@ -0,0 +1,95 @@
+# src/api/users/seed.py
+
+# synthetic users for capacity testing, loaded by manage.py seed_db --count.
+# The same count, start and seed always produce the same rows: usernames and
+# emails are unique by construction, signups grow over the year before `now`
+# (so recent months are denser), and older accounts are more likely to have
+# been deactivated. Rows are generated lazily and written batch by batch with
+# COPY, so memory use depends on the batch size, not the row count.
+
+import io
+import math
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from src.api.users.models import User
+
+COLUMNS = ("username", "email", "active", "created_date", "updated_at")
+FIRST_NAMES = (
+    "abby", "bert", "cookie", "elmo", "ernie", "grover", "oscar", "rosita",
+    "telly", "zoe", "julia", "gabi", "maria", "gordon", "luis", "alan",
+)  # fmt: skip
+LAST_NAMES = (
+    "bird", "count", "grouch", "monster", "snuffy", "twiddle", "cadabby",
+    "martinez", "robinson", "lopez", "hooper", "rodriguez",
+)  # fmt: skip
+DOMAINS = ("example.com", "example.org", "example.net", "mail.example.com")
+
+
+def generate_users(count, start=0, seed=0, now=None, span=timedelta(days=365)):
+    """Yields count tuples of COLUMNS, numbered from start, oldest first."""
+    rng = random.Random(f"{seed}:{start}")
+    now = now or datetime.utcnow()
+    total = start + count
+    for n in range(start, total):
+        first = FIRST_NAMES[rng.randrange(len(FIRST_NAMES))]
+        last = LAST_NAMES[rng.randrange(len(LAST_NAMES))]
+        # the number keeps them unique; the names are only there to look real
+        username = f"{first}.{last}{n}"
+        email = f"{first}.{last}{n}@{DOMAINS[n % len(DOMAINS)]}"
+        # signups at a linearly growing rate: the n-th of total falls at
+        # sqrt((n + 1) / total) of the span
+        age = 1 - math.sqrt((n + 1) / total)
+        created = now - span * age
+        active = rng.random() >= 0.02 + 0.1 * age
+        yield username, email, active, created, created
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(cursor, batch):
+    # COPY text format; the generated values contain no tabs, newlines or
+    # backslashes that would need escaping
+    buffer = io.StringIO()
+    for username, email, active, created, updated in batch:
+        flag = "t" if active else "f"
+        buffer.write(f"{username}\t{email}\t{flag}\t{created}\t{updated}\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY users ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+
+
+def load_users(session, rows, batch_size=50_000, progress=None):
+    """Writes rows to the users table, committing every batch_size rows.
+
+    Uses COPY when the driver supports it (psycopg2), else multi-row INSERTs.
+    progress, if given, is called with the number of rows written so far.
+    Returns that number.
+    """
+    written = 0
+    for batch in batches(rows, batch_size):
+        cursor = session.connection().connection.cursor()
+        if hasattr(cursor, "copy_expert"):
+            copy_rows(cursor, batch)
+            cursor.close()
+        else:
+            values = [dict(zip(COLUMNS, row)) for row in batch]
+            session.execute(insert(User.__table__).values(values))
+        session.commit()
+        written += len(batch)
+        if progress:
+            progress(written)
+    session.execute(text("ANALYZE users"))
+    session.commit()
+    return written
@@ -0,0 +1,80 @@
+# src/api/users/serializers.py
+
+# precompiled serializers for flask-restx models. marshal() looks every field
+# up and formats it through the generic fields.* machinery for every object;
+# compile_serializer() does that work once per model and generates a plain
+# function that builds each dict directly.
+
+import json
+
+from flask import current_app, has_app_context
+from flask_restx import fields
+
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is used when it is not installed
+    orjson = None
+
+
+def _formatter(field):
+    """Returns an expression template formatting {v} the way field.output
+    would, or None when the field needs the generic path."""
+    if field.attribute is not None or field.default is not None:
+        return None
+    if isinstance(field, fields.DateTime) and field.dt_format == "iso8601":
+        return "None if {v} is None else {v}.isoformat()"
+    for kind, cast in (
+        (fields.Boolean, "bool"),
+        (fields.Integer, "int"),
+        (fields.Float, "float"),
+        (fields.String, "str"),
+    ):
+        if type(field) is kind:
+            return f"None if {{v}} is None else {cast}({{v}})"
+    return None
+
+
+def compile_serializer(model, only=None):
+    """Returns a function turning one object (ORM instance, row or dict) into
+    the same dict marshal(obj, model) would produce.
+
+    only restricts the output to the given field names, in model order.
+    """
+    names = [name for name in model if only is None or name in only]
+    namespace = {}
+    lines = [
+        "def serialize(obj):",
+        "    get = obj.get if isinstance(obj, dict) else None",
+    ]
+    items = []
+    for i, name in enumerate(names):
+        field = model[name]
+        if isinstance(field, type):
+            field = field()
+        template = _formatter(field)
+        if template is None:
+            namespace[f"field{i}"] = field
+            items.append(f"{name!r}: field{i}.output({name!r}, obj)")
+            continue
+        lines.append(
+            f"    v{i} = get({name!r}) if get else getattr(obj, {name!r}, None)"
+        )
+        items.append(f"{name!r}: " + template.format(v=f"v{i}"))
+    lines.append("    return {" + ", ".join(items) + "}")
+    exec("\n".join(lines), namespace)
+    return namespace["serialize"]
+
+
+def dumps(data):
+    """Encodes data as JSON text, with orjson when it is available."""
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    settings = current_app.config.get("RESTX_JSON", {}) if has_app_context() else {}
+    return json.dumps(data, **settings)
+
+
+def json_response(data, status=200, headers=None):
+    # the same body flask-restx's output_json writes, terminated by a newline
+    return current_app.response_class(
+        dumps(data) + "\n", status=status, headers=headers, mimetype="application/json"
+    )
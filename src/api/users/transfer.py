@@ -0,0 +1,316 @@
+# src/api/users/transfer.py
+
+# backup and migration of the users table as CSV or JSON lines, used by
+# manage.py export_users / import_users. Both directions stream: exports read
+# through a server-side cursor in id order, and imports upsert one batch per
+# transaction, so memory use stays the same whatever the table size. After
+# every batch the position is saved to a checkpoint file, and an interrupted
+# run started again with the same checkpoint carries on from there.
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+
+from src import db
+from src.api.users.crud import invalidate_users
+from src.api.users.models import User
+from src.api.users.validation import invalid_bulk_item
+
+from sqlalchemy import (  # isort:skip
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    func,
+    or_,
+    select,
+)
+
+FIELDS = ("id", "username", "email", "active", "created_date", "updated_at")
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Cannot tell the format of {path}; use csv or jsonl.")
+    return FORMATS[extension]
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, state):
+    # written aside and renamed, so a crash never leaves half a checkpoint
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def export_users(path, fmt=None, batch_size=10000, checkpoint=None, progress=None):
+    """Writes every user to path in id order and returns how many were written.
+
+    With a checkpoint from an earlier run the file is cut back to the last
+    completed batch and the export continues after it.
+    """
+    fmt = fmt or detect_format(path)
+    state = read_checkpoint(checkpoint) if checkpoint else None
+    if state is None:
+        state = {"last_id": 0, "offset": 0, "rows": 0}
+
+    with open(path, "r+" if state["rows"] else "w", newline="") as f:
+        f.seek(state["offset"])
+        f.truncate()
+        writer = csv.writer(f) if fmt == "csv" else None
+        if writer and not state["rows"]:
+            writer.writerow(FIELDS)
+
+        columns = [User.__table__.c[name] for name in FIELDS]
+        query = select(*columns).where(User.id > state["last_id"]).order_by(User.id)
+        result = db.session.execute(query.execution_options(stream_results=True))
+        for batch in result.partitions(batch_size):
+            for row in batch:
+                values = [
+                    value.isoformat() if isinstance(value, datetime) else value
+                    for value in row
+                ]
+                if writer:
+                    writer.writerow(values)
+                else:
+                    f.write(json.dumps(dict(zip(FIELDS, values))) + "\n")
+            f.flush()
+            state = {
+                "last_id": batch[-1].id,
+                "offset": f.tell(),
+                "rows": state["rows"] + len(batch),
+            }
+            if checkpoint:
+                write_checkpoint(checkpoint, state)
+            if progress:
+                progress(state["rows"])
+    db.session.commit()
+    return state["rows"]
+
+
+def read_records(f, fmt):
+    """Yields one dict per record; JSON lines that do not parse are yielded
+    as the raw text, to be rejected like any other invalid record."""
+    if fmt == "csv":
+        yield from csv.DictReader(f)
+        return
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line.rstrip("\n")
+
+
+def parse_flag(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("true", "t", "1", "yes"):
+        return True
+    if str(value).lower() in ("false", "f", "0", "no"):
+        return False
+    raise ValueError(f"Invalid active flag {value!r}.")
+
+
+def user_values(record):
+    """Returns the columns to upsert for one record, or raises ValueError.
+
+    Ids are not imported: rows are matched on email, and new users get ids
+    from the target database.
+    """
+    message = invalid_bulk_item(record)
+    if message:
+        raise ValueError(message)
+    active = record.get("active")
+    created = record.get("created_date")
+    return {
+        "username": record["username"],
+        "email": record["email"],
+        "active": True if active in (None, "") else parse_flag(active),
+        "created_date": datetime.fromisoformat(created) if created else None,
+    }
+
+
+# each batch is loaded into this temporary table first, with COPY where the
+# driver supports it, and merged into users with one INSERT ... SELECT
+staging = Table(
+    "users_import",
+    MetaData(),
+    Column("position", BigInteger),
+    Column("username", String(128)),
+    Column("email", String(128)),
+    Column("active", Boolean),
+    Column("created_date", DateTime),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DELETE ROWS",
+)
+STAGED = ("position", "username", "email", "active", "created_date")
+
+
+def stage_rows(rows):
+    connection = db.session.connection()
+    staging.create(connection, checkfirst=True)
+    cursor = connection.connection.cursor()
+    if not hasattr(cursor, "copy_expert"):
+        connection.execute(staging.insert(), rows)
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[name] for name in STAGED])
+    buffer.seek(0)
+    statement = f"COPY users_import ({', '.join(STAGED)}) FROM STDIN CSV"
+    try:
+        cursor.copy_expert(statement, buffer)
+    except connection.dialect.dbapi.Error as e:
+        # raised by the driver directly; wrap it as SQLAlchemy would
+        raise DBAPIError.instance(statement, None, e, connection.dialect.dbapi.Error)
+    finally:
+        cursor.close()
+
+
+def merge_statement():
+    # the last of several rows with the same email (any case) wins
+    key = func.lower(staging.c.email)
+    rows = (
+        select(
+            staging.c.username,
+            staging.c.email,
+            staging.c.active,
+            func.coalesce(staging.c.created_date, func.now()),
+        )
+        .distinct(key)
+        .order_by(key, staging.c.position.desc())
+    )
+    statement = insert(User.__table__).from_select(
+        ["username", "email", "active", "created_date"], rows
+    )
+    excluded = statement.excluded
+    statement = statement.on_conflict_do_update(
+        index_elements=[func.lower(User.email)],
+        set_={
+            "username": excluded.username,
+            "email": excluded.email,
+            "active": excluded.active,
+            "updated_at": func.now(),
+        },
+        # users whose username, email and active flag are unchanged are left
+        # alone, so importing the same file again writes nothing
+        where=or_(
+            User.__table__.c.username != excluded.username,
+            User.__table__.c.email != excluded.email,
+            User.__table__.c.active != excluded.active,
+        ),
+    )
+    return statement.returning(User.id)
+
+
+def upsert_users(rows):
+    """Inserts rows, updating the users whose email (any case) already exists.
+    Returns the ids of the users written."""
+    stage_rows(rows)
+    return db.session.execute(merge_statement()).scalars().all()
+
+
+def import_batch(batch, reject):
+    """Upserts a batch of (number, record, values) in one transaction. If the
+    database refuses it, each row is retried on its own so that only the bad
+    ones are rejected. Returns the number of rows written.
+
+    The users written are dropped from the user cache once committed, so the
+    API does not go on serving (and validating against) their old rows.
+    """
+    if not batch:
+        return 0
+    rows = [{"position": number, **values} for number, record, values in batch]
+    try:
+        written = upsert_users(rows)
+        db.session.commit()
+        invalidate_users(written)
+        return len(written)
+    except DBAPIError:
+        db.session.rollback()
+
+    written = 0
+    for number, record, values in batch:
+        try:
+            ids = upsert_users([{"position": number, **values}])
+            db.session.commit()
+        except DBAPIError as e:
+            db.session.rollback()
+            reject(number, record, str(e.orig).strip())
+            continue
+        invalidate_users(ids)
+        written += len(ids)
+    return written
+
+
+def import_users(
+    path, fmt=None, batch_size=10000, checkpoint=None, rejects=None, progress=None
+):
+    """Upserts every record of path in batches of batch_size, each committed
+    on its own. Invalid records are appended to the rejects file (JSON lines)
+    instead of stopping the import.
+
+    Returns {"records": read, "written": upserted, "rejected": rejected}.
+    """
+    fmt = fmt or detect_format(path)
+    state = read_checkpoint(checkpoint) if checkpoint else None
+    if state is None:
+        state = {"records": 0, "written": 0, "rejected": 0}
+    rejects_file = open(rejects, "a" if state["records"] else "w") if rejects else None
+
+    def reject(number, record, error):
+        state["rejected"] += 1
+        if rejects_file:
+            entry = {"record": number, "error": error, "data": record}
+            rejects_file.write(json.dumps(entry, default=str) + "\n")
+
+    def commit(batch, records):
+        state["written"] += import_batch(batch, reject)
+        state["records"] = records
+        if rejects_file:
+            rejects_file.flush()
+        if checkpoint:
+            write_checkpoint(checkpoint, state)
+        if progress:
+            progress(records)
+
+    try:
+        with open(path, newline="") as f:
+            batch = []
+            number = 0
+            for number, record in enumerate(read_records(f, fmt), 1):
+                if number <= state["records"]:
+                    continue  # done by the run the checkpoint is from
+                try:
+                    batch.append((number, record, user_values(record)))
+                except (TypeError, ValueError) as e:
+                    reject(number, record, str(e))
+                if len(batch) == batch_size:
+                    commit(batch, number)
+                    batch = []
+            if number > state["records"]:
+                commit(batch, number)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    return state
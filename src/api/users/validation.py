@@ -0,0 +1,84 @@
+# src/api/users/validation.py
+
+# checks on user records shared by the HTTP API (POST /users/bulk, in the sync
+# and async apps) and the import command, kept apart from both so that neither
+# depends on the other. The bulk_* functions are the parts of POST /users/bulk
+# that do no I/O; each app only looks up existing emails and inserts the new
+# users between them:
+#
+#   results = bulk_results(items)
+#   existing = get_existing_emails(bulk_emails(results))
+#   new_users = bulk_new_users(items, results, existing)
+#   body, status = bulk_summary(results, add_users(new_users))
+
+
+def invalid_bulk_item(item):
+    """Returns why item is not a valid new user, or None if it is one."""
+    if not isinstance(item, dict):
+        return "Expected an object with username and email."
+    for key in ("username", "email"):
+        value = item.get(key)
+        if not isinstance(value, str) or not value:
+            return f"'{key}' is a required property"
+        if len(value) > 128:
+            return f"'{key}' is too long"
+    return None
+
+
+def bulk_results(items):
+    """Returns a result per item of a bulk payload: "invalid" with the reason,
+    or "created" for now, for those to look up and insert."""
+    results = []
+    for index, item in enumerate(items):
+        message = invalid_bulk_item(item)
+        results.append(
+            {
+                "index": index,
+                "email": item.get("email") if isinstance(item, dict) else None,
+                "status": "invalid" if message else "created",
+                "message": message,
+            }
+        )
+    return results
+
+
+def bulk_emails(results):
+    """Returns the emails of the valid items, to look up."""
+    return {result["email"] for result in results if result["status"] == "created"}
+
+
+def bulk_new_users(items, results, existing):
+    """Marks the valid items whose email is in existing (lower-cased taken
+    addresses), or repeats an earlier item's, as duplicates and returns the
+    users to insert, as dicts with username and email."""
+    existing = set(existing)
+    new_users = []
+    for result in results:
+        if result["status"] != "created":
+            continue
+        key = result["email"].lower()
+        if key in existing:
+            result["status"] = "duplicate"
+            continue
+        existing.add(key)  # later items repeating this email are duplicates
+        new_users.append(
+            {"username": items[result["index"]]["username"], "email": result["email"]}
+        )
+    return new_users
+
+
+def bulk_summary(results, inserted):
+    """Completes results with the emails that were inserted and returns the
+    response body and status: 201 if any user was added, 400 otherwise."""
+    for result in results:
+        if result["status"] == "invalid":
+            continue
+        # a concurrent request may have taken the email since the lookup
+        if result["email"] not in inserted:
+            result["status"] = "duplicate"
+        if result["status"] == "duplicate":
+            result["message"] = "Sorry. That email already exists."
+        else:
+            result["message"] = f"{result['email']} was added!"
+    response_object = {"created": len(inserted), "results": results}
+    return response_object, 201 if inserted else 400
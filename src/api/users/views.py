@@ -1,19 +1,51 @@
 # src/api/users/views.py
 
-from flask import request  # removed Blueprint and Api, replaced with Namespace
-from flask_restx import Namespace, Resource, fields  # Api removed
+import json
+from datetime import timezone
+from functools import lru_cache
+
+# removed Blueprint and Api, replaced with Namespace
+from flask import Response, current_app, request, stream_with_context
+from flask_restx import Namespace, Resource, fields, inputs
+
+from src.api.users.pagination import decode_cursor, encode_cursor, next_link
+from src.api.users.serializers import compile_serializer, dumps, json_response
+
+from src.api.users.validation import (  # isort:skip
+    bulk_emails,
+    bulk_new_users,
+    bulk_results,
+    bulk_summary,
+)
+
+from src.api.users.conditional import (  # isort:skip
+    is_not_modified,
+    make_etag,
+    not_modified,
+    validator_headers,
+)
 
 from src.api.users.crud import (  # isort:skip
+    count_users,
     get_all_users,
-    get_user_by_email,
+    get_users_page,
+    iter_user_batches,
+    EmailAlreadyExists,
     add_user,
+    add_users,
+    get_existing_emails,
     get_user_by_id,
+    get_users_by_ids,
+    get_user_updated_at,
+    get_users_version,
     update_user,
     delete_user,
 )
 
 users_namespace = Namespace("users")
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 # link a Flask-RESTX API to a Flask Blueprint.
 # users_blueprint = Blueprint("users", __name__)
 # api = Api(users_blueprint)
@@ -30,6 +62,148 @@ user = users_namespace.model(
     },
 )
 
+# partial update: any subset of the writable fields
+user_patch = users_namespace.model(
+    "UserPatch",
+    {
+        "username": fields.String,
+        "email": fields.String,
+    },
+)
+
+bulk_result = users_namespace.model(
+    "BulkUserResult",
+    {
+        "index": fields.Integer,
+        "email": fields.String,
+        "status": fields.String(enum=["created", "duplicate", "invalid"]),
+        "message": fields.String,
+    },
+)
+
+bulk_response = users_namespace.model(
+    "BulkUsersResponse",
+    {
+        "created": fields.Integer,
+        "results": fields.List(fields.Nested(bulk_result)),
+    },
+)
+
+# generated once from the model above; produces the same output as
+# marshal(obj, user) for a fraction of the cost per object
+serialize_user = compile_serializer(user)
+
+USER_FIELDS = tuple(user)
+
+
+def field_list(value):
+    """Parses "email,id" into ("id", "email"), the fields in model order."""
+    names = {name.strip() for name in value.split(",")}
+    unknown = sorted(names - set(USER_FIELDS))
+    if unknown:
+        raise ValueError(
+            f"Unknown fields {', '.join(map(repr, unknown))}; "
+            f"expected some of {', '.join(USER_FIELDS)}."
+        )
+    return tuple(name for name in USER_FIELDS if name in names)
+
+
+@lru_cache(maxsize=None)
+def serializer_for(fields):
+    """Returns the serializer for a field_list tuple, or for every field when
+    fields is None; one is compiled per combination, on first use."""
+    if fields is None:
+        return serialize_user
+    return compile_serializer(user, only=fields)
+
+
+def user_etag(user_id, updated_at, fields=None):
+    # every selection of fields is a representation with its own tag
+    if fields is None:
+        return make_etag(user_id, updated_at)
+    return make_etag(user_id, updated_at, ",".join(fields))
+
+
+FIELDS_HELP = "Comma separated fields to return, e.g. id,email; default all."
+
+# query string accepted by GET /users/<user_id>
+user_parser = users_namespace.parser()
+user_parser.add_argument("fields", type=field_list, location="args", help=FIELDS_HELP)
+
+
+def id_list(value):
+    """Parses "3,1,2" into [3, 1, 2]."""
+    try:
+        return [int(part) for part in value.split(",")]
+    except ValueError:
+        raise ValueError("Expected comma separated integers.")
+
+
+COUNT_MODES = ("exact", "estimated", "cached")
+
+
+def count_mode(value):
+    if value not in COUNT_MODES:
+        raise ValueError("Expected exact, estimated or cached.")
+    return value
+
+
+# query string accepted by GET /users
+users_list_parser = users_namespace.parser()
+users_list_parser.add_argument(
+    "limit", type=int, location="args", help="Maximum number of users per page."
+)
+users_list_parser.add_argument(
+    "cursor", type=str, location="args", help="Opaque cursor from the previous page."
+)
+users_list_parser.add_argument(
+    "all",
+    type=inputs.boolean,
+    location="args",
+    default=False,
+    help="Return every user in a single unpaginated response.",
+)
+users_list_parser.add_argument(
+    "username", type=str, location="args", help="Username prefix, any case."
+)
+users_list_parser.add_argument(
+    "email", type=str, location="args", help="Email prefix, any case."
+)
+users_list_parser.add_argument(
+    "active", type=inputs.boolean, location="args", help="Only (in)active users."
+)
+users_list_parser.add_argument(
+    "created_after",
+    type=inputs.datetime_from_iso8601,
+    location="args",
+    help="Users created at or after this ISO 8601 time (UTC if no offset).",
+)
+users_list_parser.add_argument(
+    "created_before",
+    type=inputs.datetime_from_iso8601,
+    location="args",
+    help="Users created before this ISO 8601 time (UTC if no offset).",
+)
+
+users_list_parser.add_argument(
+    "ids",
+    type=id_list,
+    location="args",
+    help="Comma separated user ids; returns those users in the order given.",
+)
+users_list_parser.add_argument(
+    "count",
+    type=count_mode,
+    location="args",
+    help="Send the number of matching users in X-Total-Count: exact, "
+    "estimated (planner statistics) or cached (exact, refreshed periodically).",
+)
+users_list_parser.add_argument(
+    "fields", type=field_list, location="args", help=FIELDS_HELP
+)
+
+FILTER_ARGS = ("username", "email", "active", "created_after", "created_before")
+
 
 # define the route handler.
 class UsersList(Resource):
@@ -43,34 +217,245 @@ class UsersList(Resource):
         email = post_data.get("email")
         response_object = {}
 
-        user = get_user_by_email(email)
-        if user:
+        try:
+            add_user(username, email)
+        except EmailAlreadyExists:
             response_object["message"] = "Sorry. That email already exists."
             return response_object, 400
 
-        add_user(username, email)
-
         response_object["message"] = f"{email} was added!"
         return response_object, 201
 
-    @users_namespace.marshal_with(user, as_list=True)
+    @users_namespace.expect(users_list_parser)
+    @users_namespace.response(200, "Success", [user])
+    @users_namespace.produces(["application/json", NDJSON_MIMETYPE])
     def get(self):
-        """Returns all users."""
-        return get_all_users(), 200
+        """Returns a page of users, oldest first, optionally filtered.
 
+        Clients sending ``Accept: application/x-ndjson`` get every matching
+        user instead, streamed one JSON document per line. With ``ids`` it
+        returns just those users, in the order given, and lists the ones that
+        do not exist in ``X-Missing-Ids``. With ``count`` the number of
+        matching users is sent in ``X-Total-Count``.
+        """
+        args = users_list_parser.parse_args()
+        if args["ids"] is not None:
+            message = invalid_ids_request(args, current_app.config)
+            if message:
+                users_namespace.abort(400, message)
+            return users_by_ids(args["ids"], args["fields"])
 
-class Users(Resource):
-    @users_namespace.marshal_with(
-        user
-    )  # user model used as a serialiser to generate a JSON object from the model's fields.
+        filters = list_filters(args)
+        best = request.accept_mimetypes.best_match(
+            ["application/json", NDJSON_MIMETYPE]
+        )
+        version = get_users_version()
+        if best == NDJSON_MIMETYPE:
+            headers = collection_validators(best, version)
+            if isinstance(headers, Response):
+                return headers
+            if args["count"]:
+                headers.update(total_count(filters, args["count"]))
+            return stream_users(headers, filters, args["fields"])
+
+        limit = args["limit"]
+        if limit is None:
+            limit = current_app.config["USERS_PAGE_DEFAULT_LIMIT"]
+        max_limit = current_app.config["USERS_PAGE_MAX_LIMIT"]
+        if not 1 <= limit <= max_limit:
+            users_namespace.abort(400, f"limit must be between 1 and {max_limit}")
+
+        cursor = None
+        if args["cursor"]:
+            try:
+                cursor = decode_cursor(args["cursor"])
+            except ValueError:
+                users_namespace.abort(400, "Invalid cursor.")
+
+        headers = collection_validators(best, version)
+        if isinstance(headers, Response):
+            return headers
+        if args["count"]:
+            headers.update(total_count(filters, args["count"]))
+
+        fields = args["fields"]
+        serialize = serializer_for(fields)
+        if args["all"]:
+            users = get_all_users(filters, fields)
+            return json_response(list(map(serialize, users)), 200, headers)
+
+        # fetch one extra row to find out whether there is a next page
+        users = get_users_page(limit + 1, cursor, filters, fields)
+        if len(users) > limit:
+            users = users[:limit]
+            token = encode_cursor(users[-1].created_date, users[-1].id)
+            headers["X-Next-Cursor"] = token
+            headers["Link"] = next_link(request.base_url, request.args, token)
+        return json_response(list(map(serialize, users)), 200, headers)
+
+    @users_namespace.expect(users_list_parser)
     @users_namespace.response(200, "Success")
+    @users_namespace.response(304, "Not Modified")
+    def head(self):
+        """Returns the headers of GET /users, with X-Total-Count, and no body.
+
+        Without ``count`` the total is counted as USERS_COUNT_MODE says.
+        """
+        args = users_list_parser.parse_args()
+        filters = list_filters(args)
+        best = request.accept_mimetypes.best_match(
+            ["application/json", NDJSON_MIMETYPE]
+        )
+        version = get_users_version()
+        headers = collection_validators(best, version)
+        if isinstance(headers, Response):
+            return headers
+        mode = args["count"] or current_app.config["USERS_COUNT_MODE"]
+        headers.update(total_count(filters, mode))
+        # an empty iterator rather than b"", so no Content-Length: 0 is sent
+        # for what would be a non-empty GET body
+        return Response(iter(()), 200, headers, mimetype=best)
+
+
+def total_count(filters, mode):
+    """Returns the X-Total-Count header for the users matching filters."""
+    exact_below = current_app.config["USERS_COUNT_EXACT_BELOW"]
+    total = count_users(filters, mode, exact_below)
+    return {"X-Total-Count": str(total)}
+
+
+def invalid_ids_request(args, config):
+    if args["all"] or any(
+        args[name] is not None for name in ("limit", "cursor", *FILTER_ARGS)
+    ):
+        return "ids cannot be combined with paging or filters."
+    max_ids = config["USERS_BATCH_MAX_IDS"]
+    if len(args["ids"]) > max_ids:
+        return f"At most {max_ids} ids per request."
+    return None
+
+
+def ordered_users(ids, found, serialize=serialize_user):
+    """Returns the found users in the order of ids and the ids that were not
+    found as an X-Missing-Ids header."""
+    users = [serialize(found[user_id]) for user_id in ids if user_id in found]
+    missing = [str(user_id) for user_id in ids if user_id not in found]
+    headers = {"X-Missing-Ids": ",".join(missing)} if missing else {}
+    return users, headers
+
+
+def users_by_ids(ids, fields=None):
+    ids = list(dict.fromkeys(ids))  # each user once, first position wins
+    found = get_users_by_ids(ids, fields)
+    users, headers = ordered_users(ids, found, serializer_for(fields))
+    return json_response(users, 200, headers)
+
+
+def list_filters(args):
+    filters = {name: args[name] for name in FILTER_ARGS}
+    for name in ("created_after", "created_before"):
+        value = filters[name]
+        if value is not None and value.tzinfo is not None:
+            # created_date is stored as naive UTC
+            filters[name] = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return filters
+
+
+def collection_validators(mimetype, version):
+    """Returns the ETag/Last-Modified headers for the users collection, or a
+    304 response if the client's copy is still current.
+
+    version is the (changed_at, version) pair of get_users_version. Every
+    insert, update and delete moves both, so they identify the collection's
+    state without reading it; every page and representation gets its own tag.
+    """
+    last_modified, number = version
+    etag = make_etag(number, mimetype, request.query_string)
+    headers = validator_headers(etag, last_modified)
+    if is_not_modified(etag, last_modified):
+        return not_modified(headers)
+    return headers
+
+
+def stream_users(headers, filters=None, fields=None):
+    batch_size = current_app.config["USERS_STREAM_BATCH_SIZE"]
+    serialize = serializer_for(fields)
+
+    def generate():
+        for batch in iter_user_batches(batch_size, filters, fields):
+            yield "".join(dumps(serialize(row)) + "\n" for row in batch)
+
+    # no Content-Length, so the WSGI server sends the body chunked as each batch
+    # is read from the database
+    return Response(
+        stream_with_context(generate()), mimetype=NDJSON_MIMETYPE, headers=headers
+    )
+
+
+def parse_bulk_payload():
+    """Returns the list of items posted to /users/bulk, either as a JSON array
+    or as NDJSON, aborting with 400 if the body is neither."""
+    if request.mimetype == NDJSON_MIMETYPE:
+        try:
+            return [
+                json.loads(line)
+                for line in request.get_data(as_text=True).splitlines()
+                if line.strip()
+            ]
+        except ValueError:
+            users_namespace.abort(400, "Invalid NDJSON payload.")
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        users_namespace.abort(400, "Expected a JSON array of users.")
+    return items
+
+
+class UsersBulk(Resource):
+    @users_namespace.expect([user])
+    @users_namespace.response(201, "Success", bulk_response)
+    @users_namespace.response(400, "No users were added.")
+    @users_namespace.response(413, "Too many users in one request.")
+    def post(self):
+        """Creates many users in one request."""
+        items = parse_bulk_payload()
+        max_items = current_app.config["USERS_BULK_MAX_ITEMS"]
+        if len(items) > max_items:
+            users_namespace.abort(413, f"At most {max_items} users per request.")
+
+        results = bulk_results(items)
+        existing = get_existing_emails(bulk_emails(results))
+        new_users = bulk_new_users(items, results, existing)
+        inserted = add_users(new_users) if new_users else set()
+        return bulk_summary(results, inserted)
+
+
+class Users(Resource):
+    # user model used as a serialiser to generate a JSON object from the model's fields.
+    @users_namespace.expect(user_parser)
+    @users_namespace.response(200, "Success", user)
+    @users_namespace.response(304, "Not Modified")
     @users_namespace.response(404, "User <user_id> does not exist.")
     def get(self, user_id):
-        """Returns a single user."""
-        user = get_user_by_id(user_id)
-        if not user:
+        """Returns a single user, or with ``fields`` just those of its fields."""
+        fields = user_parser.parse_args()["fields"]
+        if request.if_none_match or request.if_modified_since:
+            # answer revalidations from updated_at alone, without loading the row
+            updated_at = get_user_updated_at(user_id)
+            if updated_at is not None:
+                etag = user_etag(user_id, updated_at, fields)
+                if is_not_modified(etag, updated_at):
+                    return not_modified(validator_headers(etag, updated_at))
+
+        found = get_user_by_id(user_id, fields)
+        if not found:
             users_namespace.abort(404, f"User {user_id} does not exist")
-        return user, 200
+
+        headers = {}
+        updated_at = getattr(found, "updated_at", None)
+        if updated_at is not None:
+            etag = user_etag(user_id, updated_at, fields)
+            headers = validator_headers(etag, updated_at)
+        return json_response(serializer_for(fields)(found), 200, headers)
 
     @users_namespace.expect(user, validate=True)
     @users_namespace.response(200, "<user_id> was updated!")
@@ -79,41 +464,59 @@ class Users(Resource):
     def put(self, user_id):
         """Updates a user."""
         post_data = request.get_json()
-        username = post_data.get("username")
-        email = post_data.get("email")
-        response_object = {}
-
-        user = get_user_by_id(user_id)
-        if not user:
-            users_namespace.abort(404, f"User {user_id} does not exist")
-
-        if get_user_by_email(email):
-            response_object["message"] = "Sorry. That email already exists."
-            return response_object, 400
+        return write_user(
+            user_id,
+            username=post_data.get("username"),
+            email=post_data.get("email"),
+        )
 
-        update_user(user, username, email)
-
-        response_object["message"] = f"{user.id} was updated!"
-        return response_object, 200
+    @users_namespace.expect(user_patch, validate=True)
+    @users_namespace.response(200, "<user_id> was updated!")
+    @users_namespace.response(400, "Sorry. That email already exists.")
+    @users_namespace.response(404, "User <user_id> does not exist")
+    def patch(self, user_id):
+        """Updates some of a user's fields."""
+        post_data = request.get_json()
+        values = {
+            key: post_data[key] for key in ("username", "email") if key in post_data
+        }
+        if not values:
+            users_namespace.abort(400, "Nothing to update.")
+        return write_user(user_id, **values)
 
     @users_namespace.response(200, "<user_id> was removed!")
     @users_namespace.response(404, "User <user_id> does not exist")
     def delete(self, user_id):
         """Deletes a user."""
         response_object = {}
-        user = get_user_by_id(user_id)
+        email = delete_user(user_id)
 
-        if not user:
+        if email is None:
             users_namespace.abort(404, f"User {user_id} does not exist")
 
-        delete_user(user)
-
-        response_object["message"] = f"{user.email} was removed!"
+        response_object["message"] = f"{email} was removed!"
         return response_object, 200
 
 
+def write_user(user_id, **values):
+    # one UPDATE ... RETURNING: no row back means there is no such user
+    response_object = {}
+    try:
+        updated = update_user(user_id, **values)
+    except EmailAlreadyExists:
+        response_object["message"] = "Sorry. That email already exists."
+        return response_object, 400
+
+    if updated is None:
+        users_namespace.abort(404, f"User {user_id} does not exist")
+
+    response_object["message"] = f"{user_id} was updated!"
+    return response_object, 200
+
+
 # api.add_resource(UsersList, "/users")
 # api.add_resource(Users, "/users/<int:user_id>")
 
 users_namespace.add_resource(UsersList, "")
+users_namespace.add_resource(UsersBulk, "/bulk")
 users_namespace.add_resource(Users, "/<int:user_id>")
@@ -0,0 +1,70 @@
+# src/asgi/__init__.py
+
+# async serving mode: the /ping and /users API as an ASGI app on an async
+# connection pool, so a request waiting on Postgres does not hold a worker.
+#
+#   uvicorn --factory src.asgi:create_asgi_app
+#
+# needs the packages in requirements-async.txt.
+
+import contextlib
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.gzip import GZipMiddleware
+
+from src import create_app
+
+
+def create_asgi_app(flask_app=None):
+    """Builds the ASGI app from the config of flask_app, or of a new app
+    created the same way as for the sync server."""
+    from src.api import api
+    from src.api.users.cache import LRUCache, create_cache
+    from src.asgi.database import create_engine, create_sessionmaker
+    from src.asgi.views import HTTPError, http_error, routes
+
+    if flask_app is None:
+        flask_app = create_app()
+    config = flask_app.config
+    # the OpenAPI document of the sync app, so both modes share one contract
+    with flask_app.test_request_context():
+        swagger = api.__schema__
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        # asyncpg connections belong to the event loop that opened them, so the
+        # engine is created on the server's loop rather than at import time
+        engine = create_engine(
+            config["SQLALCHEMY_DATABASE_URI"], config["SQLALCHEMY_ENGINE_OPTIONS"]
+        )
+        app.state.sessionmaker = create_sessionmaker(engine)
+        try:
+            yield
+        finally:
+            await engine.dispose()
+
+    middleware = []
+    if config["COMPRESSION_ENABLED"]:
+        # gzip only; see src/compression.py for the sync app
+        middleware.append(
+            Middleware(
+                GZipMiddleware,
+                minimum_size=config["COMPRESSION_MIN_SIZE"],
+                compresslevel=config["COMPRESSION_GZIP_LEVEL"],
+            )
+        )
+    app = Starlette(
+        routes=routes,
+        middleware=middleware,
+        exception_handlers={HTTPError: http_error},
+        lifespan=lifespan,
+    )
+    app.state.config = config
+    app.state.swagger = swagger
+    app.state.cache = create_cache(config)
+    # the totals of count=cached, per process as in the sync app
+    app.state.count_cache = LRUCache(
+        config["USERS_COUNT_CACHE_MAXSIZE"], config["USERS_COUNT_CACHE_TTL"]
+    )
+    return app
@@ -0,0 +1,191 @@
+# src/asgi/crud.py
+
+# async counterparts of src/api/users/crud.py. Every function takes the
+# AsyncSession to run on, since there is no request-scoped session here.
+
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+from src.api.users.models import User, users_version
+
+from src.api.users.crud import (  # isort:skip
+    TABLE_ROWS_ESTIMATE,
+    EmailAlreadyExists,
+    count_key,
+    explain_rows,
+    filter_users,
+    insert_users,
+    is_duplicate_email,
+)
+
+
+async def commit_or_raise_duplicate(session, email):
+    try:
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if is_duplicate_email(e):
+            raise EmailAlreadyExists(email) from e
+        raise
+
+
+def users_select(fields=None, *required):
+    """Returns a select of whole users, or with fields (column names) of rows
+    of just those columns plus the required ones, see crud.users_query."""
+    if fields is None:
+        return select(User)
+    names = dict.fromkeys((*fields, *required))
+    return select(*(User.__table__.c[name] for name in names))
+
+
+async def fetch_users(session, query, fields=None):
+    result = await session.execute(query)
+    return result.scalars().all() if fields is None else result.all()
+
+
+async def get_all_users(session, filters=None, fields=None):
+    query = filter_users(users_select(fields), filters)
+    return await fetch_users(session, query, fields)
+
+
+async def get_users_page(session, limit, cursor=None, filters=None, fields=None):
+    # keyset pagination, see crud.get_users_page
+    query = users_select(fields, "created_date", "id")
+    query = filter_users(query.order_by(User.created_date, User.id), filters)
+    if cursor is not None:
+        query = query.where(tuple_(User.created_date, User.id) > tuple_(*cursor))
+    return await fetch_users(session, query.limit(limit), fields)
+
+
+async def iter_user_batches(session, batch_size, filters=None, fields=None):
+    # server-side cursor, fetched batch_size rows at a time
+    table = User.__table__
+    columns = [table.c[name] for name in fields] if fields else [table]
+    query = select(*columns).order_by(User.created_date, User.id)
+    result = await session.stream(filter_users(query, filters))
+    async for batch in result.partitions(batch_size):
+        yield batch
+
+
+async def get_user_by_id(session, user_id, fields=None):
+    """Returns the user, or a row of fields plus updated_at, or None."""
+    if fields is None:
+        return await session.get(User, user_id)
+    query = users_select(fields, "updated_at").where(User.id == user_id)
+    return (await session.execute(query)).first()
+
+
+async def get_users_by_ids(session, ids, fields=None):
+    """Returns {id: user} for those of ids that exist, in one IN query; with
+    fields, rows of those columns and id."""
+    query = users_select(fields, "id").where(User.id.in_(ids))
+    return {user.id: user for user in await fetch_users(session, query, fields)}
+
+
+async def get_user_updated_at(session, user_id):
+    query = select(User.updated_at).where(User.id == user_id)
+    return await session.scalar(query)
+
+
+async def get_users_version(session):
+    """Returns (changed_at, version) of the users table, see
+    crud.get_users_version."""
+    query = select(users_version.c.changed_at, users_version.c.version)
+    return (await session.execute(query)).one()
+
+
+async def count_users_exact(session, filters=None):
+    query = select(func.count()).select_from(User)
+    return await session.scalar(filter_users(query, filters))
+
+
+async def estimate_table_rows(session):
+    """Returns the planner's estimate of the rows in users, see
+    crud.estimate_table_rows."""
+    params = {"table": User.__tablename__}
+    rows = await session.scalar(TABLE_ROWS_ESTIMATE, params)
+    return None if rows is None else int(rows)
+
+
+async def estimate_count(session, query, exact_below=0):
+    """Returns the planner's estimate of the rows of query, a select over
+    users, or their exact count below exact_below, see crud.estimate_count."""
+    if query.whereclause is None:
+        estimate = await estimate_table_rows(session)
+    else:
+        connection = await session.connection()
+        estimate = await connection.run_sync(explain_rows, query)
+    if estimate is not None and estimate >= exact_below:
+        return estimate
+    count = query.with_only_columns(func.count(User.id)).order_by(None)
+    return await session.scalar(count)
+
+
+async def count_users(session, filters=None, mode="exact", exact_below=0, cache=None):
+    """Returns the number of users matching filters, see crud.count_users;
+    cache holds the totals of mode "cached"."""
+    if mode == "estimated":
+        query = filter_users(select(User), filters)
+        return await estimate_count(session, query, exact_below)
+    if mode == "cached":
+        key = count_key(filters)
+        total = cache.get(key)
+        if total is None:
+            total = await count_users_exact(session, filters)
+            cache.set(key, total)
+        return total
+    return await count_users_exact(session, filters)
+
+
+async def get_existing_emails(session, emails):
+    """Returns the lower-cased addresses among emails that are already taken."""
+    lowered = {email.lower() for email in emails}
+    query = select(func.lower(User.email)).where(func.lower(User.email).in_(lowered))
+    result = await session.execute(query)
+    return set(result.scalars())
+
+
+async def add_users(session, users):
+    """Inserts users in a single statement, see crud.add_users."""
+    result = await session.execute(insert_users(users))
+    inserted = set(result.scalars())
+    await session.commit()
+    return inserted
+
+
+async def add_user(session, username, email):
+    """Raises EmailAlreadyExists if another user has the same email."""
+    user = User(username, email)
+    session.add(user)
+    await commit_or_raise_duplicate(session, email)
+    return user
+
+
+async def update_user(session, user_id, **values):
+    """Updates one user in a single UPDATE ... RETURNING, see crud.update_user.
+
+    Raises EmailAlreadyExists if another user has the same email.
+    """
+    statement = (
+        update(User.__table__)
+        .where(User.id == user_id)
+        .values(**values)
+        .returning(*User.__table__.c)
+    )
+    try:
+        row = (await session.execute(statement)).first()
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        if is_duplicate_email(e):
+            raise EmailAlreadyExists(values.get("email")) from e
+        raise
+    return row
+
+
+async def delete_user(session, user_id):
+    """Returns the deleted user's email, or None if there is no such user."""
+    statement = delete(User.__table__).where(User.id == user_id).returning(User.email)
+    email = await session.scalar(statement)
+    await session.commit()
+    return email
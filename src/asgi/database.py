@@ -0,0 +1,69 @@
+# src/asgi/database.py
+
+# async engine for the ASGI app: asyncpg through SQLAlchemy's asyncio
+# extension, configured from the same SQLALCHEMY_ENGINE_OPTIONS as the sync app.
+
+import shlex
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout", "pool_recycle")
+
+
+def server_settings(startup_options):
+    """Turns libpq startup options ("-c name=value ...") into asyncpg's
+    server_settings dict."""
+    settings = {}
+    words = shlex.split(startup_options)
+    for flag, setting in zip(words, words[1:]):
+        if flag == "-c" and "=" in setting:
+            name, value = setting.split("=", 1)
+            settings[name] = value
+    return settings
+
+
+def async_engine_options(options):
+    """Maps SQLALCHEMY_ENGINE_OPTIONS onto create_async_engine() arguments.
+
+    Returns (options, transaction_statement_timeout). QueuePool subclasses are
+    not usable from asyncio, so a pooled config gets the default
+    AsyncAdaptedQueuePool with the same sizing.
+    """
+    async_options = {"pool_pre_ping": options.get("pool_pre_ping", False)}
+    connect_args = {}
+    if options.get("poolclass") is NullPool:
+        async_options["poolclass"] = NullPool
+        # PgBouncer in transaction mode cannot keep prepared statements around
+        connect_args["statement_cache_size"] = 0
+    else:
+        async_options.update(
+            (key, options[key]) for key in POOL_OPTIONS if key in options
+        )
+    startup = options.get("connect_args", {}).get("options")
+    if startup:
+        connect_args["server_settings"] = server_settings(startup)
+    if connect_args:
+        async_options["connect_args"] = connect_args
+    return async_options, options.get("transaction_statement_timeout")
+
+
+def create_engine(url, options):
+    engine_options, timeout = async_engine_options(options)
+    url = make_url(url).set(drivername="postgresql+asyncpg")
+    engine = create_async_engine(url, **engine_options)
+    if timeout:
+
+        @event.listens_for(engine.sync_engine, "begin")
+        def set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+    return engine
+
+
+def create_sessionmaker(engine):
+    # objects stay usable after commit, as responses are built from them
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,360 @@
+# src/asgi/views.py
+
+# the /ping and /users routes of src/api as Starlette endpoints. Requests are
+# validated against the same flask-restx models and answered with the same
+# bodies, status codes and headers.
+
+import json
+
+from jsonschema import Draft4Validator
+from starlette.concurrency import run_in_threadpool
+from starlette.endpoints import HTTPEndpoint
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_date, parse_etags
+
+from src.api.users.crud import EmailAlreadyExists
+from src.api.users.pagination import decode_cursor, encode_cursor, next_link
+from src.api.users.serializers import dumps
+from src.asgi import crud
+
+from src.api.users.validation import (  # isort:skip
+    bulk_emails,
+    bulk_new_users,
+    bulk_results,
+    bulk_summary,
+)
+
+from src.api.users.conditional import (  # isort:skip
+    check_preconditions,
+    make_etag,
+    validator_headers,
+)
+
+from src.api.users.views import (  # isort:skip
+    NDJSON_MIMETYPE,
+    invalid_ids_request,
+    list_filters,
+    ordered_users,
+    serializer_for,
+    user,
+    user_etag,
+    user_parser,
+    user_patch,
+    users_list_parser,
+)
+
+user_validator = Draft4Validator(user.__schema__)
+patch_validator = Draft4Validator(user_patch.__schema__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body = {"message": message, **extra}
+
+
+def json_response(data, status=200, headers=None):
+    # the same body flask-restx's output_json writes, terminated by a newline
+    return Response(dumps(data) + "\n", status, headers, media_type="application/json")
+
+
+def http_error(request, exc):
+    return json_response(exc.body, exc.status)
+
+
+async def read_payload(request, model=user, validator=user_validator):
+    """Returns the JSON body validated against model, as
+    @expect(model, validate=True) does."""
+    try:
+        data = json.loads(await request.body())
+    except ValueError:
+        raise HTTPError(400, "Failed to decode JSON object")
+    if not validator.is_valid(data):
+        errors = dict(map(model.format_error, validator.iter_errors(data)))
+        raise HTTPError(400, "Input payload validation failed", errors=errors)
+    return data
+
+
+def parse_args(request, parser):
+    """Parses the query string with the types of a flask-restx parser, such as
+    users_list_parser, answering 400 for malformed values as parse_args()
+    does."""
+    args = {}
+    for argument in parser.args:
+        value = request.query_params.get(argument.name)
+        if value is None:
+            args[argument.name] = argument.default
+            continue
+        try:
+            args[argument.name] = argument.type(value)
+        except ValueError as e:
+            errors = {argument.name: f"{argument.help} {e}"}
+            raise HTTPError(400, "Input payload validation failed", errors=errors)
+    return args
+
+
+def preconditions_met(request, etag, last_modified):
+    """True if the client's copy is current, see conditional.is_not_modified."""
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    return check_preconditions(
+        parse_etags(if_none_match) if if_none_match else None,
+        parse_date(if_modified_since),
+        etag,
+        last_modified,
+    )
+
+
+def not_modified(headers):
+    return Response(status_code=304, headers=headers)
+
+
+def session(request):
+    return request.app.state.sessionmaker()
+
+
+async def invalidate_user(request, user_id):
+    # the shared cache of the sync app, so its workers do not serve stale users
+    cache = request.app.state.cache
+    if cache is not None:
+        await run_in_threadpool(cache.delete, user_id)
+
+
+async def ping(request):
+    return json_response({"status": "success", "message": "pong"})
+
+
+async def swagger(request):
+    return json_response(request.app.state.swagger)
+
+
+class UsersList(HTTPEndpoint):
+    async def post(self, request):
+        data = await read_payload(request)
+        async with session(request) as db:
+            try:
+                await crud.add_user(db, data.get("username"), data.get("email"))
+            except EmailAlreadyExists:
+                return json_response(
+                    {"message": "Sorry. That email already exists."}, 400
+                )
+        return json_response({"message": f"{data.get('email')} was added!"}, 201)
+
+    async def get(self, request):
+        config = request.app.state.config
+        args = parse_args(request, users_list_parser)
+        fields = args["fields"]
+        serialize = serializer_for(fields)
+        if args["ids"] is not None:
+            message = invalid_ids_request(args, config)
+            if message:
+                raise HTTPError(400, message)
+            ids = list(dict.fromkeys(args["ids"]))
+            async with session(request) as db:
+                found = await crud.get_users_by_ids(db, ids, fields)
+            users, headers = ordered_users(ids, found, serialize)
+            return json_response(users, 200, headers)
+
+        filters = list_filters(args)
+        best = accept_collection(request)
+        if best == NDJSON_MIMETYPE:
+            headers = await collection_validators(request, best)
+            if isinstance(headers, Response):
+                return headers
+            if args["count"]:
+                headers.update(await total_count(request, filters, args["count"]))
+            return stream_users(request, headers, filters, fields)
+
+        limit = args["limit"]
+        if limit is None:
+            limit = config["USERS_PAGE_DEFAULT_LIMIT"]
+        max_limit = config["USERS_PAGE_MAX_LIMIT"]
+        if not 1 <= limit <= max_limit:
+            raise HTTPError(400, f"limit must be between 1 and {max_limit}")
+
+        cursor = None
+        if args["cursor"]:
+            try:
+                cursor = decode_cursor(args["cursor"])
+            except ValueError:
+                raise HTTPError(400, "Invalid cursor.")
+
+        headers = await collection_validators(request, best)
+        if isinstance(headers, Response):
+            return headers
+        if args["count"]:
+            headers.update(await total_count(request, filters, args["count"]))
+
+        async with session(request) as db:
+            if args["all"]:
+                users = await crud.get_all_users(db, filters, fields)
+                return json_response(list(map(serialize, users)), 200, headers)
+
+            # fetch one extra row to find out whether there is a next page
+            users = await crud.get_users_page(db, limit + 1, cursor, filters, fields)
+        if len(users) > limit:
+            users = users[:limit]
+            token = encode_cursor(users[-1].created_date, users[-1].id)
+            base_url = str(request.url.replace(query=""))
+            headers["X-Next-Cursor"] = token
+            headers["Link"] = next_link(base_url, request.query_params, token)
+        return json_response(list(map(serialize, users)), 200, headers)
+
+    async def head(self, request):
+        """Returns the headers of GET /users, with X-Total-Count, and no body,
+        see views.UsersList.head."""
+        args = parse_args(request, users_list_parser)
+        filters = list_filters(args)
+        best = accept_collection(request)
+        headers = await collection_validators(request, best)
+        if isinstance(headers, Response):
+            return headers
+        mode = args["count"] or request.app.state.config["USERS_COUNT_MODE"]
+        headers.update(await total_count(request, filters, mode))
+        # an empty iterator, so no Content-Length: 0 is sent, as in the sync app
+        return StreamingResponse(iter(()), headers=headers, media_type=best)
+
+
+def accept_collection(request):
+    accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+    return accept.best_match(["application/json", NDJSON_MIMETYPE])
+
+
+async def total_count(request, filters, mode):
+    """Returns the X-Total-Count header, see views.total_count."""
+    exact_below = request.app.state.config["USERS_COUNT_EXACT_BELOW"]
+    cache = request.app.state.count_cache
+    async with session(request) as db:
+        total = await crud.count_users(db, filters, mode, exact_below, cache)
+    return {"X-Total-Count": str(total)}
+
+
+async def collection_validators(request, mimetype):
+    """Returns the collection's validator headers, or a 304 response, see
+    views.collection_validators."""
+    async with session(request) as db:
+        last_modified, number = await crud.get_users_version(db)
+    query_string = request.url.query.encode()
+    etag = make_etag(number, mimetype, query_string)
+    headers = validator_headers(etag, last_modified)
+    if preconditions_met(request, etag, last_modified):
+        return not_modified(headers)
+    return headers
+
+
+def stream_users(request, headers, filters, fields=None):
+    batch_size = request.app.state.config["USERS_STREAM_BATCH_SIZE"]
+    serialize = serializer_for(fields)
+
+    async def generate():
+        # the session lives as long as the response body, not the endpoint
+        async with session(request) as db:
+            batches = crud.iter_user_batches(db, batch_size, filters, fields)
+            async for batch in batches:
+                yield "".join(dumps(serialize(row)) + "\n" for row in batch)
+
+    return StreamingResponse(generate(), headers=headers, media_type=NDJSON_MIMETYPE)
+
+
+async def parse_bulk_payload(request):
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith(NDJSON_MIMETYPE):
+            return [json.loads(line) for line in body.splitlines() if line.strip()]
+    except ValueError:
+        raise HTTPError(400, "Invalid NDJSON payload.")
+    try:
+        items = json.loads(body)
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise HTTPError(400, "Expected a JSON array of users.")
+    return items
+
+
+async def bulk_add_users(request):
+    items = await parse_bulk_payload(request)
+    config = request.app.state.config
+    max_items = config["USERS_BULK_MAX_ITEMS"]
+    if len(items) > max_items:
+        raise HTTPError(413, f"At most {max_items} users per request.")
+
+    results = bulk_results(items)
+    async with session(request) as db:
+        existing = await crud.get_existing_emails(db, bulk_emails(results))
+        new_users = bulk_new_users(items, results, existing)
+        inserted = await crud.add_users(db, new_users) if new_users else set()
+    return json_response(*bulk_summary(results, inserted))
+
+
+class Users(HTTPEndpoint):
+    async def get(self, request):
+        user_id = request.path_params["user_id"]
+        fields = parse_args(request, user_parser)["fields"]
+        async with session(request) as db:
+            if "if-none-match" in request.headers or (
+                "if-modified-since" in request.headers
+            ):
+                # answer revalidations from updated_at alone
+                updated_at = await crud.get_user_updated_at(db, user_id)
+                if updated_at is not None:
+                    etag = user_etag(user_id, updated_at, fields)
+                    if preconditions_met(request, etag, updated_at):
+                        return not_modified(validator_headers(etag, updated_at))
+
+            found = await crud.get_user_by_id(db, user_id, fields)
+        if not found:
+            raise HTTPError(404, f"User {user_id} does not exist")
+
+        headers = {}
+        if found.updated_at is not None:
+            etag = user_etag(user_id, found.updated_at, fields)
+            headers = validator_headers(etag, found.updated_at)
+        return json_response(serializer_for(fields)(found), 200, headers)
+
+    async def put(self, request):
+        data = await read_payload(request)
+        return await write_user(
+            request, username=data.get("username"), email=data.get("email")
+        )
+
+    async def patch(self, request):
+        data = await read_payload(request, user_patch, patch_validator)
+        values = {key: data[key] for key in ("username", "email") if key in data}
+        if not values:
+            raise HTTPError(400, "Nothing to update.")
+        return await write_user(request, **values)
+
+    async def delete(self, request):
+        user_id = request.path_params["user_id"]
+        async with session(request) as db:
+            email = await crud.delete_user(db, user_id)
+        if email is None:
+            raise HTTPError(404, f"User {user_id} does not exist")
+        await invalidate_user(request, user_id)
+        return json_response({"message": f"{email} was removed!"})
+
+
+async def write_user(request, **values):
+    user_id = request.path_params["user_id"]
+    async with session(request) as db:
+        try:
+            updated = await crud.update_user(db, user_id, **values)
+        except EmailAlreadyExists:
+            return json_response({"message": "Sorry. That email already exists."}, 400)
+    if updated is None:
+        raise HTTPError(404, f"User {user_id} does not exist")
+    await invalidate_user(request, user_id)
+    return json_response({"message": f"{user_id} was updated!"})
+
+
+routes = [
+    Route("/ping", ping, methods=["GET"]),
+    Route("/swagger.json", swagger, methods=["GET"]),
+    Route("/users", UsersList),
+    Route("/users/bulk", bulk_add_users, methods=["POST"]),
+    Route("/users/{user_id:int}", Users),
+]
@@ -0,0 +1,160 @@
+# src/compression.py
+
+# negotiated response compression, enabled with COMPRESSION_ENABLED. Responses
+# of a textual type (JSON, NDJSON, HTML, ...) are encoded with the best of br,
+# zstd and gzip that the client's Accept-Encoding allows, once they reach
+# COMPRESSION_MIN_SIZE bytes; brotli and zstd are only offered when their
+# packages are installed. Streamed responses are compressed chunk by chunk and
+# flushed after each one, so the client still gets rows as they are read.
+#
+# Turn it off where a proxy in front of the app already compresses.
+
+import zlib
+from functools import partial
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional speed-up
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional speed-up
+    zstandard = None
+
+COMPRESSIBLE_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS writes the gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def available_encoders(config):
+    """Returns {encoding: encoder factory} for the installed codecs, in order of
+    preference, each set to its configured level."""
+    encoders = {}
+    if brotli is not None:
+        encoders["br"] = partial(BrotliEncoder, config["COMPRESSION_BROTLI_LEVEL"])
+    if zstandard is not None:
+        encoders["zstd"] = partial(ZstdEncoder, config["COMPRESSION_ZSTD_LEVEL"])
+    encoders["gzip"] = partial(GzipEncoder, config["COMPRESSION_GZIP_LEVEL"])
+    return encoders
+
+
+def choose_encoding(accept_encodings, encodings):
+    """Returns the one of encodings the client rates highest in
+    accept_encodings (a werkzeug Accept), the earliest on a tie, or None if it
+    accepts none of them."""
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(mimetype):
+    return (
+        mimetype.startswith("text/")
+        or mimetype.endswith("+json")
+        or mimetype in COMPRESSIBLE_TYPES
+    )
+
+
+def compress_chunks(chunks, encoder):
+    for chunk in chunks:
+        data = encoder.compress(chunk) + encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def compress(response):
+    if (
+        request.method == "HEAD"
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or "no-transform" in response.headers.get("Cache-Control", "")
+        or not is_compressible(response.mimetype or "")
+    ):
+        return response
+    # the body depends on Accept-Encoding whether or not this one is encoded
+    response.vary.add("Accept-Encoding")
+
+    config = current_app.config
+    encoders = available_encoders(config)
+    encoding = choose_encoding(request.accept_encodings, encoders)
+    if encoding is None:
+        return response
+    encoder = encoders[encoding]()
+    if response.is_streamed:
+        response.response = compress_chunks(response.iter_encoded(), encoder)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESSION_MIN_SIZE"]:
+            return response
+        response.set_data(encoder.compress(data) + encoder.finish())
+    response.headers["Content-Encoding"] = encoding
+
+    # the encoded body is no longer byte-for-byte what the strong ETag named;
+    # If-None-Match is compared weakly, so 304s keep working
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    if not app.config["COMPRESSION_ENABLED"]:
+        return
+    app.after_request(compress)
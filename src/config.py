@@ -3,11 +3,131 @@
 
 import os
 
+from sqlalchemy.pool import NullPool
+
+from src.database import TimedQueuePool
+
+
+def env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def engine_options():
+    """SQLALCHEMY_ENGINE_OPTIONS for Postgres, tunable through DB_* variables."""
+    # milliseconds; 0 disables the timeout
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+    if env_flag("DB_PGBOUNCER_TRANSACTION_MODE", "false"):
+        # PgBouncer already pools server connections, so a second pool here
+        # would only hold them idle, and it does not forward startup options
+        return {
+            "poolclass": NullPool,
+            "transaction_statement_timeout": statement_timeout,
+        }
+
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        # recycle before server/load balancer idle timeouts drop connections,
+        # and test them on checkout so a failover does not surface as errors
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", "true"),
+    }
+    if statement_timeout:
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={statement_timeout}"
+        }
+    return options
+
+
+def path_set(value):
+    return {path.strip() for path in value.split(",") if path.strip()}
+
+
+def database_urls(value):
+    urls = [url.strip() for url in (value or "").split(",") if url.strip()]
+    return [
+        url.replace("postgres://", "postgresql://", 1)
+        if url.startswith("postgres://")
+        else url
+        for url in urls
+    ]
+
 
 class BaseConfig:
     TESTING = False
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+    # read replicas for GET/HEAD requests, comma separated
+    DATABASE_REPLICA_URLS = database_urls(os.getenv("DATABASE_REPLICA_URLS"))
+    DATABASE_REPLICA_CONNECT_TIMEOUT = int(
+        os.getenv("DATABASE_REPLICA_CONNECT_TIMEOUT", "2")
+    )
+    DATABASE_REPLICA_RETRY_SECONDS = int(
+        os.getenv("DATABASE_REPLICA_RETRY_SECONDS", "30")
+    )
+    DATABASE_REPLICA_STICKY_SECONDS = int(
+        os.getenv("DATABASE_REPLICA_STICKY_SECONDS", "5")
+    )
     SECRET_KEY = "my_precious"
+    # request/SQL timing, Server-Timing headers and the /metrics endpoint
+    METRICS_ENABLED = env_flag("METRICS_ENABLED", "false")
+    # gzip (and br/zstd when installed) for textual responses the client
+    # accepts it for; off where a proxy in front already compresses
+    COMPRESSION_ENABLED = env_flag("COMPRESSION_ENABLED", "true")
+    # bytes; smaller bodies gain less than the encoding costs
+    COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_LEVEL = int(os.getenv("COMPRESSION_BROTLI_LEVEL", "4"))
+    COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+    # per-client rate limits and per-route in-flight caps, see src/admission.py
+    ADMISSION_ENABLED = env_flag("ADMISSION_ENABLED", "false")
+    # requests per second per client, with bursts of up to ADMISSION_BURST;
+    # a rate of 0 turns rate limiting off
+    ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "50"))
+    ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "100"))
+    # "memory" (per process) or "redis" (shared, at ADMISSION_STORE_URL)
+    ADMISSION_STORE = os.getenv("ADMISSION_STORE", "memory")
+    ADMISSION_STORE_URL = os.getenv("ADMISSION_STORE_URL")
+    ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))
+    # clients are told apart by this header when sent, else by address
+    ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER")
+    # requests running at once per route and process, past which new ones get
+    # a 503. Below the 15 threads of a default gthread worker (one per pooled
+    # connection), or the cap could never be reached
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "10"))
+    # per-route overrides, e.g. "/users/bulk=2"
+    ADMISSION_ROUTE_LIMITS = os.getenv("ADMISSION_ROUTE_LIMITS")
+    # milliseconds a request may have waited since the proxy received it, per
+    # ADMISSION_QUEUE_HEADER, before it gets a 503; 0 turns the check off
+    ADMISSION_MAX_QUEUE_MS = int(os.getenv("ADMISSION_MAX_QUEUE_MS", "0"))
+    ADMISSION_QUEUE_HEADER = os.getenv("ADMISSION_QUEUE_HEADER", "X-Request-Start")
+    ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+    ADMISSION_EXEMPT_PATHS = path_set(
+        os.getenv("ADMISSION_EXEMPT_PATHS", "/ping,/metrics")
+    )
+    # list queries of the admin users view are cancelled after this long;
+    # 0 leaves them to the connection's statement_timeout
+    ADMIN_STATEMENT_TIMEOUT_MS = int(os.getenv("ADMIN_STATEMENT_TIMEOUT_MS", "5000"))
+    USERS_PAGE_DEFAULT_LIMIT = int(os.getenv("USERS_PAGE_DEFAULT_LIMIT", "100"))
+    USERS_PAGE_MAX_LIMIT = int(os.getenv("USERS_PAGE_MAX_LIMIT", "1000"))
+    # most ids one GET /users?ids= request may ask for
+    USERS_BATCH_MAX_IDS = int(os.getenv("USERS_BATCH_MAX_IDS", "1000"))
+    # how HEAD /users counts by default: exact, estimated or cached
+    USERS_COUNT_MODE = os.getenv("USERS_COUNT_MODE", "estimated")
+    # estimates below this are replaced by an exact count, which is cheap there
+    USERS_COUNT_EXACT_BELOW = int(os.getenv("USERS_COUNT_EXACT_BELOW", "1000"))
+    USERS_COUNT_CACHE_TTL = int(os.getenv("USERS_COUNT_CACHE_TTL", "60"))
+    USERS_COUNT_CACHE_MAXSIZE = int(os.getenv("USERS_COUNT_CACHE_MAXSIZE", "1024"))
+    USERS_STREAM_BATCH_SIZE = int(os.getenv("USERS_STREAM_BATCH_SIZE", "1000"))
+    USERS_BULK_MAX_ITEMS = int(os.getenv("USERS_BULK_MAX_ITEMS", "10000"))
+    # single-user cache: unset (disabled), "memory" or "redis"
+    USERS_CACHE_BACKEND = os.getenv("USERS_CACHE_BACKEND")
+    USERS_CACHE_URL = os.getenv("USERS_CACHE_URL")
+    USERS_CACHE_MAXSIZE = int(os.getenv("USERS_CACHE_MAXSIZE", "10000"))
+    USERS_CACHE_TTL = int(os.getenv("USERS_CACHE_TTL", "60"))
 
 
 class DevelopmentConfig(BaseConfig):
@@ -0,0 +1,113 @@
+# src/database.py
+
+# engine-level plumbing for the shared SQLAlchemy instance: a pool that times
+# how long checkouts wait for a free connection, per-transaction statement
+# timeouts for deployments behind PgBouncer, and the SQL migration runner.
+
+import os
+import threading
+import time
+
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "db", "migrations")
+
+
+class PoolStats:
+    """Running totals of connection pool checkout wait times, in seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_seconds_total": self.wait_total,
+                "wait_seconds_max": self.wait_max,
+            }
+
+
+# per process; exported on /metrics as db_pool_checkouts_total and
+# db_pool_wait_seconds_total/_max when METRICS_ENABLED (see src/metrics.py)
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited for a connection
+    (including opening a new one), so the pool can be sized from data."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record(time.perf_counter() - start)
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def create_engine(self, sa_url, engine_opts):
+        # not a create_engine() argument: with PgBouncer in transaction pooling
+        # mode a session-level timeout would leak to other clients sharing the
+        # server connection, so it is applied with SET LOCAL in every transaction
+        engine_opts = dict(engine_opts)
+        timeout = engine_opts.pop("transaction_statement_timeout", None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if timeout:
+
+            @event.listens_for(engine, "begin")
+            def set_statement_timeout(conn):
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+        return engine
+
+
+def sql_statements(script):
+    """Splits a SQL script into statements, dropping -- comment lines. A ; in
+    a $$-quoted function body does not end the statement."""
+    lines = [line for line in script.splitlines() if not line.lstrip().startswith("--")]
+    statements, current = [], ""
+    for part in "\n".join(lines).split(";"):
+        current += part
+        if current.count("$$") % 2:
+            current += ";"
+            continue
+        if current.strip():
+            statements.append(current.strip())
+        current = ""
+    return statements
+
+
+def run_migrations(engine, directory=MIGRATIONS_DIR):
+    """Runs every .sql file in directory in name order. The scripts are
+    idempotent; each statement is committed on its own, as CREATE INDEX
+    CONCURRENTLY cannot run inside a transaction block."""
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".sql"))
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # index builds on a large table outlast the app's statement_timeout, and
+        # a cancelled CREATE INDEX CONCURRENTLY leaves an INVALID index behind
+        conn.exec_driver_sql("SET statement_timeout = 0")
+        try:
+            for name in names:
+                with open(os.path.join(directory, name)) as f:
+                    for statement in sql_statements(f.read()):
+                        conn.exec_driver_sql(statement)
+        finally:
+            # back to the connection's own setting before it returns to the pool
+            conn.exec_driver_sql("RESET statement_timeout")
+    return names
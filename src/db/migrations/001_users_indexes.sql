@@ -0,0 +1,26 @@
+-- src/db/migrations/001_users_indexes.sql
+
+-- brings a users table created before these columns and indexes were added to
+-- the model up to date. Safe to re-run. Indexes are built CONCURRENTLY so the
+-- table stays writable; each statement runs in its own transaction. A build
+-- that fails leaves an INVALID index behind, which IF NOT EXISTS would then
+-- skip: drop it before running this again.
+
+-- fast default (no table rewrite) on Postgres 11+: existing rows get the time
+-- of the migration
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now();
+
+-- fails if two users already share an email up to case; merge them first
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_lower ON users (lower(email));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_created_date_id ON users (created_date, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_updated_at ON users (updated_at);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_username_prefix ON users (lower(username) text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_email_prefix ON users (lower(email) text_pattern_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_inactive_created_date_id ON users (created_date, id) WHERE NOT active;
+
+ANALYZE users;
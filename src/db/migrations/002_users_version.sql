@@ -0,0 +1,44 @@
+-- src/db/migrations/002_users_version.sql
+
+-- adds the users_version row that GET /users derives its ETag and
+-- Last-Modified from, and the triggers on users that move it once per
+-- transaction that inserts, updates, deletes or truncates rows, at commit (see
+-- src/api/users/models.py). Safe to re-run; replaces earlier versions of the
+-- triggers.
+
+CREATE TABLE IF NOT EXISTS users_version (
+    id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL,
+    changed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+INSERT INTO users_version (id, version, changed_at)
+VALUES (1, 1, timezone('utc', now())) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_users_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_LEVEL = 'ROW' THEN
+        IF current_setting('users_version.bumped', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        PERFORM set_config('users_version.bumped', 'on', true);
+    END IF;
+    UPDATE users_version
+    SET version = version + 1,
+        changed_at = greatest(changed_at, timezone('utc', clock_timestamp()));
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_version_bump ON users;
+
+CREATE CONSTRAINT TRIGGER users_version_bump
+AFTER INSERT OR UPDATE OR DELETE ON users
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW EXECUTE FUNCTION bump_users_version();
+
+DROP TRIGGER IF EXISTS users_version_truncate ON users;
+
+CREATE TRIGGER users_version_truncate
+AFTER TRUNCATE ON users
+FOR EACH STATEMENT EXECUTE FUNCTION bump_users_version();
@@ -0,0 +1,137 @@
+# src/gunicorn_conf.py
+
+# gunicorn settings for production:
+#
+#   gunicorn -c python:src.gunicorn_conf src.wsgi:app
+#   GUNICORN_WORKER_CLASS=uvicorn gunicorn -c python:src.gunicorn_conf \
+#       "src.asgi:create_asgi_app()"
+#
+# Worker and thread counts follow from the CPUs the container may use and the
+# size of each worker's connection pool, so that every thread can get a
+# connection and the workers together stay within DB_MAX_CONNECTIONS. Every
+# setting can be overridden through the environment.
+
+import math
+import os
+import sys
+
+from src.config import engine_options, env_flag
+
+# short names for GUNICORN_WORKER_CLASS
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    # async, for the ASGI app in src/asgi (requirements-async.txt)
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+
+
+def cgroup_cpu_limit(root="/sys/fs/cgroup"):
+    """Returns the CPU quota of the container (e.g. 1.5), or None if unlimited."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()
+    except OSError:
+        try:
+            # cgroup v1: a quota of -1 means unlimited
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = f.read().strip()
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+                period = f.read().strip()
+        except OSError:
+            return None
+    if quota in ("max", "-1"):
+        return None
+    return int(quota) / int(period)
+
+
+def available_cpus(cgroup_root="/sys/fs/cgroup"):
+    """CPUs this process may run on, capped by the container's CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on macOS
+        cpus = os.cpu_count() or 1
+    limit = cgroup_cpu_limit(cgroup_root)
+    if limit:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return cpus
+
+
+def worker_settings(cpus, worker_class, pool_capacity, max_connections=None):
+    """Returns (workers, threads) for cpus CPUs.
+
+    pool_capacity is the most connections one worker's pool opens
+    (pool_size + max_overflow), or None when it is not pooled.
+
+    - sync: 2 * cpus + 1 single-threaded workers, the usual gunicorn advice;
+      each uses one connection at a time.
+    - gthread: one worker per CPU, as the GIL keeps a process on one core,
+      with a thread per pooled connection to overlap database waits.
+    - uvicorn: one event loop per CPU, which can use its whole pool.
+
+    With max_connections the number of workers is lowered until all of them
+    together cannot open more than that.
+    """
+    if worker_class == "sync":
+        workers, threads, connections = 2 * cpus + 1, 1, 1
+    elif worker_class == "gthread":
+        workers = cpus
+        threads = connections = pool_capacity or 4
+    else:
+        workers, threads, connections = cpus, 1, pool_capacity or 1
+    if max_connections:
+        workers = max(1, min(workers, max_connections // connections))
+    return workers, threads
+
+
+def pool_capacity(options):
+    if "pool_size" not in options:  # NullPool behind PgBouncer
+        return None
+    return options["pool_size"] + options["max_overflow"]
+
+
+worker_class = WORKER_CLASSES[os.getenv("GUNICORN_WORKER_CLASS", "gthread")]
+workers, threads = worker_settings(
+    available_cpus(),
+    os.getenv("GUNICORN_WORKER_CLASS", "gthread"),
+    pool_capacity(engine_options()),
+    int(os.getenv("DB_MAX_CONNECTIONS", "0")),
+)
+# WEB_CONCURRENCY is what Heroku and most platforms set for the worker count
+workers = int(os.getenv("WEB_CONCURRENCY", workers))
+threads = int(os.getenv("GUNICORN_THREADS", threads))
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# load the app once in the master and fork the workers from it, see src/wsgi.py
+preload_app = env_flag("GUNICORN_PRELOAD", "true")
+
+# restart workers after a number of requests to bound slow memory growth; the
+# jitter keeps them from all restarting at the same moment
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# workers that do not notify the master for this long are killed and restarted.
+# A sync worker only notifies between requests, so for it this is a request
+# time limit, longer than the default 30 s statement timeout so that a slow
+# query fails with an error response first. gthread and async workers notify
+# from their main thread or event loop while requests run, so there it only
+# catches a hung worker (a blocked event loop, a stuck main thread); their
+# requests are bounded by the statement and pool timeouts instead.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "35"))
+# time in-flight requests get to finish on shutdown or restart
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# the worker heartbeat file; on a disk-backed /tmp in a container, writes to it
+# can block long enough to get workers killed
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+
+def post_fork(server, worker):
+    # a preloaded app's engines were created in the master; connections must
+    # not be shared between processes
+    if "src.wsgi" in sys.modules:
+        sys.modules["src.wsgi"].reset_after_fork()
@@ -0,0 +1,244 @@
+# src/metrics.py
+
+# per-request instrumentation, enabled with METRICS_ENABLED. For every route
+# and method it records a request duration histogram plus the number of SQL
+# statements and the time spent in them (from SQLAlchemy engine events), sends
+# the request's own figures back in a Server-Timing header and exposes the
+# totals in the Prometheus text format on /metrics. Streamed responses are
+# recorded when they close, so their figures include reading the body. When
+# disabled, init_app registers nothing, so requests run exactly as without it.
+#
+# Figures are kept per process; scrape every worker, or run one per container.
+
+import bisect
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.database import pool_stats
+
+# seconds; the Prometheus client's default buckets
+BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_listening = False
+_listen_lock = threading.Lock()
+
+
+class RouteMetrics:
+    """Request and SQL totals for one (route, method) pair."""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.query_time = 0.0
+
+    def observe(self, duration, queries, query_time):
+        index = bisect.bisect_left(BUCKETS, duration)
+        if index < len(BUCKETS):
+            self.buckets[index] += 1
+        self.count += 1
+        self.duration += duration
+        self.queries += queries
+        self.query_time += query_time
+
+
+class Metrics:
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, duration, queries, query_time):
+        with self._lock:
+            key = (route, method)
+            if key not in self.routes:
+                self.routes[key] = RouteMetrics()
+            self.routes[key].observe(duration, queries, query_time)
+
+    def render(self, cache_stats=None, admission_stats=None):
+        """Returns every figure in the Prometheus text exposition format."""
+        lines = [
+            "# HELP http_request_duration_seconds Time spent handling requests.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        with self._lock:
+            routes = sorted(self.routes.items())
+            for (route, method), stats in routes:
+                labels = f'route="{escape(route)}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(
+                        f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} '
+                        f"{cumulative}"
+                    )
+                lines += [
+                    f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+                    f"{stats.count}",
+                    f"http_request_duration_seconds_sum{{{labels}}} {stats.duration}",
+                    f"http_request_duration_seconds_count{{{labels}}} {stats.count}",
+                ]
+            lines += [
+                "# HELP db_queries_total SQL statements executed while handling requests.",
+                "# TYPE db_queries_total counter",
+            ]
+            for (route, method), stats in routes:
+                labels = f'route="{escape(route)}",method="{method}"'
+                lines.append(f"db_queries_total{{{labels}}} {stats.queries}")
+            lines += [
+                "# HELP db_query_duration_seconds_total Time spent in SQL statements.",
+                "# TYPE db_query_duration_seconds_total counter",
+            ]
+            for (route, method), stats in routes:
+                labels = f'route="{escape(route)}",method="{method}"'
+                lines.append(
+                    f"db_query_duration_seconds_total{{{labels}}} {stats.query_time}"
+                )
+
+        pool = pool_stats.snapshot()
+        lines += [
+            "# HELP db_pool_checkouts_total Connections checked out of the pool.",
+            "# TYPE db_pool_checkouts_total counter",
+            f"db_pool_checkouts_total {pool['checkouts']}",
+            "# HELP db_pool_wait_seconds_total Time spent waiting for a connection.",
+            "# TYPE db_pool_wait_seconds_total counter",
+            f"db_pool_wait_seconds_total {pool['wait_seconds_total']}",
+            "# HELP db_pool_wait_seconds_max Longest wait for a connection.",
+            "# TYPE db_pool_wait_seconds_max gauge",
+            f"db_pool_wait_seconds_max {pool['wait_seconds_max']}",
+        ]
+        if cache_stats is not None:
+            for name in ("hits", "misses", "evictions"):
+                lines += [
+                    f"# TYPE users_cache_{name}_total counter",
+                    f"users_cache_{name}_total {cache_stats[name]}",
+                ]
+            if "size" in cache_stats:
+                lines += [
+                    "# TYPE users_cache_size gauge",
+                    f"users_cache_size {cache_stats['size']}",
+                ]
+        if admission_stats is not None:
+            lines += [
+                "# HELP admission_rejected_total Requests turned away before running.",
+                "# TYPE admission_rejected_total counter",
+                f'admission_rejected_total{{reason="rate_limited"}} '
+                f'{admission_stats["rate_limited"]}',
+                f'admission_rejected_total{{reason="shed"}} {admission_stats["shed"]}',
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "metrics_start" in g:
+        conn.info["metrics_query_start"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("metrics_query_start", None)
+    if start is not None and has_request_context() and "metrics_start" in g:
+        g.metrics_query_time += time.perf_counter() - start
+        g.metrics_queries += 1
+
+
+def start_timer():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+
+
+def record(response):
+    if "metrics_start" not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    metrics = current_app.extensions["metrics"]
+    if response.is_streamed:
+        # the body, and the queries reading it, run after this hook; the
+        # request is observed once the response is closed, and gets no
+        # Server-Timing header, which would only cover the time to the headers
+        state, method = g._get_current_object(), request.method
+        start = state.metrics_start
+
+        def observe_stream():
+            duration = time.perf_counter() - start
+            queries, query_time = state.metrics_queries, state.metrics_query_time
+            metrics.observe(route, method, duration, queries, query_time)
+
+        response.call_on_close(observe_stream)
+        return response
+
+    duration = time.perf_counter() - g.pop("metrics_start")
+    queries = g.pop("metrics_queries")
+    query_time = g.pop("metrics_query_time")
+    metrics.observe(route, request.method, duration, queries, query_time)
+    # total and SQL time of this request; the difference is spent in Python
+    # (routing, validation, serialization)
+    response.headers.add(
+        "Server-Timing",
+        f'app;dur={duration * 1000:.2f}, db;dur={query_time * 1000:.2f};desc="{queries} queries"',
+    )
+    return response
+
+
+def discard_timer(exc):
+    # requests that failed before after_request ran, and streamed ones once
+    # their body has been read
+    g.pop("metrics_start", None)
+
+
+def metrics_view():
+    from src.admission import get_admission
+    from src.api.users.cache import get_cache
+
+    cache = get_cache()
+    admission = get_admission()
+    body = current_app.extensions["metrics"].render(
+        cache.stats() if cache else None,
+        admission.stats() if admission else None,
+    )
+    return current_app.response_class(body, mimetype=None, content_type=CONTENT_TYPE)
+
+
+def listen_to_engines():
+    # on the Engine class so replica engines created later are covered too
+    global _listening
+    with _listen_lock:
+        if not _listening:
+            event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+            _listening = True
+
+
+def init_app(app):
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.extensions["metrics"] = Metrics()
+    listen_to_engines()
+    app.before_request(start_timer)
+    app.after_request(record)
+    app.teardown_request(discard_timer)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
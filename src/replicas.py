@@ -0,0 +1,129 @@
+# src/replicas.py
+
+# routes read-only queries to read replicas. GET/HEAD requests read through a
+# replica picked round-robin among the healthy ones; everything else, and
+# clients that wrote within the last DATABASE_REPLICA_STICKY_SECONDS, use the
+# primary so they read their own writes.
+
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+from src import db
+
+READ_METHODS = ("GET", "HEAD")
+STICKY_COOKIE = "read_primary_until"
+
+
+class ReplicaRouter:
+    """Round-robin over replica engines, skipping any that failed a health
+    check during the last retry_after seconds."""
+
+    def __init__(self, engines, retry_after, clock=time.monotonic):
+        self.engines = engines
+        self.retry_after = retry_after
+        self.clock = clock
+        self._down_until = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        """Yields the healthy engines, starting with the next one in turn."""
+        with self._lock:
+            start = next(self._counter)
+            now = self.clock()
+            down_until = dict(self._down_until)
+        for i in range(len(self.engines)):
+            engine = self.engines[(start + i) % len(self.engines)]
+            if down_until.get(engine, 0) <= now:
+                yield engine
+
+    def mark_down(self, engine):
+        with self._lock:
+            self._down_until[engine] = self.clock() + self.retry_after
+
+
+def create_router(app):
+    urls = app.config["DATABASE_REPLICA_URLS"]
+    if not urls:
+        return None
+    options = dict(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+    # fail over quickly instead of hanging on a replica that is unreachable
+    options["connect_args"] = {
+        **options.get("connect_args", {}),
+        "connect_timeout": app.config["DATABASE_REPLICA_CONNECT_TIMEOUT"],
+    }
+    engines = [db.create_engine(make_url(url), options) for url in urls]
+    return ReplicaRouter(engines, app.config["DATABASE_REPLICA_RETRY_SECONDS"])
+
+
+def get_router():
+    extensions = current_app.extensions
+    if "replica_router" not in extensions:
+        extensions["replica_router"] = create_router(current_app)
+    return extensions["replica_router"]
+
+
+def reads_pinned_to_primary():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_session():
+    """Returns the session read-only queries should use in this context."""
+    if (
+        not has_request_context()
+        or request.method not in READ_METHODS
+        or reads_pinned_to_primary()
+    ):
+        return db.session
+    if "read_session" in g:
+        return g.read_session
+
+    session = db.session
+    router = get_router()
+    for engine in router.candidates() if router else ():
+        # binds={} so the per-table binds Flask-SQLAlchemy sets up by default
+        # do not send queries back to the primary
+        candidate = db.create_session({"bind": engine, "binds": {}})()
+        try:
+            # checks a connection out (with pre-ping) as the health check
+            candidate.connection()
+        except OperationalError:
+            candidate.close()
+            router.mark_down(engine)
+            continue
+        session = candidate
+        break
+    g.read_session = session
+    return session
+
+
+def close_read_session(exc):
+    session = g.pop("read_session", None)
+    if session is not None and session is not db.session:
+        session.close()
+
+
+def pin_writers_to_primary(response):
+    if (
+        request.method not in READ_METHODS
+        and response.status_code < 400
+        and current_app.config["DATABASE_REPLICA_URLS"]
+    ):
+        sticky = current_app.config["DATABASE_REPLICA_STICKY_SECONDS"]
+        response.set_cookie(
+            STICKY_COOKIE, str(time.time() + sticky), max_age=sticky, httponly=True
+        )
+    return response
+
+
+def init_app(app):
+    app.teardown_request(close_read_session)
+    app.after_request(pin_writers_to_primary)
@@ -0,0 +1,48 @@
+# src/startup.py
+
+# measures how long a fresh interpreter takes to import the app and run
+# create_app(), module by module, with python -X importtime. It runs in a
+# subprocess, since the calling process has already imported everything.
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+from src import create_app
+imported = time.perf_counter()
+create_app()
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def parse_importtime(output):
+    """Returns (module, self_seconds, cumulative_seconds) for every line of
+    -X importtime output, in import order."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        modules.append((name.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return modules
+
+
+def profile_startup(env=None):
+    """Returns (import_seconds, create_app_seconds, modules) for a cold start
+    with the current environment updated by env; modules is as returned by
+    parse_importtime and covers the modules create_app() imports as well."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        env={**os.environ, **(env or {})},
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_seconds, create_app_seconds = map(float, result.stdout.split())
+    return import_seconds, create_app_seconds, parse_importtime(result.stderr)
@@ -1,6 +1,9 @@
 # src/tests/conftest.py
 
+import contextlib
+
 import pytest
+from sqlalchemy import event
 
 from src import create_app, db
 from src.api.users.models import User
@@ -32,3 +35,92 @@ def add_user():
         return user
 
     return _add_user
+
+
+@pytest.fixture(scope="function")
+def users_cache(test_app):
+    # enable the in-process single-user cache for one test
+    test_app.config["USERS_CACHE_BACKEND"] = "memory"
+    test_app.extensions.pop("users_cache", None)
+    from src.api.users.cache import get_cache
+
+    yield get_cache()
+    test_app.config["USERS_CACHE_BACKEND"] = None
+    test_app.extensions.pop("users_cache", None)
+
+
+@pytest.fixture(scope="function")
+def query_budget(test_app):
+    # asserts that the block runs at most the given number of SQL statements:
+    #   with query_budget(2): client.get("/users")
+    @contextlib.contextmanager
+    def _query_budget(limit):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        assert (
+            len(statements) <= limit
+        ), f"{len(statements)} statements, budget {limit}:\n" + "\n".join(statements)
+
+    return _query_budget
+
+
+@pytest.fixture(scope="function")
+def explain_selects(test_app):
+    # runs fn and returns its result with the plan of every SELECT it issued,
+    # as (statement, plan) pairs; analyze=True runs them again for row counts
+    def _explain_selects(fn, analyze=False):
+        captured = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((statement, parameters))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        assert captured, "no SELECT statements were issued"
+        explain = (
+            "EXPLAIN (ANALYZE, FORMAT JSON) " if analyze else "EXPLAIN (FORMAT JSON) "
+        )
+        plans = []
+        with db.engine.connect() as conn:
+            for statement, parameters in captured:
+                plan = conn.exec_driver_sql(explain + statement, parameters).scalar()
+                plans.append((statement, plan[0]["Plan"]))
+        return result, plans
+
+    return _explain_selects
+
+
+@pytest.fixture(scope="function")
+def assert_no_seq_scan(explain_selects):
+    # runs fn and EXPLAINs every SELECT it issued, failing if Postgres plans a
+    # sequential scan of table for any of them
+    def _assert_no_seq_scan(fn, table="users"):
+        result, plans = explain_selects(fn)
+        for statement, plan in plans:
+            scans = seq_scans(plan, table)
+            assert not scans, f"sequential scan on {table}:\n{statement}"
+        return result
+
+    return _assert_no_seq_scan
+
+
+def seq_scans(node, table):
+    found = []
+    if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == table:
+        found.append(node)
+    for child in node.get("Plans", ()):
+        found.extend(seq_scans(child, table))
+    return found
@@ -0,0 +1,101 @@
+# src/tests/functional/test_admission.py
+
+import time
+
+import pytest
+
+from src import admission, create_app
+
+
+@pytest.fixture(scope="function")
+def admission_app(test_app, test_database):
+    app = create_app()
+    app.config.from_object("src.config.TestingConfig")
+    app.config.update(
+        ADMISSION_ENABLED=True,
+        ADMISSION_RATE=0.001,
+        ADMISSION_BURST=3,
+        ADMISSION_MAX_IN_FLIGHT=2,
+    )
+    admission.init_app(app)
+    return app
+
+
+def test_rate_limited(admission_app):
+    client = admission_app.test_client()
+    for _ in range(3):
+        assert client.get("/users?limit=1").status_code == 200
+    resp = client.get("/users?limit=1")
+    assert resp.status_code == 429
+    assert resp.json["message"] == "Too many requests. Slow down."
+    assert int(resp.headers["Retry-After"]) > 1
+
+    # another client still gets through
+    resp = client.get("/users?limit=1", environ_base={"REMOTE_ADDR": "10.0.0.2"})
+    assert resp.status_code == 200
+
+
+def test_rate_limited_by_header(admission_app):
+    admission_app.config["ADMISSION_CLIENT_HEADER"] = "X-Api-Key"
+    client = admission_app.test_client()
+    for _ in range(3):
+        client.get("/users?limit=1", headers={"X-Api-Key": "one"})
+    resp = client.get("/users?limit=1", headers={"X-Api-Key": "one"})
+    assert resp.status_code == 429
+    resp = client.get("/users?limit=1", headers={"X-Api-Key": "two"})
+    assert resp.status_code == 200
+
+
+def test_ping_exempt(admission_app):
+    client = admission_app.test_client()
+    for _ in range(10):
+        assert client.get("/ping").status_code == 200
+
+
+def test_shed_when_route_busy(admission_app, query_budget):
+    limiter = admission_app.extensions["admission"].limiter
+    limiter.acquire("/users")
+    limiter.acquire("/users")
+    client = admission_app.test_client()
+    with query_budget(0):
+        resp = client.get("/users")
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+    # other routes are not affected
+    assert client.get("/users/999999").status_code == 404
+
+    limiter.release("/users")
+    assert client.get("/users").status_code == 200
+    assert limiter.running("/users") == 1
+    assert admission_app.extensions["admission"].stats() == {
+        "rate_limited": 0,
+        "shed": 1,
+    }
+
+
+def test_shed_after_queueing(admission_app, query_budget):
+    admission_app.config["ADMISSION_MAX_QUEUE_MS"] = 500
+    client = admission_app.test_client()
+    queued = {"X-Request-Start": f"t={time.time() - 2:.3f}"}
+    with query_budget(0):
+        resp = client.get("/users?limit=1", headers=queued)
+    assert resp.status_code == 503
+    assert "Retry-After" in resp.headers
+
+    fresh = {"X-Request-Start": f"t={int(time.time() * 1000)}"}
+    assert client.get("/users?limit=1", headers=fresh).status_code == 200
+    assert admission_app.extensions["admission"].stats()["shed"] == 1
+
+
+def test_slots_released_after_errors(admission_app):
+    client = admission_app.test_client()
+    client.post("/users", json={})
+    client.get("/users/999999")
+    limiter = admission_app.extensions["admission"].limiter
+    assert limiter.running("/users") == 0
+    assert limiter.running("/users/<int:user_id>") == 0
+
+
+def test_admission_disabled(test_app):
+    assert not test_app.config["ADMISSION_ENABLED"]
+    assert "admission" not in test_app.extensions
@@ -0,0 +1,236 @@
+# src/tests/functional/test_asgi.py
+
+import json
+
+import pytest
+from sqlalchemy import event
+
+from src import db
+from src.api.users.models import User
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("httpx")
+testclient = pytest.importorskip("starlette.testclient")
+
+
+@pytest.fixture(scope="module")
+def asgi_client(test_app, test_database):
+    from src.asgi import create_asgi_app
+
+    with testclient.TestClient(create_asgi_app(test_app)) as client:
+        yield client
+
+
+@pytest.fixture(scope="function")
+def empty_users(test_database):
+    db.session.query(User).delete()
+    db.session.commit()
+
+
+def test_asgi_ping(asgi_client):
+    resp = asgi_client.get("/ping")
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "success", "message": "pong"}
+
+
+def test_asgi_swagger_matches_sync_api(test_app, asgi_client):
+    paths = asgi_client.get("/swagger.json").json()["paths"]
+    assert set(paths) == {"/ping", "/users", "/users/bulk", "/users/{user_id}"}
+
+
+def test_asgi_add_and_get_user(asgi_client, empty_users):
+    resp = asgi_client.post(
+        "/users", json={"username": "asyncuser", "email": "async@example.com"}
+    )
+    assert resp.status_code == 201
+    assert resp.json()["message"] == "async@example.com was added!"
+
+    resp = asgi_client.post(
+        "/users", json={"username": "other", "email": "ASYNC@example.com"}
+    )
+    assert resp.status_code == 400
+    assert resp.json()["message"] == "Sorry. That email already exists."
+
+    user = User.query.filter_by(email="async@example.com").first()
+    resp = asgi_client.get(f"/users/{user.id}")
+    assert resp.status_code == 200
+    assert resp.json()["username"] == "asyncuser"
+
+    resp = asgi_client.get(
+        f"/users/{user.id}", headers={"If-None-Match": resp.headers["ETag"]}
+    )
+    assert resp.status_code == 304
+
+
+def test_asgi_add_user_invalid_json_keys(asgi_client):
+    resp = asgi_client.post("/users", json={"email": "nousername@example.com"})
+    data = resp.json()
+    assert resp.status_code == 400
+    assert data["message"] == "Input payload validation failed"
+    assert "username" in data["errors"]
+
+
+def test_asgi_users_pagination(asgi_client, empty_users, add_user):
+    for i in range(3):
+        add_user(f"page{i}", f"page{i}@example.com")
+    resp = asgi_client.get("/users?limit=2")
+    assert resp.status_code == 200
+    assert [u["username"] for u in resp.json()] == ["page0", "page1"]
+
+    resp = asgi_client.get(f"/users?limit=2&cursor={resp.headers['X-Next-Cursor']}")
+    assert [u["username"] for u in resp.json()] == ["page2"]
+    assert "X-Next-Cursor" not in resp.headers
+
+    assert asgi_client.get("/users?limit=0").status_code == 400
+    assert asgi_client.get("/users?cursor=nope").status_code == 400
+
+
+def test_asgi_users_ndjson(asgi_client, empty_users, add_user):
+    add_user("streamed", "streamed@example.com")
+    resp = asgi_client.get("/users", headers={"Accept": "application/x-ndjson"})
+    assert resp.status_code == 200
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["email"] for line in lines] == ["streamed@example.com"]
+
+
+def test_asgi_bulk_add_users(asgi_client, empty_users, add_user):
+    add_user("taken", "taken@example.com")
+    resp = asgi_client.post(
+        "/users/bulk",
+        json=[
+            {"username": "one", "email": "one@example.com"},
+            {"username": "taken", "email": "TAKEN@example.com"},
+            {"username": ""},
+        ],
+    )
+    data = resp.json()
+    assert resp.status_code == 201
+    assert data["created"] == 1
+    statuses = [result["status"] for result in data["results"]]
+    assert statuses == ["created", "duplicate", "invalid"]
+
+
+def test_asgi_update_and_delete_user(asgi_client, empty_users, add_user):
+    user_id = add_user("before", "before@example.com").id
+    resp = asgi_client.put(
+        f"/users/{user_id}", json={"username": "after", "email": "after@example.com"}
+    )
+    assert resp.status_code == 200
+    assert resp.json()["message"] == f"{user_id} was updated!"
+
+    resp = asgi_client.patch(f"/users/{user_id}", json={"username": "patched"})
+    assert resp.status_code == 200
+    assert asgi_client.get(f"/users/{user_id}").json()["username"] == "patched"
+    assert asgi_client.patch(f"/users/{user_id}", json={}).status_code == 400
+    assert asgi_client.patch("/users/999999", json={"username": "x"}).status_code == 404
+
+    resp = asgi_client.delete(f"/users/{user_id}")
+    assert resp.status_code == 200
+    assert resp.json()["message"] == "after@example.com was removed!"
+
+    resp = asgi_client.get(f"/users/{user_id}")
+    assert resp.status_code == 404
+    assert resp.json()["message"] == f"User {user_id} does not exist"
+
+
+def test_asgi_users_filtered(asgi_client, empty_users, add_user):
+    add_user("Filtered", "filtered@example.com")
+    add_user("other", "other@example.com")
+    resp = asgi_client.get("/users?username=fil&active=true")
+    assert [u["username"] for u in resp.json()] == ["Filtered"]
+    assert asgi_client.get("/users?active=maybe").status_code == 400
+
+
+def test_asgi_users_by_ids(asgi_client, empty_users, add_user):
+    first = add_user("first", "first@example.com").id
+    second = add_user("second", "second@example.com").id
+    resp = asgi_client.get(f"/users?ids={second},999999,{first}")
+    assert [u["username"] for u in resp.json()] == ["second", "first"]
+    assert resp.headers["X-Missing-Ids"] == "999999"
+    assert asgi_client.get("/users?ids=1,x").status_code == 400
+
+
+def test_asgi_users_gzip(asgi_client, empty_users, add_user):
+    for i in range(30):
+        add_user(f"gzipped{i}", f"gzipped{i}@example.com")
+    resp = asgi_client.get("/users", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert len(resp.json()) == 30
+
+
+def test_asgi_users_sparse_fields(asgi_client, empty_users, add_user):
+    user_id = add_user("sparse", "sparse@example.com").id
+    engine = asgi_client.app.state.sessionmaker.kw["bind"].sync_engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "FROM users" in statement and "users_version" not in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        resp = asgi_client.get("/users?fields=id,email")
+        assert resp.json() == [{"id": user_id, "email": "sparse@example.com"}]
+        resp = asgi_client.get(f"/users?ids={user_id}&fields=email")
+        assert resp.json() == [{"email": "sparse@example.com"}]
+        resp = asgi_client.get(
+            "/users?fields=email", headers={"Accept": "application/x-ndjson"}
+        )
+        assert resp.text == '{"email":"sparse@example.com"}\n'
+        resp = asgi_client.get(f"/users/{user_id}?fields=username")
+        assert resp.json() == {"username": "sparse"}
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    # only the requested columns, and those paging and tagging need, are read
+    assert len(statements) == 4
+    assert all("users.username" not in s for s in statements[:3])
+    assert "users.email" not in statements[3]
+    assert asgi_client.get("/users?fields=nope").status_code == 400
+
+
+def test_asgi_users_total_count(asgi_client, empty_users, add_user):
+    add_user("counted", "counted@example.com")
+    add_user("tallied", "tallied@example.com")
+    assert "X-Total-Count" not in asgi_client.get("/users").headers
+    resp = asgi_client.get("/users?count=exact&username=cou")
+    assert resp.headers["X-Total-Count"] == "1"
+    resp = asgi_client.get(
+        "/users?count=exact", headers={"Accept": "application/x-ndjson"}
+    )
+    assert resp.headers["X-Total-Count"] == "2"
+    # below USERS_COUNT_EXACT_BELOW estimates fall back to counting
+    assert asgi_client.get("/users?count=estimated").headers["X-Total-Count"] == "2"
+
+    assert asgi_client.get("/users?count=cached").headers["X-Total-Count"] == "2"
+    add_user("later", "later@example.com")
+    assert asgi_client.get("/users?count=cached").headers["X-Total-Count"] == "2"
+    assert asgi_client.get("/users?count=exact").headers["X-Total-Count"] == "3"
+
+
+def test_asgi_users_head(asgi_client, empty_users, add_user):
+    add_user("headed", "headed@example.com")
+    resp = asgi_client.head("/users?active=true")
+    assert resp.status_code == 200
+    assert resp.headers["X-Total-Count"] == "1"
+    assert "Content-Length" not in resp.headers
+    assert resp.content == b""
+
+    etag = {"If-None-Match": resp.headers["ETag"]}
+    resp = asgi_client.head("/users?active=true", headers=etag)
+    assert resp.status_code == 304
+
+
+def test_asgi_single_user_sparse_fields(asgi_client, empty_users, add_user):
+    user_id = add_user("narrow", "narrow@example.com").id
+    resp = asgi_client.get(f"/users/{user_id}?fields=email,id")
+    assert resp.json() == {"id": user_id, "email": "narrow@example.com"}
+    etag = resp.headers["ETag"]
+    assert etag != asgi_client.get(f"/users/{user_id}").headers["ETag"]
+
+    resp = asgi_client.get(
+        f"/users/{user_id}?fields=id,email", headers={"If-None-Match": etag}
+    )
+    assert resp.status_code == 304
+    resp = asgi_client.get(f"/users/{user_id}?fields=nope")
+    assert resp.status_code == 400
+    assert "'nope'" in resp.json()["errors"]["fields"]
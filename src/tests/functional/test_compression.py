@@ -0,0 +1,90 @@
+# src/tests/functional/test_compression.py
+
+import gzip
+import json
+
+import pytest
+
+from src.api.users.models import User
+
+
+@pytest.fixture(scope="function")
+def many_users(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    for i in range(30):
+        add_user(f"compressed-{i}", f"compressed-{i}@example.com")
+
+
+def test_users_gzip(test_app, many_users):
+    client = test_app.test_client()
+    resp = client.get("/users", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert int(resp.headers["Content-Length"]) == len(resp.data)
+    users = json.loads(gzip.decompress(resp.data))
+    assert len(users) == 30
+
+    plain = client.get("/users")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+    assert len(resp.data) < len(plain.data)
+
+
+def test_users_gzip_refused(test_app, many_users):
+    client = test_app.test_client()
+    for value in ("gzip;q=0", "identity", "compress"):
+        resp = client.get("/users", headers={"Accept-Encoding": value})
+        assert "Content-Encoding" not in resp.headers
+        assert len(json.loads(resp.data)) == 30
+
+
+def test_small_response_not_compressed(test_app, test_database, add_user):
+    user_id = add_user("small", "small@example.com").id
+    client = test_app.test_client()
+    resp = client.get(f"/users/{user_id}", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
+    assert json.loads(resp.data)["username"] == "small"
+
+
+def test_min_size_setting(test_app, test_database, add_user, monkeypatch):
+    monkeypatch.setitem(test_app.config, "COMPRESSION_MIN_SIZE", 0)
+    user_id = add_user("tiny", "tiny@example.com").id
+    client = test_app.test_client()
+    resp = client.get(f"/users/{user_id}", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(resp.data))["username"] == "tiny"
+
+
+def test_users_ndjson_gzip(test_app, many_users, monkeypatch):
+    monkeypatch.setitem(test_app.config, "USERS_STREAM_BATCH_SIZE", 7)
+    client = test_app.test_client()
+    resp = client.get(
+        "/users",
+        headers={"Accept": "application/x-ndjson", "Accept-Encoding": "gzip"},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in resp.headers
+    lines = gzip.decompress(resp.data).decode().splitlines()
+    assert len(lines) == 30
+    assert json.loads(lines[0])["username"] == "compressed-0"
+
+
+def test_compressed_etag_is_weak(test_app, many_users):
+    client = test_app.test_client()
+    headers = {"Accept-Encoding": "gzip"}
+    resp = client.get("/users", headers=headers)
+    etag = resp.headers["ETag"]
+    assert etag.startswith("W/")
+    assert etag.split("W/", 1)[1] == client.get("/users").headers["ETag"]
+
+    resp = client.get("/users", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+    assert "Content-Encoding" not in resp.headers
+
+
+def test_head_not_compressed(test_app, many_users):
+    client = test_app.test_client()
+    resp = client.head("/users", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in resp.headers
@@ -0,0 +1,125 @@
+# src/tests/functional/test_database.py
+
+import threading
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from src.api.users.crud import insert_users
+from src.database import SQLAlchemy, pool_stats, run_migrations
+
+
+def test_statement_timeout(test_app, test_database):
+    timeout = test_database.session.execute("SHOW statement_timeout").scalar()
+    assert timeout == "30s"
+
+
+def test_pool_checkout_wait_recorded(test_app, test_database):
+    test_database.session.remove()
+    before = pool_stats.snapshot()["checkouts"]
+    test_database.session.execute("SELECT 1")
+    after = pool_stats.snapshot()
+    assert after["checkouts"] == before + 1
+    assert after["wait_seconds_max"] >= 0
+
+
+def test_transaction_statement_timeout(test_app):
+    url = make_url(test_app.config["SQLALCHEMY_DATABASE_URI"])
+    engine = SQLAlchemy().create_engine(
+        url, {"poolclass": NullPool, "transaction_statement_timeout": 1500}
+    )
+    with engine.begin() as conn:
+        assert conn.exec_driver_sql("SHOW statement_timeout").scalar() == "1500ms"
+    engine.dispose()
+
+
+def test_run_migrations(test_app, test_database):
+    test_database.session.remove()
+    with test_database.engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_users_username_prefix")
+        conn.exec_driver_sql("DROP INDEX ix_users_inactive_created_date_id")
+
+    # idempotent: the second run finds everything in place
+    for _ in range(2):
+        assert run_migrations(test_database.engine) == [
+            "001_users_indexes.sql",
+            "002_users_version.sql",
+        ]
+
+    with test_database.engine.connect() as conn:
+        indexes = conn.exec_driver_sql(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'users'"
+        )
+        indexes = dict(indexes.all())
+    assert "text_pattern_ops" in indexes["ix_users_username_prefix"]
+    assert "WHERE (NOT active)" in indexes["ix_users_inactive_created_date_id"]
+
+
+def test_run_migrations_without_statement_timeout(test_app, tmp_path):
+    url = make_url(test_app.config["SQLALCHEMY_DATABASE_URI"])
+    engine = SQLAlchemy().create_engine(
+        url, {"connect_args": {"options": "-c statement_timeout=100"}}
+    )
+    (tmp_path / "001_slow.sql").write_text("SELECT pg_sleep(0.3);")
+    assert run_migrations(engine, str(tmp_path)) == ["001_slow.sql"]
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SHOW statement_timeout").scalar() == "100ms"
+    engine.dispose()
+
+
+def test_users_version_trigger(test_app, test_database):
+    test_database.session.remove()
+    with test_database.engine.begin() as conn:
+        conn.exec_driver_sql("DROP TRIGGER users_version_bump ON users")
+    run_migrations(test_database.engine)
+
+    def version():
+        with test_database.engine.connect() as conn:
+            return conn.exec_driver_sql("SELECT version FROM users_version").scalar()
+
+    before = version()
+    with test_database.engine.begin() as conn:
+        for name in ("trigger", "triggered"):
+            conn.exec_driver_sql(
+                "INSERT INTO users (username, email, active, created_date, updated_at) "
+                f"VALUES ('{name}', '{name}@a.com', true, now(), now())"
+            )
+        # moved at commit, once per transaction
+        assert version() == before
+    assert version() == before + 1
+    with test_database.engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM users WHERE username = 'nobody'")
+    assert version() == before + 1
+    with test_database.engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM users WHERE email LIKE 'trigger%%'")
+    assert version() == before + 2
+
+
+def test_users_version_concurrent_writers(test_app, test_database):
+    # a transaction writing users in two statements, and a POST of an email in
+    # its second one in between, wait on each other's email rather than
+    # deadlock on the version row
+    test_database.session.remove()
+    client = test_app.test_client()
+    first = [{"username": "early", "email": "early@a.com"}]
+    second = [{"username": "late", "email": "contended@a.com"}]
+
+    def post():
+        body = {"username": "posted", "email": "contended@a.com"}
+        responses.append(client.post("/users", json=body))
+
+    responses = []
+    with test_database.engine.begin() as conn:
+        conn.execute(insert_users(first))
+        poster = threading.Thread(target=post)
+        poster.start()
+        poster.join(timeout=2)
+        conn.execute(insert_users(second))
+    poster.join()
+
+    assert responses[0].status_code == 201
+    with test_database.engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT username FROM users WHERE email LIKE '%%@a.com' ORDER BY username"
+        )
+        assert rows.scalars().all() == ["early", "posted"]
@@ -0,0 +1,56 @@
+# src/tests/functional/test_metrics.py
+
+import pytest
+
+from src import create_app, metrics
+
+
+@pytest.fixture(scope="module")
+def metrics_app(test_app, test_database):
+    app = create_app()
+    app.config.from_object("src.config.TestingConfig")
+    app.config["METRICS_ENABLED"] = True
+    metrics.init_app(app)
+    return app
+
+
+def test_server_timing_header(metrics_app, add_user):
+    user = add_user("timed", "timed@example.com")
+    resp = metrics_app.test_client().get(f"/users/{user.id}")
+    assert resp.status_code == 200
+    timing = resp.headers["Server-Timing"]
+    assert timing.startswith("app;dur=")
+    assert 'desc="1 queries"' in timing
+
+
+def test_metrics_endpoint(metrics_app):
+    client = metrics_app.test_client()
+    client.get("/ping")
+    client.get("/users/999999")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.content_type.startswith("text/plain; version=0.0.4")
+    text = resp.data.decode()
+    assert 'http_request_duration_seconds_count{route="/ping",method="GET"}' in text
+    assert 'db_queries_total{route="/users/<int:user_id>",method="GET"}' in text
+    assert "db_pool_wait_seconds_total" in text
+
+
+def test_metrics_disabled(test_app):
+    assert not test_app.config["METRICS_ENABLED"]
+    client = test_app.test_client()
+    assert "Server-Timing" not in client.get("/ping").headers
+    assert client.get("/metrics").status_code == 404
+
+
+def test_streamed_response_recorded_on_close(metrics_app, add_user):
+    add_user("streamed", "streamed@example.com")
+    client = metrics_app.test_client()
+    resp = client.get("/users", headers={"Accept": "application/x-ndjson"})
+    assert "Server-Timing" not in resp.headers
+    assert b"streamed@example.com" in resp.get_data()
+    resp.close()
+    stats = metrics_app.extensions["metrics"].routes[("/users", "GET")]
+    # the version lookup, and the query reading the body after the headers
+    assert stats.count == 1
+    assert stats.queries == 2
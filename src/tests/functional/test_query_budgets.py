@@ -0,0 +1,127 @@
+# src/tests/functional/test_query_budgets.py
+
+# upper bounds on the SQL statements each endpoint issues (with the cache and
+# read replicas disabled). Lower a budget when an endpoint gets cheaper; raising
+# one should be a deliberate decision.
+
+import json
+
+import pytest
+
+from src.api.users.models import User
+
+
+@pytest.fixture(scope="function")
+def user_id(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    test_database.session.commit()
+    # the id, as touching the expired instance inside a budget would reload it
+    return add_user("budget", "budget@example.com").id
+
+
+def test_ping_budget(test_app, query_budget):
+    with query_budget(0):
+        assert test_app.test_client().get("/ping").status_code == 200
+
+
+def test_add_user_budget(test_app, test_database, query_budget):
+    client = test_app.test_client()
+    body = {"username": "budgetpost", "email": "budgetpost@example.com"}
+    with query_budget(1):
+        assert client.post("/users", json=body).status_code == 201
+    with query_budget(1):
+        assert client.post("/users", json=body).status_code == 400
+
+
+@pytest.mark.parametrize(
+    "url, headers",
+    [
+        ("/users?limit=10", {}),
+        ("/users?all=true", {}),
+        ("/users", {"Accept": "application/x-ndjson"}),
+    ],
+)
+def test_list_users_budget(test_app, user_id, query_budget, url, headers):
+    client = test_app.test_client()
+    # version lookup for the validators, then the rows
+    with query_budget(2):
+        resp = client.get(url, headers=headers)
+        resp.get_data()
+        assert resp.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "url, budget",
+    [
+        # version lookup, count and rows
+        ("/users?limit=10&count=exact", 3),
+        # the estimate, then a count as it is below USERS_COUNT_EXACT_BELOW
+        ("/users?limit=10&count=estimated", 4),
+        ("/users?limit=10&username=budget&count=exact", 3),
+    ],
+)
+def test_list_users_count_budget(test_app, user_id, query_budget, url, budget):
+    with query_budget(budget):
+        resp = test_app.test_client().get(url)
+        assert resp.status_code == 200
+        assert resp.headers["X-Total-Count"] == "1"
+
+
+def test_head_users_budget(test_app, user_id, query_budget):
+    with query_budget(2):
+        resp = test_app.test_client().head("/users?count=cached")
+        assert resp.headers["X-Total-Count"] == "1"
+
+
+def test_bulk_add_users_budget(test_app, test_database, query_budget):
+    items = [
+        {"username": f"budget{i}", "email": f"budget{i}@example.com"} for i in range(50)
+    ]
+    with query_budget(2):
+        resp = test_app.test_client().post(
+            "/users/bulk", data=json.dumps(items), content_type="application/json"
+        )
+        assert resp.status_code == 201
+
+
+def test_get_user_budget(test_app, user_id, query_budget):
+    client = test_app.test_client()
+    with query_budget(1):
+        resp = client.get(f"/users/{user_id}")
+        assert resp.status_code == 200
+    with query_budget(1):
+        headers = {"If-None-Match": resp.headers["ETag"]}
+        assert client.get(f"/users/{user_id}", headers=headers).status_code == 304
+    with query_budget(1):
+        assert client.get("/users/999999").status_code == 404
+
+
+def test_users_by_ids_budget(test_app, user_id, query_budget):
+    with query_budget(1):
+        resp = test_app.test_client().get(f"/users?ids={user_id},999999")
+        assert resp.status_code == 200
+
+
+def test_update_user_budget(test_app, user_id, query_budget):
+    body = {"username": "budget2", "email": "budget2@example.com"}
+    # a single UPDATE ... RETURNING
+    with query_budget(1):
+        resp = test_app.test_client().put(f"/users/{user_id}", json=body)
+        assert resp.status_code == 200
+    with query_budget(1):
+        assert test_app.test_client().put("/users/999999", json=body).status_code == 404
+
+
+def test_patch_user_budget(test_app, user_id, query_budget):
+    with query_budget(1):
+        resp = test_app.test_client().patch(
+            f"/users/{user_id}", json={"username": "patched"}
+        )
+        assert resp.status_code == 200
+
+
+def test_delete_user_budget(test_app, user_id, query_budget):
+    # a single DELETE ... RETURNING
+    with query_budget(1):
+        resp = test_app.test_client().delete(f"/users/{user_id}")
+        assert resp.status_code == 200
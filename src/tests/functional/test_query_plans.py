@@ -0,0 +1,110 @@
+# src/tests/functional/test_query_plans.py
+
+# every crud lookup must be answerable from an index once the table is large;
+# a query falling back to a sequential scan fails here.
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from src.api.users import crud
+from src.api.users.pagination import decode_cursor, encode_cursor
+
+ROWS = 20000
+
+# the GET /users filters, each of which must be answered from an index
+FILTERS = [
+    {"username": "PLAN123"},
+    {"email": "plan4567@"},
+    {"active": False},
+    {"created_after": datetime.utcnow() - timedelta(minutes=5)},
+    {
+        "created_after": datetime.utcnow() - timedelta(hours=2),
+        "created_before": datetime.utcnow() - timedelta(hours=1),
+    },
+]
+
+
+@pytest.fixture(scope="module")
+def large_table(test_app, test_database):
+    test_database.session.execute(
+        text(
+            "INSERT INTO users (username, email, active, created_date, updated_at) "
+            "SELECT 'plan' || g, 'plan' || g || '@example.com', g % 100 <> 0, "
+            "now() - make_interval(secs => :rows - g), now() "
+            "FROM generate_series(1, :rows) AS g"
+        ),
+        {"rows": ROWS},
+    )
+    test_database.session.commit()
+    test_database.session.execute(text("ANALYZE users"))
+    test_database.session.commit()
+    yield test_database
+    test_database.session.execute(text("DELETE FROM users"))
+    test_database.session.commit()
+
+
+def test_users_page_plan(large_table, assert_no_seq_scan):
+    users = assert_no_seq_scan(lambda: crud.get_users_page(101))
+    cursor = decode_cursor(encode_cursor(users[-1].created_date, users[-1].id))
+    assert_no_seq_scan(lambda: crud.get_users_page(101, cursor))
+
+
+def test_user_lookup_plans(large_table, assert_no_seq_scan):
+    user = assert_no_seq_scan(lambda: crud.get_user_by_email("PLAN10@example.com"))
+    assert user is not None
+    assert_no_seq_scan(lambda: crud.get_user_by_id(user.id))
+    assert_no_seq_scan(lambda: crud.get_user_updated_at(user.id))
+
+
+def test_users_by_ids_plan(large_table, assert_no_seq_scan):
+    ids = [user.id for user in crud.get_users_page(50)]
+    found = assert_no_seq_scan(lambda: crud.get_users_by_ids(ids))
+    assert set(found) == set(ids)
+
+
+def test_existing_emails_plan(large_table, assert_no_seq_scan):
+    emails = {"plan1@example.com", "Plan2@example.com", "nobody@example.com"}
+    found = assert_no_seq_scan(lambda: crud.get_existing_emails(emails))
+    assert found == {"plan1@example.com", "plan2@example.com"}
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_page_plans(large_table, assert_no_seq_scan, filters):
+    users = assert_no_seq_scan(lambda: crud.get_users_page(101, filters=filters))
+    assert users
+
+
+def relations(node):
+    found = {node["Relation Name"]} if "Relation Name" in node else set()
+    for child in node.get("Plans", ()):
+        found |= relations(child)
+    return found
+
+
+def test_users_version_plan(large_table, explain_selects):
+    # every GET and HEAD /users reads it, so it must read the one row of
+    # users_version and nothing of users, however large that is
+    (changed_at, version), plans = explain_selects(crud.get_users_version, analyze=True)
+    [(statement, plan)] = plans
+    assert relations(plan) == {"users_version"}
+    assert plan["Actual Rows"] == 1
+
+
+def test_estimated_count_plan(large_table, assert_no_seq_scan):
+    total = assert_no_seq_scan(lambda: crud.count_users(mode="estimated"))
+    assert total > ROWS / 2
+
+
+# an exact count of the whole table reads all of it by definition, and only
+# runs for count=exact without filters
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_count_plans(large_table, assert_no_seq_scan, filters):
+    total = assert_no_seq_scan(lambda: crud.count_users_exact(filters))
+    assert total
+    # small estimates are replaced by an exact count, which must be indexed too
+    estimate = assert_no_seq_scan(
+        lambda: crud.count_users(filters, "estimated", exact_below=ROWS)
+    )
+    assert estimate == total
@@ -0,0 +1,111 @@
+# src/tests/functional/test_replicas.py
+
+# two extra databases on the test server stand in for read replicas. Each one
+# holds a single user with a name identifying the database it came from.
+
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from src.api.users.models import User
+
+
+@pytest.fixture(scope="module")
+def replica_urls(test_app, test_database):
+    url = make_url(test_app.config["SQLALCHEMY_DATABASE_URI"])
+    server = create_engine(url, isolation_level="AUTOCOMMIT", poolclass=NullPool)
+    names = [f"{url.database}_replica_{i}" for i in (1, 2)]
+    urls = []
+    for name in names:
+        with server.connect() as conn:
+            conn.exec_driver_sql(f'DROP DATABASE IF EXISTS "{name}"')
+            conn.exec_driver_sql(f'CREATE DATABASE "{name}"')
+        replica = create_engine(url.set(database=name), poolclass=NullPool)
+        test_database.metadata.create_all(replica)
+        with replica.begin() as conn:
+            conn.execute(
+                User.__table__.insert(),
+                {"id": 1, "username": name, "email": f"{name}@replica.com"},
+            )
+        replica.dispose()
+        urls.append(str(url.set(database=name)))
+
+    yield urls
+
+    test_app.extensions.pop("replica_router", None)
+    for name in names:
+        with server.connect() as conn:
+            conn.exec_driver_sql(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    server.dispose()
+
+
+@pytest.fixture(scope="function")
+def replicas(test_app, replica_urls, monkeypatch):
+    def _replicas(urls):
+        monkeypatch.setitem(test_app.config, "DATABASE_REPLICA_URLS", urls)
+        test_app.extensions.pop("replica_router", None)
+
+    yield _replicas
+    test_app.extensions.pop("replica_router", None)
+
+
+def get_username(client, user_id=1):
+    resp = client.get(f"/users/{user_id}")
+    return json.loads(resp.data.decode()).get("username")
+
+
+def test_reads_round_robin_across_replicas(test_app, replicas, replica_urls):
+    replicas(replica_urls)
+    client = test_app.test_client()
+    names = [get_username(client) for _ in range(4)]
+    assert set(names) == {make_url(url).database for url in replica_urls}
+    assert names[0] == names[2] != names[1] == names[3]
+
+
+def test_unreachable_replica_is_skipped(test_app, replicas, replica_urls):
+    down = str(make_url(replica_urls[0]).set(host="127.0.0.1", port=1))
+    replicas([down, replica_urls[1]])
+    client = test_app.test_client()
+    names = {get_username(client) for _ in range(4)}
+    assert names == {make_url(replica_urls[1]).database}
+
+
+def test_all_replicas_down_falls_back_to_primary(
+    test_app, test_database, replicas, replica_urls, add_user
+):
+    user = add_user("primary-only", "primary-only@seasame.com")
+    replicas([str(make_url(replica_urls[0]).set(host="127.0.0.1", port=1))])
+    client = test_app.test_client()
+    assert get_username(client, user.id) == "primary-only"
+
+
+def test_writes_go_to_primary_and_pin_reads(test_app, replicas, replica_urls):
+    replicas(replica_urls)
+    client = test_app.test_client()
+    resp = client.post(
+        "/users",
+        data=json.dumps({"username": "writer", "email": "writer@seasame.com"}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 201
+    assert "read_primary_until" in resp.headers["Set-Cookie"]
+    user = User.query.filter_by(email="writer@seasame.com").one()
+
+    # this client just wrote, so it reads its own write from the primary
+    assert get_username(client, user.id) == "writer"
+
+    # other clients read from the replicas, which never saw the write
+    other = test_app.test_client()
+    assert other.get(f"/users/{user.id}").status_code == 404
+
+
+def test_replica_reads_do_not_fill_cache(test_app, replicas, replica_urls, users_cache):
+    replicas(replica_urls)
+    client = test_app.test_client()
+    assert get_username(client) in {make_url(url).database for url in replica_urls}
+    assert client.get("/users?ids=1").status_code == 200
+    # a pinned client must not get a replica's copy back from the cache
+    assert users_cache.get(1) is None
@@ -0,0 +1,47 @@
+# src/tests/functional/test_seed.py
+
+from datetime import datetime
+
+from sqlalchemy import func
+
+from src.api.users.models import User
+from src.api.users.seed import generate_users, load_users
+
+
+def test_generate_users_is_deterministic():
+    now = datetime(2021, 6, 1)
+    rows = list(generate_users(1000, now=now))
+    assert rows == list(generate_users(1000, now=now))
+    assert rows != list(generate_users(1000, seed=1, now=now))
+    assert (
+        len({row[0] for row in rows}) == len({row[1].lower() for row in rows}) == 1000
+    )
+    # oldest first, all within the year before now
+    created = [row[3] for row in rows]
+    assert created == sorted(created)
+    assert (now - created[0]).days < 365 and created[-1] == now
+    inactive = sum(not row[2] for row in rows)
+    assert 0 < inactive < 150
+
+
+def test_generate_users_continues_from_start():
+    first = list(generate_users(10))
+    more = list(generate_users(10, start=10))
+    assert not {row[1] for row in first} & {row[1] for row in more}
+
+
+def test_load_users(test_app, test_database):
+    test_database.session.query(User).delete()
+    test_database.session.commit()
+    progress = []
+    written = load_users(
+        test_database.session, generate_users(2500), 1000, progress.append
+    )
+    assert written == 2500
+    assert progress == [1000, 2000, 2500]
+    assert test_database.session.query(func.count(User.id)).scalar() == 2500
+    user = User.query.order_by(User.id).first()
+    assert user.email.endswith("0@example.com")
+    assert user.created_date < User.query.order_by(User.id.desc()).first().created_date
+    test_database.session.query(User).delete()
+    test_database.session.commit()
@@ -0,0 +1,123 @@
+# src/tests/functional/test_transfer.py
+
+import json
+
+import pytest
+
+from src.api.users.models import User
+from src.api.users.transfer import export_users, import_users
+
+
+@pytest.fixture(scope="function")
+def five_users(test_database, add_user):
+    test_database.session.query(User).delete()
+    test_database.session.commit()
+    for i in range(5):
+        add_user(f"transfer{i}", f"transfer{i}@seasame.com")
+    return test_database
+
+
+def users(db):
+    db.session.expire_all()
+    return [(u.username, u.email, u.active) for u in User.query.order_by(User.email)]
+
+
+@pytest.mark.parametrize("extension", ["csv", "jsonl"])
+def test_export_and_import_round_trip(test_app, five_users, tmp_path, extension):
+    path = str(tmp_path / f"users.{extension}")
+    progress = []
+    assert export_users(path, batch_size=2, progress=progress.append) == 5
+    assert progress == [2, 4, 5]
+    before = users(five_users)
+
+    five_users.session.query(User).delete()
+    five_users.session.commit()
+    result = import_users(path, batch_size=2)
+    assert result == {"records": 5, "written": 5, "rejected": 0}
+    assert users(five_users) == before
+
+    # importing the same file again changes nothing
+    assert import_users(path, batch_size=2)["written"] == 0
+
+
+def test_export_resumes_from_checkpoint(test_app, five_users, tmp_path):
+    full = tmp_path / "full.jsonl"
+    export_users(str(full))
+
+    path = str(tmp_path / "users.jsonl")
+    checkpoint = str(tmp_path / "users.jsonl.checkpoint")
+
+    def interrupt(rows):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        export_users(path, batch_size=2, checkpoint=checkpoint, progress=interrupt)
+    five_users.session.rollback()
+    # a partly written batch after the checkpoint is discarded on resume
+    with open(path, "a") as f:
+        f.write('{"id": 99, "username": "half')
+
+    assert export_users(path, batch_size=2, checkpoint=checkpoint) == 5
+    assert open(path).read() == full.read_text()
+
+
+def test_import_upserts_and_rejects(test_app, five_users, tmp_path):
+    path = tmp_path / "users.jsonl"
+    records = [
+        {"username": "renamed", "email": "TRANSFER0@seasame.com", "active": False},
+        {"username": "new", "email": "new@seasame.com"},
+        {"username": "no email"},
+        {"username": "nul\u0000byte", "email": "nul@seasame.com"},
+        {"username": "twice", "email": "new@seasame.com"},
+    ]
+    path.write_text("\n".join(json.dumps(record) for record in records) + "\n{broken\n")
+    rejects = tmp_path / "rejects.jsonl"
+    result = import_users(str(path), batch_size=10, rejects=str(rejects))
+    # the NUL byte fails the batch, whose rows are then written one at a time
+    assert result == {"records": 6, "written": 3, "rejected": 3}
+
+    rows = dict((email, (name, active)) for name, email, active in users(five_users))
+    # matched case-insensitively; the stored address takes the imported case
+    assert rows["TRANSFER0@seasame.com"] == ("renamed", False)
+    # the last of two records with one email wins
+    assert rows["new@seasame.com"] == ("twice", True)
+    rejected = [json.loads(line) for line in rejects.read_text().splitlines()]
+    assert [
+        entry["record"] for entry in sorted(rejected, key=lambda e: e["record"])
+    ] == [
+        3,
+        4,
+        6,
+    ]
+
+
+def test_import_resumes_from_checkpoint(test_app, five_users, tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text(
+        "username,email\n"
+        "skipped,skipped@seasame.com\n"
+        "resumed,resumed@seasame.com\n"
+    )
+    checkpoint = tmp_path / "users.csv.checkpoint"
+    checkpoint.write_text(json.dumps({"records": 1, "written": 1, "rejected": 0}))
+    result = import_users(str(path), checkpoint=str(checkpoint))
+    assert result == {"records": 2, "written": 2, "rejected": 0}
+    emails = {email for name, email, active in users(five_users)}
+    assert "resumed@seasame.com" in emails
+    assert "skipped@seasame.com" not in emails
+
+
+def test_import_invalidates_cached_users(test_app, five_users, users_cache, tmp_path):
+    user_id = User.query.filter_by(email="transfer1@seasame.com").one().id
+    client = test_app.test_client()
+    etag = client.get(f"/users/{user_id}").headers["ETag"]
+
+    path = tmp_path / "users.jsonl"
+    path.write_text(
+        json.dumps({"username": "imported", "email": "transfer1@seasame.com"})
+    )
+    assert import_users(str(path))["written"] == 1
+
+    resp = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json["username"] == "imported"
@@ -3,8 +3,10 @@
 # list of HTTP status codes: https://en.wikipedia.org/wiki/List_of_HTTP_status_codes
 
 import json
+import time
 
 import pytest
+from sqlalchemy import text
 
 from src.api.users.models import User
 
@@ -63,6 +65,47 @@ def test_add_user_duplicate_email(test_app, test_database):
     assert "Sorry. That email already exists." in data["message"]
 
 
+def test_add_users_bulk(test_app, test_database, add_user):
+    add_user("bulk-existing", "bulk-existing@seasame.com")
+    client = test_app.test_client()
+    payload = [
+        {"username": f"bulk-user-{i}", "email": f"bulk-user-{i}@seasame.com"}
+        for i in range(5)
+    ]
+    payload.append({"username": "bulk-dup", "email": "bulk-existing@seasame.com"})
+    resp = client.post(
+        "/users/bulk", data=json.dumps(payload), content_type="application/json"
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 201
+    assert data["created"] == 5
+    assert data["results"][-1]["status"] == "duplicate"
+    emails = {user.email for user in User.query.filter(User.email.like("bulk-%"))}
+    assert emails == {f"bulk-user-{i}@seasame.com" for i in range(5)} | {
+        "bulk-existing@seasame.com"
+    }
+
+    resp = client.post(
+        "/users/bulk", data=json.dumps(payload[:2]), content_type="application/json"
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 400
+    assert data["created"] == 0
+
+
+def test_add_user_duplicate_email_case_insensitive(test_app, test_database, add_user):
+    add_user("casey", "casey@seasame.com")
+    client = test_app.test_client()
+    resp = client.post(
+        "/users",
+        data=json.dumps({"username": "casey", "email": "Casey@Seasame.com"}),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 400
+    assert "Sorry. That email already exists." in data["message"]
+
+
 # GET route
 def test_single_user(test_app, test_database, add_user):
     user = add_user("Sir Ed", "sired@everest.com")
@@ -74,6 +117,85 @@ def test_single_user(test_app, test_database, add_user):
     assert "sired@everest.com" in data["email"]
 
 
+def test_single_user_cached(test_app, test_database, add_user, users_cache):
+    user_id = add_user("cached", "cached@everest.com").id
+    client = test_app.test_client()
+    assert client.get(f"/users/{user_id}").status_code == 200
+    assert users_cache.stats()["misses"] == 1
+
+    # changes made behind the cache's back are not seen until it is invalidated
+    test_database.session.query(User).filter_by(id=user_id).update(
+        {"username": "stale"}
+    )
+    test_database.session.commit()
+    data = json.loads(client.get(f"/users/{user_id}").data.decode())
+    assert data["username"] == "cached"
+    assert users_cache.stats()["hits"] == 1
+
+    resp = client.put(
+        f"/users/{user_id}",
+        data=json.dumps({"username": "updated", "email": "cached@everest.com"}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+    data = json.loads(client.get(f"/users/{user_id}").data.decode())
+    assert data["username"] == "updated"
+
+    assert client.delete(f"/users/{user_id}").status_code == 200
+    assert client.get(f"/users/{user_id}").status_code == 404
+
+
+def test_single_user_conditional_get(test_app, test_database, add_user):
+    user = add_user("etag", "etag@everest.com")
+    client = test_app.test_client()
+    resp_one = client.get(f"/users/{user.id}")
+    etag = resp_one.headers["ETag"]
+    assert "Last-Modified" in resp_one.headers
+
+    resp_two = client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+    assert resp_two.status_code == 304
+    assert resp_two.headers["ETag"] == etag
+
+    client.put(
+        f"/users/{user.id}",
+        data=json.dumps({"username": "etag-changed", "email": "etag@everest.com"}),
+        content_type="application/json",
+    )
+    resp_three = client.get(f"/users/{user.id}", headers={"If-None-Match": etag})
+    assert resp_three.status_code == 200
+    assert resp_three.headers["ETag"] != etag
+
+
+def test_all_users_conditional_get(test_app, test_database, add_user):
+    add_user("etag-list", "etag-list@everest.com")
+    client = test_app.test_client()
+    etag = client.get("/users").headers["ETag"]
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/users?all=true").headers["ETag"] != etag
+
+    user = add_user("etag-list-2", "etag-list-2@everest.com")
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 200
+    etag = client.get("/users").headers["ETag"]
+
+    client.delete(f"/users/{user.id}")
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_all_users_modified_since_delete(test_app, test_database, add_user):
+    user = add_user("ims-list", "ims-list@everest.com")
+    client = test_app.test_client()
+    last_modified = client.get("/users").headers["Last-Modified"]
+    headers = {"If-Modified-Since": last_modified}
+    assert client.get("/users", headers=headers).status_code == 304
+
+    # Last-Modified has a resolution of one second
+    time.sleep(1)
+    client.delete(f"/users/{user.id}")
+    resp = client.get("/users", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["Last-Modified"] != last_modified
+
+
 def test_single_user_incorrect_id(test_app, test_database):
     client = test_app.test_client()
     resp = client.get("/users/999")
@@ -98,6 +220,273 @@ def test_all_users(test_app, test_database, add_user):
     assert "ernie@seasamestreet.com" in data[1]["email"]
 
 
+def test_all_users_paginated(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    for i in range(5):
+        add_user(f"page-user-{i}", f"page-user-{i}@seasamestreet.com")
+    client = test_app.test_client()
+
+    seen = []
+    url = "/users?limit=2"
+    while url:
+        resp = client.get(url)
+        assert resp.status_code == 200
+        data = json.loads(resp.data.decode())
+        assert len(data) <= 2
+        seen.extend(item["username"] for item in data)
+        cursor = resp.headers.get("X-Next-Cursor")
+        url = f"/users?limit=2&cursor={cursor}" if cursor else None
+
+    assert seen == [f"page-user-{i}" for i in range(5)]
+
+
+def test_all_users_unpaginated(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    for i in range(3):
+        add_user(f"all-user-{i}", f"all-user-{i}@seasamestreet.com")
+    client = test_app.test_client()
+    resp = client.get("/users?all=true&limit=1")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert len(data) == 3
+    assert "X-Next-Cursor" not in resp.headers
+
+
+def test_all_users_filtered(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    add_user("Alice", "alice@seasamestreet.com")
+    add_user("al_bert", "albert@elmo.com")
+    add_user("alfred", "ALFRED@seasamestreet.com")
+    add_user("bob", "bob@seasamestreet.com")
+    inactive = add_user("albus", "albus@seasamestreet.com")
+    inactive.active = False
+    test_database.session.commit()
+    client = test_app.test_client()
+
+    def usernames(url):
+        resp = client.get(url)
+        assert resp.status_code == 200
+        return [item["username"] for item in json.loads(resp.data.decode())]
+
+    assert usernames("/users?username=AL") == [
+        "Alice",
+        "al_bert",
+        "alfred",
+        "albus",
+    ]
+    # LIKE wildcards in the prefix are matched literally
+    assert usernames("/users?username=al_") == ["al_bert"]
+    assert usernames("/users?email=alf") == ["alfred"]
+    assert usernames("/users?username=al&active=false") == ["albus"]
+    assert usernames("/users?username=al&active=true&limit=1") == ["Alice"]
+    assert usernames("/users?created_after=2999-01-01T00:00:00") == []
+    assert len(usernames("/users?created_before=2999-01-01T00:00:00%2B02:00")) == 5
+
+
+def test_all_users_filtered_ndjson(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    add_user("streamed", "streamed@seasamestreet.com")
+    add_user("skipped", "skipped@seasamestreet.com")
+    resp = test_app.test_client().get(
+        "/users?username=str", headers={"Accept": "application/x-ndjson"}
+    )
+    lines = resp.data.decode().splitlines()
+    assert [json.loads(line)["username"] for line in lines] == ["streamed"]
+
+
+def test_all_users_invalid_filter(test_app, test_database):
+    client = test_app.test_client()
+    resp = client.get("/users?active=maybe")
+    assert resp.status_code == 400
+    assert "active" in json.loads(resp.data.decode())["errors"]
+    resp = client.get("/users?created_after=yesterday")
+    assert resp.status_code == 400
+
+
+def test_users_by_ids(test_app, test_database, add_user):
+    first = add_user("batch-one", "batch-one@seasamestreet.com").id
+    second = add_user("batch-two", "batch-two@seasamestreet.com").id
+    client = test_app.test_client()
+    resp = client.get(f"/users?ids={second},999999,{first}")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert [item["username"] for item in data] == ["batch-two", "batch-one"]
+    assert resp.headers["X-Missing-Ids"] == "999999"
+
+
+def test_users_by_ids_cached(test_app, test_database, add_user, users_cache):
+    ids = [
+        add_user(f"cached-{i}", f"cached-{i}@seasamestreet.com").id for i in range(3)
+    ]
+    client = test_app.test_client()
+    client.get(f"/users/{ids[1]}")
+    resp = client.get(f"/users?ids={','.join(map(str, ids))}")
+    assert [item["id"] for item in json.loads(resp.data.decode())] == ids
+    assert users_cache.stats()["hits"] == 1
+    # the batch filled the cache with the other two
+    client.get(f"/users?ids={ids[0]},{ids[2]}")
+    assert users_cache.stats()["hits"] == 3
+
+
+def test_all_users_ndjson(test_app, test_database, add_user, monkeypatch):
+    test_database.session.query(User).delete()
+    for i in range(3):
+        add_user(f"stream-user-{i}", f"stream-user-{i}@seasamestreet.com")
+    monkeypatch.setitem(test_app.config, "USERS_STREAM_BATCH_SIZE", 2)
+    client = test_app.test_client()
+    resp = client.get("/users", headers={"Accept": "application/x-ndjson"})
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert [line["username"] for line in lines] == [
+        f"stream-user-{i}" for i in range(3)
+    ]
+    assert "stream-user-0@seasamestreet.com" in lines[0]["email"]
+
+
+def test_all_users_total_count(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    test_app.extensions.pop("users_count_cache", None)
+    for i in range(3):
+        add_user(f"counted-{i}", f"counted-{i}@example.com")
+    add_user("other", "other@example.com")
+    client = test_app.test_client()
+    assert "X-Total-Count" not in client.get("/users").headers
+
+    for mode in ("exact", "estimated", "cached"):
+        resp = client.get(f"/users?limit=1&count={mode}")
+        assert resp.headers["X-Total-Count"] == "4"
+        resp = client.get(f"/users?username=counted&count={mode}")
+        assert resp.headers["X-Total-Count"] == "3"
+    resp = client.get("/users?count=exact", headers={"Accept": "application/x-ndjson"})
+    assert resp.headers["X-Total-Count"] == "4"
+
+    resp = client.get("/users?count=all")
+    assert resp.status_code == 400
+    assert "count" in resp.json["errors"]
+
+
+def test_all_users_total_count_cached(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    test_app.extensions.pop("users_count_cache", None)
+    add_user("cached-count", "cached-count@example.com")
+    client = test_app.test_client()
+    assert client.get("/users?count=cached").headers["X-Total-Count"] == "1"
+    add_user("cached-count-2", "cached-count-2@example.com")
+    # up to USERS_COUNT_CACHE_TTL seconds old
+    assert client.get("/users?count=cached").headers["X-Total-Count"] == "1"
+    assert client.get("/users?count=exact").headers["X-Total-Count"] == "2"
+    test_app.extensions.pop("users_count_cache")
+    assert client.get("/users?count=cached").headers["X-Total-Count"] == "2"
+
+
+def test_all_users_total_count_estimated(
+    test_app, test_database, add_user, monkeypatch
+):
+    test_database.session.query(User).delete()
+    for i in range(20):
+        add_user(f"estimated-{i}", f"estimated-{i}@example.com")
+    test_database.session.execute(text("ANALYZE users"))
+    test_database.session.commit()
+    monkeypatch.setitem(test_app.config, "USERS_COUNT_EXACT_BELOW", 0)
+    client = test_app.test_client()
+    # pg_class statistics, fresh after ANALYZE
+    resp = client.get("/users?limit=1&count=estimated")
+    assert resp.headers["X-Total-Count"] == "20"
+    # the planner's row estimate for the filtered query
+    resp = client.get("/users?limit=1&active=true&count=estimated")
+    assert 1 <= int(resp.headers["X-Total-Count"]) <= 20
+
+
+def test_head_users(test_app, test_database, add_user):
+    test_database.session.query(User).delete()
+    add_user("head", "head@example.com")
+    client = test_app.test_client()
+    resp = client.head("/users")
+    assert resp.status_code == 200
+    assert resp.data == b""
+    assert resp.headers["X-Total-Count"] == "1"
+    assert "Content-Length" not in resp.headers
+    assert resp.headers["ETag"] == client.get("/users").headers["ETag"]
+
+    resp = client.head("/users", headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp.status_code == 304
+    resp = client.head("/users?email=nobody&count=exact")
+    assert resp.headers["X-Total-Count"] == "0"
+
+
+def test_users_sparse_fields(test_app, test_database, add_user, query_budget):
+    test_database.session.query(User).delete()
+    user_id = add_user("sparse", "sparse@example.com").id
+    add_user("sparse-2", "sparse-2@example.com")
+    client = test_app.test_client()
+
+    with query_budget(2) as statements:
+        resp = client.get("/users?limit=1&fields=email,id")
+    assert resp.status_code == 200
+    assert resp.json == [{"id": user_id, "email": "sparse@example.com"}]
+    assert "X-Next-Cursor" in resp.headers
+    assert "users.username" not in statements[-1]
+
+    resp = client.get("/users?all=true&fields=username")
+    assert resp.json == [{"username": "sparse"}, {"username": "sparse-2"}]
+    resp = client.get(f"/users?ids={user_id}&fields=id")
+    assert resp.json == [{"id": user_id}]
+    resp = client.get("/users?fields=email", headers={"Accept": "application/x-ndjson"})
+    lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert lines == [{"email": "sparse@example.com"}, {"email": "sparse-2@example.com"}]
+
+    resp = client.get("/users?fields=id,password")
+    assert resp.status_code == 400
+    assert "'password'" in resp.json["errors"]["fields"]
+
+
+def test_single_user_sparse_fields(test_app, test_database, add_user):
+    user_id = add_user("sparse-one", "sparse-one@example.com").id
+    client = test_app.test_client()
+    resp = client.get(f"/users/{user_id}?fields=id,email")
+    assert resp.json == {"id": user_id, "email": "sparse-one@example.com"}
+    etag = resp.headers["ETag"]
+    assert etag != client.get(f"/users/{user_id}").headers["ETag"]
+
+    resp = client.get(
+        f"/users/{user_id}?fields=id,email", headers={"If-None-Match": etag}
+    )
+    assert resp.status_code == 304
+    resp = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert client.get(f"/users/{user_id}?fields=nope").status_code == 400
+
+
+def test_cache_entries_are_json(test_app, test_database, add_user, users_cache):
+    user_id = add_user("json-cached", "json-cached@example.com").id
+    client = test_app.test_client()
+    first = client.get(f"/users/{user_id}").json
+    entry = json.loads(users_cache.get(user_id))
+    assert entry["email"] == "json-cached@example.com"
+    assert client.get(f"/users/{user_id}").json == first
+
+    # an entry from before a column was added is read from the database again
+    del entry["updated_at"]
+    users_cache.set(user_id, json.dumps(entry))
+    resp = client.get(f"/users/{user_id}")
+    assert resp.json == first
+    assert "ETag" in resp.headers
+    assert json.loads(users_cache.get(user_id))["updated_at"]
+
+
+def test_single_user_sparse_fields_cached(
+    test_app, test_database, add_user, users_cache
+):
+    user_id = add_user("sparse-cached", "sparse-cached@example.com").id
+    client = test_app.test_client()
+    resp = client.get(f"/users/{user_id}?fields=username")
+    assert resp.json == {"username": "sparse-cached"}
+    # the cache keeps whole users, so a later full read is complete
+    resp = client.get(f"/users/{user_id}")
+    assert resp.json["email"] == "sparse-cached@example.com"
+
+
 # DELETE Route
 def test_remove_user(test_app, test_database, add_user):
     test_database.session.query(User).delete()  # clear database
@@ -147,6 +536,28 @@ def test_update_user(test_app, test_database, add_user):
     assert "me@seasame.com" in data["email"]
 
 
+def test_update_user_duplicate_email(test_app, test_database, add_user):
+    add_user("taken", "taken@seasame.com")
+    user = add_user("mover", "mover@seasame.com")
+    client = test_app.test_client()
+    resp = client.put(
+        f"/users/{user.id}",
+        data=json.dumps({"username": "mover", "email": "TAKEN@seasame.com"}),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 400
+    assert "Sorry. That email already exists." in data["message"]
+
+    # keeping your own email is not a conflict
+    resp = client.put(
+        f"/users/{user.id}",
+        data=json.dumps({"username": "moved", "email": "mover@seasame.com"}),
+        content_type="application/json",
+    )
+    assert resp.status_code == 200
+
+
 @pytest.mark.parametrize(
     "user_id, payload, status_code, message",
     [
@@ -172,5 +583,57 @@ def test_update_user_invalid(
     assert message in data["message"]
 
 
+# PATCH route
+def test_patch_user(test_app, test_database, add_user):
+    user = add_user("patch-me", "patch-me@seasame.com")
+    client = test_app.test_client()
+    resp = client.patch(
+        f"/users/{user.id}",
+        data=json.dumps({"username": "patched"}),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert f"{user.id} was updated!" in data["message"]
+
+    data = json.loads(client.get(f"/users/{user.id}").data.decode())
+    assert data["username"] == "patched"
+    assert data["email"] == "patch-me@seasame.com"
+
+
+def test_patch_user_duplicate_email(test_app, test_database, add_user):
+    add_user("taken", "taken-patch@seasame.com")
+    user = add_user("mover", "mover-patch@seasame.com")
+    client = test_app.test_client()
+    resp = client.patch(
+        f"/users/{user.id}",
+        data=json.dumps({"email": "TAKEN-patch@seasame.com"}),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 400
+    assert "Sorry. That email already exists." in data["message"]
+
+
+@pytest.mark.parametrize(
+    "user_id, payload, status_code, message",
+    [
+        [1, {}, 400, "Nothing to update."],
+        [1, {"email": None}, 400, "Input payload validation failed"],
+        [999, {"username": "shane"}, 404, "User 999 does not exist"],
+    ],
+)
+def test_patch_user_invalid(
+    test_app, test_database, user_id, payload, status_code, message
+):
+    client = test_app.test_client()
+    resp = client.patch(
+        f"/users/{user_id}", data=json.dumps(payload), content_type="application/json"
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == status_code
+    assert message in data["message"]
+
+
 # sudo docker-compose exec api python -m pytest "src/tests"
 # sudo docker-compose exec api python -m pytest "src/tests" --lf  (run tests that last failed)
@@ -0,0 +1,120 @@
+# src/tests/unit/test_admission_unit.py
+
+import pytest
+
+from src.admission import (  # isort:skip
+    InFlightLimiter,
+    SharedTokenBuckets,
+    TokenBuckets,
+    queue_wait,
+    refill,
+    route_limits,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Runs the token bucket script's arithmetic in Python."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.buckets = {}
+        self.calls = []
+
+    def eval(self, script, numkeys, key, rate, burst):
+        self.calls.append(key)
+        tokens, updated = self.buckets.get(key, (burst, self.clock()))
+        tokens, wait = refill(tokens, updated, self.clock(), rate, burst)
+        self.buckets[key] = (tokens, self.clock())
+        return str(wait).encode()
+
+
+class Unavailable(Exception):
+    pass
+
+
+class DownRedis:
+    def eval(self, *args):
+        raise Unavailable()
+
+
+def test_token_bucket_burst_then_rate():
+    clock = Clock()
+    buckets = TokenBuckets(rate=2, burst=3, clock=clock)
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == pytest.approx(0.5)
+    # other clients have their own bucket
+    assert buckets.take("b") == 0
+
+    clock.now = 0.5
+    assert buckets.take("a") == 0
+    assert buckets.take("a") > 0
+    clock.now = 100
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") > 0
+
+
+def test_token_buckets_bounded():
+    buckets = TokenBuckets(rate=1, burst=1, maxsize=2, clock=Clock())
+    for key in ("a", "b", "c"):
+        buckets.take(key)
+    assert list(buckets._buckets) == ["b", "c"]
+
+
+def test_shared_token_buckets():
+    clock = Clock()
+    client = FakeRedis(clock)
+    buckets = SharedTokenBuckets(client, rate=1, burst=2)
+    other_worker = SharedTokenBuckets(client, rate=1, burst=2)
+    assert buckets.take("10.0.0.1") == 0
+    assert other_worker.take("10.0.0.1") == 0
+    assert buckets.take("10.0.0.1") == pytest.approx(1.0)
+    assert client.calls[0] == "admission:10.0.0.1"
+
+
+def test_shared_token_buckets_unavailable():
+    buckets = SharedTokenBuckets(DownRedis(), rate=1, burst=1, unavailable=Unavailable)
+    assert buckets.take("a") == 0
+    with pytest.raises(Unavailable):
+        SharedTokenBuckets(DownRedis(), rate=1, burst=1).take("a")
+
+
+def test_in_flight_limiter():
+    limiter = InFlightLimiter(2, {"/users/bulk": 1})
+    assert limiter.acquire("/users")
+    assert limiter.acquire("/users")
+    assert not limiter.acquire("/users")
+    assert limiter.acquire("/users/bulk")
+    assert not limiter.acquire("/users/bulk")
+
+    limiter.release("/users")
+    assert limiter.running("/users") == 1
+    assert limiter.acquire("/users")
+
+
+def test_in_flight_limiter_unlimited():
+    limiter = InFlightLimiter(0)
+    assert all(limiter.acquire("/users") for _ in range(100))
+
+
+def test_route_limits():
+    assert route_limits("/users/bulk=2, /users=20") == {"/users/bulk": 2, "/users": 20}
+    assert route_limits(None) == {}
+
+
+def test_queue_wait():
+    now = 1700000010.0
+    # seconds (nginx $msec), milliseconds (Heroku) and microseconds
+    assert queue_wait("t=1700000009.750", now) == pytest.approx(0.25)
+    assert queue_wait("1700000009750", now) == pytest.approx(0.25)
+    assert queue_wait("t=1700000009750000", now) == pytest.approx(0.25)
+    # a proxy clock slightly ahead is not a negative wait
+    assert queue_wait("t=1700000011", now) == 0
+    assert queue_wait("soon", now) is None
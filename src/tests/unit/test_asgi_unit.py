@@ -0,0 +1,34 @@
+# src/tests/unit/test_asgi_unit.py
+
+import pytest
+from sqlalchemy.pool import NullPool
+
+from src.config import engine_options
+
+pytest.importorskip("asyncpg")
+database = pytest.importorskip("src.asgi.database")
+
+
+def test_async_engine_options_pooled(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "20")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    options, timeout = database.async_engine_options(engine_options())
+    assert "poolclass" not in options
+    assert options["pool_size"] == 20
+    assert options["pool_pre_ping"] is True
+    assert options["connect_args"] == {"server_settings": {"statement_timeout": "5000"}}
+    assert timeout is None
+
+
+def test_async_engine_options_pgbouncer(monkeypatch):
+    monkeypatch.setenv("DB_PGBOUNCER_TRANSACTION_MODE", "true")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "1500")
+    options, timeout = database.async_engine_options(engine_options())
+    assert options["poolclass"] is NullPool
+    assert options["connect_args"] == {"statement_cache_size": 0}
+    assert timeout == 1500
+
+
+def test_server_settings():
+    settings = database.server_settings("-c statement_timeout=10 -c search_path=a")
+    assert settings == {"statement_timeout": "10", "search_path": "a"}
@@ -0,0 +1,148 @@
+# src/tests/unit/test_cache.py
+
+
+import pytest
+
+from src.api.users.cache import LRUCache, SharedCache, create_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Local stand-in for the shared cache server (redis-py API subset)."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires <= self.clock():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, None if ex is None else self.clock() + ex)
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value, ex))
+
+    def execute(self):
+        for key, value, ex in self.commands:
+            self.client.set(key, value, ex=ex)
+        self.commands = []
+
+
+def test_lru_cache_hit_and_miss():
+    cache = LRUCache(maxsize=2, ttl=60)
+    assert cache.get(1) is None
+    cache.set(1, b"one")
+    assert cache.get(1) == b"one"
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set(1, b"one")
+    cache.set(2, b"two")
+    cache.get(1)
+    cache.set(3, b"three")
+    assert cache.get(2) is None
+    assert cache.get(1) == b"one"
+    assert cache.get(3) == b"three"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_expires_entries():
+    clock = FakeClock()
+    cache = LRUCache(maxsize=2, ttl=10, clock=clock)
+    cache.set(1, b"one")
+    clock.now = 9.9
+    assert cache.get(1) == b"one"
+    clock.now = 10
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_lru_cache_delete():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set(1, b"one")
+    cache.delete(1)
+    cache.delete(2)
+    assert cache.get(1) is None
+
+
+def test_shared_cache():
+    clock = FakeClock()
+    client = FakeRedis(clock)
+    cache = SharedCache(client, ttl=10)
+    other_worker = SharedCache(client, ttl=10)
+    cache.set(1, b"one")
+    assert other_worker.get(1) == b"one"
+    other_worker.delete(1)
+    assert cache.get(1) is None
+    cache.set(2, b"two")
+    clock.now = 10
+    assert cache.get(2) is None
+    assert cache.stats() == {"hits": 0, "misses": 2, "evictions": 0}
+    assert other_worker.stats()["hits"] == 1
+
+
+def test_cache_get_and_set_many():
+    clock = FakeClock()
+    for cache in (LRUCache(maxsize=5, ttl=10), SharedCache(FakeRedis(clock), ttl=10)):
+        assert cache.get_many([]) == {}
+        cache.set_many({1: b"one", 2: b"two"})
+        assert cache.get_many([1, 2, 3]) == {1: b"one", 2: b"two"}
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (2, 1)
+
+
+def test_cache_delete_many():
+    for cache in (
+        LRUCache(maxsize=5, ttl=10),
+        SharedCache(FakeRedis(FakeClock()), ttl=10),
+    ):
+        cache.set_many({1: b"one", 2: b"two", 3: b"three"})
+        cache.delete_many([1, 3, 4])
+        cache.delete_many([])
+        assert cache.get_many([1, 2, 3]) == {2: b"two"}
+
+
+def test_create_cache():
+    config = {
+        "USERS_CACHE_BACKEND": None,
+        "USERS_CACHE_MAXSIZE": 5,
+        "USERS_CACHE_TTL": 30,
+    }
+    assert create_cache(config) is None
+    config["USERS_CACHE_BACKEND"] = "memory"
+    cache = create_cache(config)
+    assert isinstance(cache, LRUCache)
+    assert (cache.maxsize, cache.ttl) == (5, 30)
+    config["USERS_CACHE_BACKEND"] = "memcached"
+    with pytest.raises(ValueError):
+        create_cache(config)
@@ -0,0 +1,51 @@
+# src/tests/unit/test_compression_unit.py
+
+import gzip
+import zlib
+
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+from src.compression import (  # isort:skip
+    GzipEncoder,
+    choose_encoding,
+    compress_chunks,
+    is_compressible,
+)
+
+
+def accept(value):
+    return parse_accept_header(value, Accept)
+
+
+def test_choose_encoding_by_quality():
+    encodings = ["br", "zstd", "gzip"]
+    assert choose_encoding(accept("gzip, br"), encodings) == "br"
+    assert choose_encoding(accept("gzip;q=1, br;q=0.5"), encodings) == "gzip"
+    assert choose_encoding(accept("*"), ["gzip"]) == "gzip"
+    assert choose_encoding(accept("br"), ["gzip"]) is None
+
+
+def test_choose_encoding_refused():
+    assert choose_encoding(accept("gzip;q=0"), ["gzip"]) is None
+    assert choose_encoding(accept("identity"), ["gzip"]) is None
+    assert choose_encoding(accept(""), ["gzip"]) is None
+
+
+def test_is_compressible():
+    assert is_compressible("application/json")
+    assert is_compressible("application/x-ndjson")
+    assert is_compressible("application/problem+json")
+    assert is_compressible("text/html")
+    assert not is_compressible("image/png")
+    assert not is_compressible("application/gzip")
+
+
+def test_compress_chunks_flushes_each_chunk():
+    chunks = [b'{"id": 1}\n', b'{"id": 2}\n']
+    encoded = list(compress_chunks(iter(chunks), GzipEncoder(6)))
+    assert len(encoded) == 3
+    assert gzip.decompress(b"".join(encoded)) == b"".join(chunks)
+    # each piece is flushed, so it decodes without waiting for the next one
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decoder.decompress(encoded[0]) == chunks[0]
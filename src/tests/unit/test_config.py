@@ -3,12 +3,18 @@
 
 import os
 
+from sqlalchemy.pool import NullPool
+
+from src.config import engine_options
+from src.database import TimedQueuePool
+
 
 def test_development_config(test_app):
     test_app.config.from_object("src.config.DevelopmentConfig")
     assert test_app.config["SECRET_KEY"] == "my_precious"
     assert not test_app.config["TESTING"]
     assert test_app.config["SQLALCHEMY_DATABASE_URI"] == os.environ.get("DATABASE_URL")
+    assert test_app.config["SQLALCHEMY_ENGINE_OPTIONS"]["pool_pre_ping"]
 
 
 def test_testing_config(test_app):
@@ -26,3 +32,28 @@ def test_production_config(test_app):
     assert test_app.config["SECRET_KEY"] == os.getenv("SECRET_KEY", "my_precious")
     assert not test_app.config["TESTING"]
     assert test_app.config["SQLALCHEMY_DATABASE_URI"] == os.environ.get("DATABASE_URL")
+
+
+def test_engine_options(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "8")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "2")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    options = engine_options()
+    assert options["poolclass"] is TimedQueuePool
+    assert options["pool_size"] == 8
+    assert options["max_overflow"] == 2
+    assert not options["pool_pre_ping"]
+    assert options["connect_args"] == {"options": "-c statement_timeout=5000"}
+
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "0")
+    assert "connect_args" not in engine_options()
+
+
+def test_engine_options_pgbouncer(monkeypatch):
+    monkeypatch.setenv("DB_PGBOUNCER_TRANSACTION_MODE", "true")
+    monkeypatch.setenv("DB_STATEMENT_TIMEOUT_MS", "5000")
+    options = engine_options()
+    assert options["poolclass"] is NullPool
+    assert options["transaction_statement_timeout"] == 5000
+    assert "connect_args" not in options
@@ -0,0 +1,66 @@
+# src/tests/unit/test_gunicorn_conf.py
+
+
+import importlib
+
+from src import gunicorn_conf
+from src.config import BaseConfig, engine_options
+
+from src.gunicorn_conf import (  # isort:skip
+    available_cpus,
+    cgroup_cpu_limit,
+    pool_capacity,
+    worker_settings,
+)
+
+
+def test_worker_settings():
+    assert worker_settings(2, "sync", 15) == (5, 1)
+    assert worker_settings(2, "gthread", 15) == (2, 15)
+    assert worker_settings(2, "gthread", None) == (2, 4)
+    assert worker_settings(4, "uvicorn", 15) == (4, 1)
+
+
+def test_worker_settings_within_max_connections():
+    # 4 workers of 15 threads would need 60 connections
+    assert worker_settings(4, "gthread", 15, max_connections=40) == (2, 15)
+    assert worker_settings(4, "sync", 15, max_connections=5) == (5, 1)
+    # always at least one worker
+    assert worker_settings(4, "uvicorn", 15, max_connections=10) == (1, 1)
+
+
+def test_in_flight_cap_below_threads():
+    # otherwise a worker never has enough requests running for it to trip
+    _, threads = worker_settings(1, "gthread", pool_capacity(engine_options()))
+    assert BaseConfig.ADMISSION_MAX_IN_FLIGHT < threads
+
+
+def test_cgroup_cpu_limit(tmp_path):
+    assert cgroup_cpu_limit(str(tmp_path)) is None
+
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) is None
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("50000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) == 0.5
+
+    (tmp_path / "cpu.max").write_text("max 100000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) is None
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    assert cgroup_cpu_limit(str(tmp_path)) == 1.5
+    assert available_cpus(str(tmp_path)) <= 2
+
+
+def test_gunicorn_conf_from_env(monkeypatch):
+    monkeypatch.setenv("GUNICORN_WORKER_CLASS", "uvicorn")
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("PORT", "8080")
+    monkeypatch.setenv("GUNICORN_MAX_REQUESTS", "500")
+    conf = importlib.reload(gunicorn_conf)
+    assert conf.worker_class == "uvicorn.workers.UvicornWorker"
+    assert conf.workers == 3
+    assert conf.bind == "0.0.0.0:8080"
+    assert conf.max_requests == 500
+    assert conf.preload_app
+    assert conf.timeout > 30
@@ -0,0 +1,33 @@
+# src/tests/unit/test_metrics_unit.py
+
+from src.metrics import Metrics
+
+
+def test_metrics_histogram_is_cumulative():
+    metrics = Metrics()
+    metrics.observe("/users", "GET", 0.004, 2, 0.001)
+    metrics.observe("/users", "GET", 0.2, 3, 0.05)
+    metrics.observe("/users", "GET", 30.0, 1, 0.01)
+    text = metrics.render()
+
+    labels = 'route="/users",method="GET"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.25"}} 2' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="10.0"}} 2' in text
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+    assert f"http_request_duration_seconds_count{{{labels}}} 3" in text
+    assert f"db_queries_total{{{labels}}} 6" in text
+    assert "db_pool_checkouts_total" in text
+    assert "users_cache_hits_total" not in text
+
+
+def test_metrics_cache_stats():
+    text = Metrics().render({"hits": 4, "misses": 1, "evictions": 0, "size": 3})
+    assert "users_cache_hits_total 4" in text
+    assert "users_cache_size 3" in text
+
+
+def test_metrics_admission_stats():
+    text = Metrics().render(admission_stats={"rate_limited": 2, "shed": 5})
+    assert 'admission_rejected_total{reason="rate_limited"} 2' in text
+    assert 'admission_rejected_total{reason="shed"} 5' in text
@@ -0,0 +1,31 @@
+# src/tests/unit/test_replicas_unit.py
+
+from src.replicas import ReplicaRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_router_round_robin():
+    router = ReplicaRouter(["one", "two", "three"], retry_after=30)
+    first_choices = [next(router.candidates()) for _ in range(6)]
+    assert first_choices == ["one", "two", "three", "one", "two", "three"]
+    assert list(router.candidates()) == ["one", "two", "three"]
+
+
+def test_router_skips_replicas_marked_down():
+    clock = FakeClock()
+    router = ReplicaRouter(["one", "two"], retry_after=30, clock=clock)
+    router.mark_down("one")
+    assert [next(router.candidates()) for _ in range(4)] == ["two"] * 4
+
+    router.mark_down("two")
+    assert list(router.candidates()) == []
+
+    clock.now = 30
+    assert sorted(router.candidates()) == ["one", "two"]
@@ -0,0 +1,83 @@
+# src/tests/unit/test_serializers.py
+
+import json
+from datetime import datetime
+
+import pytest
+from flask_restx import Model, fields, marshal
+
+import src.api.users.serializers
+from src.api.users.serializers import compile_serializer, dumps
+
+from src.api.users.views import (  # isort:skip
+    field_list,
+    serialize_user,
+    serializer_for,
+    user,
+)
+
+
+class AttrObject:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def test_compiled_serializer_matches_marshal():
+    serialize = compile_serializer(user)
+    rows = [
+        AttrObject(
+            id=1,
+            username="shane",
+            email="srich@gmail.com",
+            created_date=datetime(2021, 6, 1, 12, 30, 15, 123456),
+        ),
+        {"id": "2", "username": "maike", "email": "maike@gmail.com"},
+        AttrObject(),
+    ]
+    for row in rows:
+        assert serialize(row) == dict(marshal(row, user))
+        assert list(serialize(row)) == list(marshal(row, user))
+
+
+def test_compiled_serializer_only():
+    serialize = compile_serializer(user, only={"email", "id"})
+    row = {"id": 1, "username": "shane", "email": "srich@gmail.com"}
+    assert list(serialize(row).items()) == [("id", 1), ("email", "srich@gmail.com")]
+
+
+def test_compiled_serializer_generic_fields():
+    model = Model(
+        "Generic",
+        {
+            "name": fields.String(attribute="username"),
+            "joined": fields.DateTime(dt_format="rfc822"),
+            "active": fields.Boolean(default=True),
+            "tags": fields.List(fields.String),
+        },
+    )
+    row = AttrObject(
+        username="shane", joined=datetime(2021, 6, 1, 12, 30), tags=["a", 1]
+    )
+    assert compile_serializer(model)(row) == dict(marshal(row, model))
+
+
+def test_dumps_without_orjson(test_app, monkeypatch):
+    monkeypatch.setattr(src.api.users.serializers, "orjson", None)
+    data = [{"id": 1, "username": "shane"}]
+    assert dumps(data) == json.dumps(data)
+
+
+def test_field_list():
+    assert field_list("email,id") == ("id", "email")
+    assert field_list(" id , id") == ("id",)
+    with pytest.raises(ValueError, match="'password'"):
+        field_list("id,password")
+    with pytest.raises(ValueError):
+        field_list("")
+
+
+def test_serializer_for_fields():
+    assert serializer_for(None) is serialize_user
+    assert serializer_for(("id", "email")) is serializer_for(("id", "email"))
+    row = {"id": 1, "username": "u", "email": "e", "created_date": None}
+    assert serializer_for(("id", "email"))(row) == {"id": 1, "email": "e"}
@@ -0,0 +1,37 @@
+# src/tests/unit/test_startup.py
+
+# cold start of a fresh interpreter, see src/startup.py
+
+from src.startup import parse_importtime, profile_startup
+
+DEV_ONLY = ("flask_admin", "wtforms")
+
+
+def imported(modules):
+    return {name.split(".")[0] for name, own, cumulative in modules}
+
+
+def test_parse_importtime():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   flask.json\n"
+        "import time:      1500 |       2000 | flask\n"
+    )
+    assert parse_importtime(output) == [
+        ("flask.json", 0.00012, 0.00012),
+        ("flask", 0.0015, 0.002),
+    ]
+
+
+def test_production_startup_skips_dev_only_modules():
+    import_seconds, create_app_seconds, modules = profile_startup(
+        {"FLASK_ENV": "production"}
+    )
+    assert import_seconds > 0 and create_app_seconds > 0
+    assert "flask_restx" in imported(modules)
+    assert not imported(modules) & set(DEV_ONLY)
+
+
+def test_development_startup_loads_admin():
+    modules = profile_startup({"FLASK_ENV": "development"})[2]
+    assert set(DEV_ONLY) <= imported(modules)
@@ -6,18 +6,24 @@ from datetime import datetime
 import pytest
 
 import src.api.users.views
+from src.api.users.crud import EmailAlreadyExists
+from src.api.users.pagination import decode_cursor, encode_cursor
 
 
-def test_add_user(test_app, monkeypatch):
-    def mock_get_user_by_email(email):
-        return None
+def mock_get_users_version():
+    return datetime(2021, 6, 1, 12, 30), 2
+
+
+class AttrDict(dict):
+    def __init__(self, *args, **kwargs):
+        super(AttrDict, self).__init__(*args, **kwargs)
+        self.__dict__ = self
 
+
+def test_add_user(test_app, monkeypatch):
     def mock_add_user(username, email):
         return True
 
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
     monkeypatch.setattr(src.api.users.views, "add_user", mock_add_user)
 
     client = test_app.test_client()
@@ -56,15 +62,9 @@ def test_add_user_invalid_json_keys(test_app, monkeypatch):
 
 
 def test_add_user_duplicate_email(test_app, monkeypatch):
-    def mock_get_user_by_email(email):
-        return True
-
     def mock_add_user(username, email):
-        return True
+        raise EmailAlreadyExists(email)
 
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
     monkeypatch.setattr(src.api.users.views, "add_user", mock_add_user)
 
     client = test_app.test_client()
@@ -83,8 +83,100 @@ def test_add_user_duplicate_email(test_app, monkeypatch):
     assert "Sorry. That email already exists." in data["message"]
 
 
+def test_add_users_bulk(test_app, monkeypatch):
+    added = []
+
+    def mock_get_existing_emails(emails):
+        return {"taken@gmail.com"}
+
+    def mock_add_users(users):
+        added.extend(users)
+        return {user["email"] for user in users}
+
+    monkeypatch.setattr(
+        src.api.users.views, "get_existing_emails", mock_get_existing_emails
+    )
+    monkeypatch.setattr(src.api.users.views, "add_users", mock_add_users)
+
+    client = test_app.test_client()
+    resp = client.post(
+        "/users/bulk",
+        data=json.dumps(
+            [
+                {"username": "shane", "email": "srich@gmail.com"},
+                {"username": "taken", "email": "taken@gmail.com"},
+                {"email": "nameless@gmail.com"},
+                {"username": "again", "email": "srich@gmail.com"},
+            ]
+        ),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 201
+    assert data["created"] == 1
+    assert [result["status"] for result in data["results"]] == [
+        "created",
+        "duplicate",
+        "invalid",
+        "duplicate",
+    ]
+    assert "srich@gmail.com was added!" in data["results"][0]["message"]
+    assert "Sorry. That email already exists." in data["results"][1]["message"]
+    assert added == [{"username": "shane", "email": "srich@gmail.com"}]
+
+
+def test_add_users_bulk_ndjson(test_app, monkeypatch):
+    added = []
+
+    monkeypatch.setattr(
+        src.api.users.views, "get_existing_emails", lambda emails: set()
+    )
+
+    def mock_add_users(users):
+        added.extend(users)
+        return {user["email"] for user in users}
+
+    monkeypatch.setattr(src.api.users.views, "add_users", mock_add_users)
+
+    client = test_app.test_client()
+    resp = client.post(
+        "/users/bulk",
+        data='{"username": "shane", "email": "srich@gmail.com"}\n'
+        '{"username": "maike", "email": "maike@gmail.com"}\n',
+        content_type="application/x-ndjson",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 201
+    assert data["created"] == 2
+    assert [user["email"] for user in added] == ["srich@gmail.com", "maike@gmail.com"]
+
+
+@pytest.mark.parametrize(
+    "payload, content_type, status_code, message",
+    [
+        [json.dumps({"username": "shane"}), "application/json", 400, "JSON array"],
+        ["{not json", "application/x-ndjson", 400, "Invalid NDJSON payload."],
+        [
+            json.dumps([{"username": "x", "email": "x"}] * 3),
+            "application/json",
+            413,
+            "At most 2",
+        ],
+    ],
+)
+def test_add_users_bulk_invalid(
+    test_app, monkeypatch, payload, content_type, status_code, message
+):
+    monkeypatch.setitem(test_app.config, "USERS_BULK_MAX_ITEMS", 2)
+    client = test_app.test_client()
+    resp = client.post("/users/bulk", data=payload, content_type=content_type)
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == status_code
+    assert message in data["message"]
+
+
 def test_single_user(test_app, monkeypatch):
-    def mock_get_user_by_id(user_id):
+    def mock_get_user_by_id(user_id, fields=None):
         return {
             "id": 1,
             "username": "shane",
@@ -102,7 +194,7 @@ def test_single_user(test_app, monkeypatch):
 
 
 def test_single_user_incorrect_id(test_app, monkeypatch):
-    def mock_get_user_by_id(user_id):
+    def mock_get_user_by_id(user_id, fields=None):
         return None
 
     monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
@@ -114,7 +206,7 @@ def test_single_user_incorrect_id(test_app, monkeypatch):
 
 
 def test_all_users(test_app, monkeypatch):
-    def mock_get_all_users():
+    def mock_get_users_page(limit, cursor=None, filters=None, fields=None):
         return [
             {
                 "id": 1,
@@ -130,7 +222,10 @@ def test_all_users(test_app, monkeypatch):
             },
         ]
 
-    monkeypatch.setattr(src.api.users.views, "get_all_users", mock_get_all_users)
+    monkeypatch.setattr(src.api.users.views, "get_users_page", mock_get_users_page)
+    monkeypatch.setattr(
+        src.api.users.views, "get_users_version", mock_get_users_version
+    )
     client = test_app.test_client()
     resp = client.get("/users")
     data = json.loads(resp.data.decode())
@@ -140,29 +235,217 @@ def test_all_users(test_app, monkeypatch):
     assert "srich@gmail" in data[0]["email"]
     assert "maike" in data[1]["username"]
     assert "maike@gmail" in data[1]["email"]
+    assert "Link" not in resp.headers
 
 
-def test_remove_user(test_app, monkeypatch):
-    class AttrDict(dict):
-        def __init__(self, *args, **kwargs):
-            super(AttrDict, self).__init__(*args, **kwargs)
-            self.__dict__ = self
-
-    def mock_get_user_by_id(user_id):
-        d = AttrDict()
-        d.update(
+def test_all_users_unpaginated(test_app, monkeypatch):
+    def mock_get_all_users(filters=None, fields=None):
+        return [
             {
                 "id": 1,
-                "username": "username-to-be-removed",
-                "email": "email-to-be-removed@gmail.com",
-            }
+                "username": "shane",
+                "email": "srich@gmail.com",
+                "created_date": datetime.now(),
+            },
+        ]
+
+    monkeypatch.setattr(src.api.users.views, "get_all_users", mock_get_all_users)
+    monkeypatch.setattr(
+        src.api.users.views, "get_users_version", mock_get_users_version
+    )
+    client = test_app.test_client()
+    resp = client.get("/users?all=true")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert len(data) == 1
+    assert "shane" in data[0]["username"]
+
+
+def test_all_users_next_page(test_app, monkeypatch):
+    created_date = datetime(2021, 6, 1, 12, 30)
+
+    def mock_get_users_page(limit, cursor=None, filters=None, fields=None):
+        return [
+            AttrDict(
+                id=i,
+                username=f"user{i}",
+                email=f"user{i}@gmail.com",
+                created_date=created_date,
+            )
+            for i in range(1, limit + 1)
+        ]
+
+    monkeypatch.setattr(src.api.users.views, "get_users_page", mock_get_users_page)
+    monkeypatch.setattr(
+        src.api.users.views, "get_users_version", mock_get_users_version
+    )
+    client = test_app.test_client()
+    resp = client.get("/users?limit=2")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert len(data) == 2
+    token = resp.headers["X-Next-Cursor"]
+    assert decode_cursor(token) == (created_date, 2)
+    assert f"cursor={token}" in resp.headers["Link"]
+    assert 'rel="next"' in resp.headers["Link"]
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ["limit=0", "limit must be between 1 and"],
+        ["limit=100000", "limit must be between 1 and"],
+        ["cursor=not-a-cursor", "Invalid cursor."],
+    ],
+)
+def test_all_users_invalid_page(test_app, query, message):
+    client = test_app.test_client()
+    resp = client.get(f"/users?{query}")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 400
+    assert message in data["message"]
+
+
+def test_users_by_ids(test_app, monkeypatch):
+    requested = []
+
+    def mock_get_users_by_ids(ids, fields=None):
+        requested.append(ids)
+        return {
+            user_id: AttrDict(
+                id=user_id,
+                username=f"user{user_id}",
+                email=f"user{user_id}@mherman.org",
+                created_date=datetime(2021, 6, 1),
+            )
+            for user_id in ids
+            if user_id != 2
+        }
+
+    monkeypatch.setattr(src.api.users.views, "get_users_by_ids", mock_get_users_by_ids)
+    client = test_app.test_client()
+    resp = client.get("/users?ids=3,2,1,3")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert [item["id"] for item in data] == [3, 1]
+    assert resp.headers["X-Missing-Ids"] == "2"
+    # looked up once each, in one call
+    assert requested == [[3, 2, 1]]
+
+
+@pytest.mark.parametrize(
+    "query, message",
+    [
+        ["ids=1,two", "Input payload validation failed"],
+        ["ids=", "Input payload validation failed"],
+        ["ids=1,2,3,4", "At most 3 ids per request."],
+        ["ids=1&limit=2", "ids cannot be combined with paging or filters."],
+        ["ids=1&active=false", "ids cannot be combined with paging or filters."],
+    ],
+)
+def test_users_by_ids_invalid(test_app, monkeypatch, query, message):
+    monkeypatch.setitem(test_app.config, "USERS_BATCH_MAX_IDS", 3)
+    client = test_app.test_client()
+    resp = client.get(f"/users?{query}")
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 400
+    assert message in data["message"]
+
+
+def test_all_users_ndjson(test_app, monkeypatch):
+    def mock_iter_user_batches(batch_size, filters=None, fields=None):
+        yield [
+            AttrDict(
+                id=1, username="shane", email="srich@gmail.com", created_date=None
+            ),
+            AttrDict(
+                id=2, username="maike", email="maike@gmail.com", created_date=None
+            ),
+        ]
+        yield [
+            AttrDict(id=3, username="ed", email="ed@gmail.com", created_date=None),
+        ]
+
+    monkeypatch.setattr(
+        src.api.users.views, "iter_user_batches", mock_iter_user_batches
+    )
+    monkeypatch.setattr(
+        src.api.users.views, "get_users_version", mock_get_users_version
+    )
+    client = test_app.test_client()
+    resp = client.get("/users", headers={"Accept": "application/x-ndjson"})
+    assert resp.status_code == 200
+    assert resp.is_streamed
+    assert resp.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert [line["username"] for line in lines] == ["shane", "maike", "ed"]
+    assert "srich@gmail.com" in lines[0]["email"]
+
+
+def test_all_users_not_modified(test_app, monkeypatch):
+    def mock_get_users_page(limit, cursor=None, filters=None, fields=None):
+        raise AssertionError("an unchanged collection should not be loaded")
+
+    monkeypatch.setattr(
+        src.api.users.views, "get_users_version", mock_get_users_version
+    )
+    client = test_app.test_client()
+    resp_one = client.get("/users")
+    assert resp_one.status_code == 200
+    assert resp_one.headers["Last-Modified"] == "Tue, 01 Jun 2021 12:30:00 GMT"
+    etag = resp_one.headers["ETag"]
+
+    monkeypatch.setattr(src.api.users.views, "get_users_page", mock_get_users_page)
+    resp_two = client.get("/users", headers={"If-None-Match": etag})
+    assert resp_two.status_code == 304
+    assert resp_two.headers["ETag"] == etag
+    assert resp_two.data == b""
+
+    resp_three = client.get(
+        "/users", headers={"If-Modified-Since": resp_one.headers["Last-Modified"]}
+    )
+    assert resp_three.status_code == 304
+
+
+def test_single_user_not_modified(test_app, monkeypatch):
+    updated_at = datetime(2021, 6, 1, 12, 30)
+
+    def mock_get_user_by_id(user_id, fields=None):
+        return AttrDict(
+            id=1,
+            username="shane",
+            email="srich@gmail.com",
+            created_date=updated_at,
+            updated_at=updated_at,
         )
-        return d
 
-    def mock_delete_user(user_id):
-        return True
+    def mock_get_user_updated_at(user_id):
+        return updated_at
 
     monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    monkeypatch.setattr(
+        src.api.users.views, "get_user_updated_at", mock_get_user_updated_at
+    )
+    client = test_app.test_client()
+    resp_one = client.get("/users/1")
+    assert resp_one.status_code == 200
+    etag = resp_one.headers["ETag"]
+
+    resp_two = client.get("/users/1", headers={"If-None-Match": etag})
+    assert resp_two.status_code == 304
+    resp_three = client.get("/users/1", headers={"If-None-Match": '"stale"'})
+    assert resp_three.status_code == 200
+
+
+def test_cursor_round_trip():
+    created_date = datetime(2021, 6, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_date, 42)) == (created_date, 42)
+
+
+def test_remove_user(test_app, monkeypatch):
+    def mock_delete_user(user_id):
+        return "email-to-be-removed@gmail.com"
+
     monkeypatch.setattr(src.api.users.views, "delete_user", mock_delete_user)
     client = test_app.test_client()
     resp = client.delete("users/1")
@@ -172,10 +455,10 @@ def test_remove_user(test_app, monkeypatch):
 
 
 def test_remove_user_incorrect_id(test_app, monkeypatch):
-    def mock_get_user_by_id(user_id):
+    def mock_delete_user(user_id):
         return None
 
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    monkeypatch.setattr(src.api.users.views, "delete_user", mock_delete_user)
     client = test_app.test_client()
     resp = client.delete("users/999")
     data = json.loads(resp.data.decode())
@@ -189,21 +472,15 @@ def test_update_user(test_app, monkeypatch):
             super(AttrDict, self).__init__(*args, **kwargs)
             self.__dict__ = self
 
-    def mock_get_user_by_id(user_id):
+    def mock_get_user_by_id(user_id, fields=None):
         d = AttrDict()
         d.update({"id": 1, "username": "me", "email": "me@testdriven.io"})
         return d
 
-    def mock_update_user(user, username, email):
-        return True
-
-    def mock_get_user_by_email(email):
-        return None
+    def mock_update_user(user_id, **values):
+        return {"id": user_id, **values}
 
     monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
     monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
     client = test_app.test_client()
     resp_one = client.put(
@@ -237,10 +514,10 @@ def test_update_user(test_app, monkeypatch):
 def test_update_user_invalid(
     test_app, monkeypatch, user_id, payload, status_code, message
 ):
-    def mock_get_user_by_id(user_id):
+    def mock_update_user(user_id, **values):
         return None
 
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
+    monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
     client = test_app.test_client()
     resp = client.put(
         f"/users/{user_id}",
@@ -253,26 +530,9 @@ def test_update_user_invalid(
 
 
 def test_update_user_duplicate_email(test_app, monkeypatch):
-    class AttrDict(dict):
-        def __init__(self, *args, **kwargs):
-            super(AttrDict, self).__init__(*args, **kwargs)
-            self.__dict__ = self
+    def mock_update_user(user_id, **values):
+        raise EmailAlreadyExists(values["email"])
 
-    def mock_get_user_by_id(user_id):
-        d = AttrDict()
-        d.update({"id": 1, "username": "me", "email": "me@testdriven.io"})
-        return d
-
-    def mock_update_user(user, username, email):
-        return True
-
-    def mock_get_user_by_email(email):
-        return True
-
-    monkeypatch.setattr(src.api.users.views, "get_user_by_id", mock_get_user_by_id)
-    monkeypatch.setattr(
-        src.api.users.views, "get_user_by_email", mock_get_user_by_email
-    )
     monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
     client = test_app.test_client()
     resp = client.put(
@@ -283,3 +543,40 @@ def test_update_user_duplicate_email(test_app, monkeypatch):
     data = json.loads(resp.data.decode())
     assert resp.status_code == 400
     assert "Sorry. That email already exists." in data["message"]
+
+
+def test_patch_user(test_app, monkeypatch):
+    updates = []
+
+    def mock_update_user(user_id, **values):
+        updates.append(values)
+        return {"id": user_id, "username": "me", **values}
+
+    monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
+    client = test_app.test_client()
+    resp = client.patch(
+        "/users/1",
+        data=json.dumps({"email": "new@testdriven.io"}),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 200
+    assert "1 was updated!" in data["message"]
+    # only the fields sent are written
+    assert updates == [{"email": "new@testdriven.io"}]
+
+
+def test_patch_user_incorrect_id(test_app, monkeypatch):
+    def mock_update_user(user_id, **values):
+        return None
+
+    monkeypatch.setattr(src.api.users.views, "update_user", mock_update_user)
+    client = test_app.test_client()
+    resp = client.patch(
+        "/users/999",
+        data=json.dumps({"username": "me"}),
+        content_type="application/json",
+    )
+    data = json.loads(resp.data.decode())
+    assert resp.status_code == 404
+    assert "User 999 does not exist" in data["message"]
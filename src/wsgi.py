@@ -0,0 +1,35 @@
+# src/wsgi.py
+
+# WSGI entry point for production servers: gunicorn src.wsgi:app
+#
+# Unlike manage.py it does not load the CLI, and everything that can be done
+# once is done here, so that with gunicorn --preload the workers fork from a
+# fully initialised app and share its memory copy-on-write.
+
+import gc
+
+from src import create_app, db
+from src.database import pool_stats
+
+app = create_app()
+
+with app.app_context():
+    # creates the engine and loads the DB driver without connecting; the
+    # connection pool starts empty in every worker
+    db.engine
+
+# keep the objects created so far out of garbage collection, which would
+# otherwise write to (and so copy) every shared page in each worker
+gc.freeze()
+
+
+def reset_after_fork():
+    """Gives a forked worker its own connection pools. Called by the gunicorn
+    post_fork hook in src/gunicorn_conf.py."""
+    with app.app_context():
+        # close=False leaves any connection the parent holds to the parent
+        db.engine.dispose(close=False)
+        router = app.extensions.get("replica_router")
+        for engine in router.engines if router else ():
+            engine.dispose(close=False)
+    pool_stats.reset()